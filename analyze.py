@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Render cost analysis for compile.py
+
+Scores each rule of a compiled stylesheet by an estimate of what it costs
+the browser to match and paint, so the rules slowing Franz/Ferdi down on
+low-end machines can be found:
+
+- selector matching, browsers match selectors right to left so descendant
+  and sibling combinators, attribute substring matches and keys without a
+  class or id cost more,
+- paint heavy properties, filters (blurs the most), backdrop filters,
+  layered box and text shadows, masks, blend modes...
+- transitions and animations of properties other than transform and
+  opacity, which can not run on the compositor. The @keyframes of the
+  animations are looked up for the properties they animate.
+
+Paint costs count once per selector of the rule as each may match other
+elements. The scores are estimates to rank rules by, not timings. Rules
+are traced back to the line and section of the .styl source they come
+from through the line comments of a compile with line numbers. """
+
+
+import re
+import bisect
+
+import cssdelta
+import cssopt
+import prune
+
+
+# the cost of each selector feature
+COMBINATOR_COSTS = {" ": 2, ">": 1, "+": 1, "~": 3}
+ATTRIBUTE_COST = 2
+ATTRIBUTE_SUBSTRING_COST = 4
+PSEUDO_COSTS = {"not": 2, "nth-child": 2, "nth-of-type": 2, "nth-last-child": 2, "hover": 1, "has": 10}
+BROAD_KEY_COST = 4
+UNIVERSAL_KEY_COST = 8
+
+# the cost of each filter function, other functions cost DEFAULT_FILTER_COST
+FILTER_COSTS = {"blur": 25, "drop-shadow": 15}
+DEFAULT_FILTER_COST = 6
+IDENTITY_FILTER_COST = 1
+BACKDROP_FILTER_COST = 20
+# the cost of each shadow layer, plus a point per BLUR_STEP pixels of blur
+SHADOW_LAYER_COSTS = {"box-shadow": 6, "text-shadow": 4}
+BLUR_STEP = 4
+PAINT_COSTS = {"mix-blend-mode": 15, "clip-path": 8, "mask": 6, "mask-image": 6, "border-image": 4,
+               "background-attachment": 10}
+
+# the cost of animating a property of each kind, by transitions or animations
+ANIMATION_COSTS = {"composited": 1, "paint": 8, "layout": 15}
+TRANSITION_ALL_COST = 10
+INFINITE_FACTOR = 3
+
+COMPOSITED_PROPERTIES = ("transform", "opacity")
+
+layout_property_re = re.compile(
+    r"(width|height|min-|max-|margin|padding|top|left|right|bottom|inset|font|line-height|border(-\w+)?-width|"
+    r"border$|display|position|flex|grid|float|letter-spacing|word-spacing|text-indent|vertical-align)")
+line_re = re.compile(r"/\*\s*line (\d+)\s*:[^*]*\*/")
+combinator_re = re.compile(r"\s*([>+~])\s*|\s+")
+attribute_re = re.compile(r"\[\s*[-\w|]+\s*([*^$~|]?)=?")
+pseudo_re = re.compile(r"::?([-\w]+)")
+class_or_id_re = re.compile(r"[.#]")
+filter_re = re.compile(r"([-\w]+)\(([^)]*)\)")
+zero_re = re.compile(r"[-+]?0*\.?0+(?:px|deg|%)?")
+keyframes_re = re.compile(r"@(?:-\w+-)?keyframes\s+([-\w]+)")
+number_re = re.compile(r"(?<![-\w.#])-?(\d*\.?\d+)(?:px)?(?![-\w.%])")
+compact_re = re.compile(r"\s*([>+~,:()])\s*")
+time_re = re.compile(r"-?[\d.]+m?s")
+timing_words = ("ease", "ease-in", "ease-out", "ease-in-out", "linear", "step-start", "step-end", "infinite",
+                "alternate", "alternate-reverse", "reverse", "normal", "forwards", "backwards", "both", "none",
+                "running", "paused", "initial", "inherit", "!important")
+
+
+def compactKey(text) -> str:
+    """ Gets a key of a given selector or at-rule prelude that is the same minified or not. """
+
+    return compact_re.sub(r"\1", cssdelta.normalKey(text))
+
+
+def propertyKind(prop) -> str:
+    """ Gets the kind of a given property when animated, 'composited', 'paint' or 'layout'. """
+
+    prop = cssdelta.vendor_re.sub("", prop, 1)
+    if prop in COMPOSITED_PROPERTIES:
+        return "composited"
+    return "layout" if layout_property_re.match(prop) else "paint"
+
+
+def splitTopLevel(value) -> list:
+    """ Splits a given value on its commas outside of parentheses. """
+
+    items = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(value):
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "," and depth == 0:
+            items.append(value[start:i])
+            start = i + 1
+    items.append(value[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def selectorCost(selector) -> int:
+    """ Gets the matching cost of a given selector. """
+
+    # without attribute selectors and functional pseudo class arguments
+    stripped = cssdelta.normalKey(prune.stripNested(selector))
+    cost = sum(COMBINATOR_COSTS[c or " "] for c in combinator_re.findall(stripped))
+    cost += sum(ATTRIBUTE_SUBSTRING_COST if operator else ATTRIBUTE_COST for operator in attribute_re.findall(selector))
+    cost += sum(PSEUDO_COSTS.get(pseudo.lower(), 0) for pseudo in pseudo_re.findall(stripped))
+
+    key = combinator_re.split(stripped)[-1] or ""
+    if key.startswith("*") and not class_or_id_re.search(key):
+        cost += UNIVERSAL_KEY_COST
+    elif not class_or_id_re.search(key):
+        cost += BROAD_KEY_COST
+    return cost
+
+
+def shadowCost(prop, value) -> int:
+    """ Gets the paint cost of a box-shadow or text-shadow value. """
+
+    cost = 0
+    for layer in splitTopLevel(value):
+        if layer == "none":
+            continue
+        lengths = [float(n) for n in number_re.findall(re.sub(r"\([^)]*\)", "", layer))]
+        # offset x, offset y, blur, spread
+        blur = lengths[2] if len(lengths) > 2 else 0
+        cost += SHADOW_LAYER_COSTS[prop] + int(blur // BLUR_STEP)
+    return cost
+
+
+def filterCost(value) -> int:
+    """ Gets the paint cost of a filter value. Functions of zero amounts such as blur(0) cost IDENTITY_FILTER_COST. """
+
+    cost = 0
+    for name, args in filter_re.findall(value):
+        if zero_re.fullmatch(args.strip()):
+            cost += IDENTITY_FILTER_COST
+        else:
+            cost += FILTER_COSTS.get(name.lower(), DEFAULT_FILTER_COST)
+    return cost
+
+
+def animatedProperties(value) -> list:
+    """ Gets the properties transitioned by a transition or transition-property value, 'all' when it names none. """
+
+    props = []
+    for item in splitTopLevel(value):
+        names = [w for w in item.split() if not time_re.fullmatch(w) and w not in timing_words and "(" not in w]
+        props.append(names[0] if names else "all")
+    return props
+
+
+def keyframeProperties(text) -> set:
+    """ Gets the properties animated by the given @keyframes rule text. """
+
+    props = set()
+    start = text.find("{")
+    for rule in cssopt.parseItems(text[start + 1:text.rfind("}")]):
+        if isinstance(rule, cssopt.StyleRule):
+            props.update(d.prop for d in rule.declarations)
+    return props
+
+
+class RuleCost:
+    """
+    Used to hold the estimated render cost of a rule.
+
+    Parameters
+    ----------
+    rule : cssopt.StyleRule
+        The rule.
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.selector = ", ".join(rule.selectorKey)
+        self.score = 0
+        # description -> cost
+        self.reasons = {}
+        self.line = None
+        self.section = None
+
+    def add(self, reason, cost):
+        if cost > 0:
+            self.score += cost
+            self.reasons[reason] = self.reasons.get(reason, 0) + cost
+
+    def describe(self, limit=3) -> str:
+        """ Gets the main reasons of the score. """
+
+        reasons = sorted(self.reasons.items(), key=lambda item: -item[1])
+        return ", ".join(reason + " " + str(cost) for reason, cost in reasons[:limit])
+
+
+class CostAnalyzer:
+    """
+    Used to estimate the render cost of the rules of compiled stylesheets, see the module's description.
+
+    Parameters
+    ----------
+    sections : list of (int, str)
+        The (line, title) of the sections of the source, see styleSections. optional.
+    source_lines : dict
+        (context, selector) -> the source line of the rule, see sourceLines. optional.
+    """
+
+    def __init__(self, sections=(), source_lines=None):
+        self.sections = sorted(sections)
+        self.section_lines = [line for line, _ in self.sections]
+        self.source_lines = source_lines or {}
+        self.costs = []
+
+    def analyze(self, css) -> list:
+        """ Scores the rules of a given stylesheet.
+
+        Returns:
+        -----------
+        Returns the list of RuleCost of the rules, worst first. The list is also kept in costs."""
+
+        items = cssopt.parseItems(css)
+        keyframes = {}
+        for item in items:
+            if not isinstance(item, cssopt.StyleRule) and item.kind == "at-rule":
+                match = keyframes_re.match(cssdelta.normalKey(item.text))
+                if match:
+                    keyframes.setdefault(match.group(1), set()).update(keyframeProperties(item.text))
+
+        self.costs = []
+        for item in items:
+            if isinstance(item, cssopt.StyleRule) and item.declarations:
+                self.costs.append(self.ruleCost(item, keyframes))
+        self.costs.sort(key=lambda cost: -cost.score)
+        return self.costs
+
+    def ruleCost(self, rule, keyframes) -> RuleCost:
+        """ Scores a given rule given the properties animated by each @keyframes name. """
+
+        cost = RuleCost(rule)
+        cost.add("selectors", sum(selectorCost(selector) for selector in rule.selectorKey))
+
+        paint = RuleCost(rule)
+        for declaration in rule.declarations:
+            prop = cssdelta.vendor_re.sub("", declaration.prop, 1)
+            value = declaration.value
+            if prop == "filter":
+                paint.add("filter", filterCost(value))
+            elif prop == "backdrop-filter":
+                paint.add("backdrop-filter", BACKDROP_FILTER_COST + filterCost(value))
+            elif prop in SHADOW_LAYER_COSTS:
+                paint.add(prop, shadowCost(prop, value))
+            elif prop in PAINT_COSTS and value.lower() not in ("none", "normal", "scroll"):
+                paint.add(prop, PAINT_COSTS[prop])
+
+        # every selector may paint other elements
+        for reason, value in paint.reasons.items():
+            cost.add(reason, value * len(rule.selectors))
+
+        for declaration in rule.declarations:
+            prop = cssdelta.vendor_re.sub("", declaration.prop, 1)
+            if prop in ("transition", "transition-property"):
+                for animated in animatedProperties(declaration.value):
+                    if animated == "all":
+                        cost.add("transition of all properties", TRANSITION_ALL_COST)
+                    else:
+                        kind = propertyKind(animated)
+                        cost.add("transition of " + kind + " properties", ANIMATION_COSTS[kind])
+            elif prop in ("animation", "animation-name"):
+                factor = INFINITE_FACTOR if "infinite" in declaration.value.split() else 1
+                for item in splitTopLevel(declaration.value):
+                    for name in (w for w in item.split() if w in keyframes):
+                        for animated in keyframes[name]:
+                            kind = propertyKind(animated)
+                            cost.add("animation of " + kind + " properties", ANIMATION_COSTS[kind] * factor)
+
+        context = tuple(compactKey(c) for c in rule.context)
+        for selector in rule.selectorKey:
+            line = self.source_lines.get((context, compactKey(selector)))
+            if line is not None:
+                cost.line = line
+                break
+        cost.section = self.sectionOf(cost.line)
+        return cost
+
+    def sectionOf(self, line) -> str:
+        """ Gets the title of the section of a given source line. """
+
+        if line is None or not self.sections:
+            return "unknown"
+        i = bisect.bisect_right(self.section_lines, line) - 1
+        return self.sections[i][1] if i >= 0 else "start"
+
+    def sectionScores(self) -> list:
+        """ Gets the (section, score, rule count) of the sections of the last analyze, worst first. """
+
+        scores = {}
+        for cost in self.costs:
+            score, count = scores.get(cost.section, (0, 0))
+            scores[cost.section] = (score + cost.score, count + 1)
+        return sorted(((section, score, count) for section, (score, count) in scores.items()), key=lambda s: -s[1])
+
+    def report(self, limit=None) -> str:
+        """ Gets the sections and up to limit rules of the last analyze, worst first. """
+
+        total = sum(cost.score for cost in self.costs)
+        lines = ["{:,} rules, total estimated cost {:,}.".format(len(self.costs), total), "",
+                 "Sections:", "{:>8} {:>6} {:>6}  {}".format("cost", "share", "rules", "section")]
+        for section, score, count in self.sectionScores():
+            lines.append("{:>8,} {:>5.1f}% {:>6}  {}".format(score, score * 100 / max(total, 1), count, section))
+
+        lines += ["", "Rules:", "{:>8} {:>6}  {}".format("cost", "line", "selector / reasons")]
+        for cost in self.costs[:limit]:
+            selector = cost.selector if len(cost.selector) <= 100 else cost.selector[:97] + "..."
+            lines.append("{:>8,} {:>6}  {}".format(cost.score, cost.line or "?", selector))
+            lines.append("{:>16}{} [{}]".format("", cost.describe(), cost.section))
+        return "\n".join(lines) + "\n"
+
+
+def sourceLines(css, line_map=None) -> dict:
+    """ Maps the rules of a given stylesheet compiled with line numbers to their source lines.
+
+    Parameters:
+    -----------
+    css : str
+        The stylesheet, each rule preceded by a '/* line N : file */' comment.
+    line_map : list
+        The source line of each line of the compiled source, when it was generated from another one. optional.
+
+    Returns:
+    -----------
+    Returns a dict of (context, selector) -> line, keyed by compactKey. The first rule of a selector counts."""
+
+    lines = {}
+    for item in cssopt.parseItems(css):
+        if not isinstance(item, cssopt.StyleRule):
+            continue
+        match = line_re.search(item.prefix)
+        if match is None:
+            continue
+        line = int(match.group(1))
+        if line_map is not None:
+            line = line_map[line - 1] if 0 < line <= len(line_map) else None
+        context = tuple(compactKey(c) for c in item.context)
+        for selector in item.selectorKey:
+            lines.setdefault((context, compactKey(selector)), line)
+    return lines
+
+
+def styleSections(lines) -> list:
+    """ Finds the sections of a given stylus source: its banner comments ('/* ===... *   Title ...') and
+    the one line comments indented as the banners are, e.g. '/* service messages */'.
+
+    Returns:
+    -----------
+    Returns a list of (line, title) tuples, titles of one line comments following their banner's
+    (e.g. 'Style starts here > service messages')."""
+
+    sections = []
+    banner = None
+    indent = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("/*") and "=" in stripped and stripped.strip("/* =") == "" and i + 1 < len(lines):
+            banner = lines[i + 1].strip().strip("* ").strip()
+            indent = len(line) - len(line.lstrip())
+            sections.append((i + 1, banner))
+        elif indent is not None and len(line) - len(line.lstrip()) == indent and stripped.startswith("/*") and \
+                stripped.endswith("*/") and "=" not in stripped:
+            sections.append((i + 1, banner + " > " + stripped[2:-2].strip()))
+    return sections
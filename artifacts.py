@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Precompressed artifacts for compile.py
+
+Writes a gzip and an xz copy of a compiled CSS file next to it, at maximum
+compression and without timestamps or file names in their headers so the
+same CSS always gives the same bytes, and lists the sizes and SHA-256 hashes
+of the files in a JSON manifest so servers can pick and verify them. """
+
+
+import os
+import gzip
+import lzma
+import json
+import hashlib
+
+import sync
+
+
+def gzipBytes(data) -> bytes:
+    """ Compresses the given bytes to gzip at level 9 with a zero mtime and no file name. """
+
+    return gzip.compress(data, 9, mtime=0)
+
+
+def xzBytes(data) -> bytes:
+    """ Compresses the given bytes to xz at preset 9 extreme. """
+
+    return lzma.compress(data, lzma.FORMAT_XZ, lzma.CHECK_CRC64, 9 | lzma.PRESET_EXTREME)
+
+
+# the suffix, content encoding and compress function of each artifact
+COMPRESSORS = (
+    (".gz", "gzip", gzipBytes),
+    (".xz", "xz", xzBytes),
+)
+
+
+def fileEntry(data, encoding=None) -> dict:
+    """ Gets the manifest entry of a file of given content. """
+
+    entry = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+    if encoding is not None:
+        entry["encoding"] = encoding
+    return entry
+
+
+def loadManifest(manifest_file) -> dict:
+    """ Loads a given manifest, an empty one if it does not exist or can not be read. """
+
+    try:
+        with open(manifest_file, 'r') as read_obj:
+            manifest = json.load(read_obj)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def writeBytes(out_file, data) -> bool:
+    """ Writes the given bytes to a file atomically, unless it already has them.
+
+    Returns:
+    -----------
+    Returns True if the file was written False if it did not change."""
+
+    if os.path.isfile(out_file) and os.path.getsize(out_file) == len(data):
+        with open(out_file, 'rb') as read_obj:
+            if read_obj.read() == data:
+                return False
+    sync.replaceFile(out_file, lambda write_obj: write_obj.write(data), True)
+    return True
+
+
+def upToDate(manifest, directory, name, data) -> bool:
+    """ Whether the manifest lists a given CSS of given content and its artifacts exist with their listed sizes. """
+
+    if manifest.get(name) != fileEntry(data):
+        return False
+    for suffix, _, _ in COMPRESSORS:
+        entry = manifest.get(name + suffix)
+        path = os.path.join(directory, name + suffix)
+        if entry is None or not os.path.isfile(path) or os.path.getsize(path) != entry.get("size"):
+            return False
+    return True
+
+
+def compressArtifacts(css_file, manifest_file):
+    """ Writes the compressed copies of a given CSS file next to it, without updating the manifest,
+    so the artifacts of several files can be written in parallel and listed at once, see updateManifest.
+    Nothing is compressed when the manifest already lists the current CSS and its artifacts.
+
+    Parameters:
+    -----------
+    css_file : str
+        The CSS file, in the directory of the manifest.
+    manifest_file : str
+        The JSON manifest.
+
+    Returns:
+    -----------
+    Returns an (entries, written) tuple, entries being the manifest entries of the CSS and its artifacts and
+    written the list of (name, size) tuples of the written artifacts, both empty if they were up to date."""
+
+    directory = os.path.dirname(manifest_file)
+    name = os.path.relpath(css_file, directory or ".").replace(os.sep, "/")
+    with open(css_file, 'rb') as read_obj:
+        data = read_obj.read()
+
+    if upToDate(loadManifest(manifest_file), directory, name, data):
+        return {}, []
+
+    entries = {name: fileEntry(data)}
+    written = []
+    for suffix, encoding, compress in COMPRESSORS:
+        compressed = compress(data)
+        writeBytes(os.path.join(directory, name + suffix), compressed)
+        entries[name + suffix] = fileEntry(compressed, encoding)
+        written.append((name + suffix, len(compressed)))
+    return entries, written
+
+
+def updateManifest(manifest_file, entries) -> bool:
+    """ Adds given entries to a manifest, see compressArtifacts. Entries of other files are kept, unless these files are gone.
+
+    Returns:
+    -----------
+    Returns True if the manifest was written False if it did not change."""
+
+    directory = os.path.dirname(manifest_file)
+    manifest = loadManifest(manifest_file)
+    manifest.update(entries)
+    manifest = {k: v for k, v in sorted(manifest.items()) if os.path.isfile(os.path.join(directory, k))}
+    text = json.dumps(manifest, indent=2, sort_keys=True) + "\n"
+    return writeBytes(manifest_file, text.encode())
+
+
+def writeArtifacts(css_file, manifest_file):
+    """ Writes the compressed copies of a given CSS file next to it and lists them in a manifest.
+
+    The manifest maps file names, relative to its directory, to their size, SHA-256 hash
+    and content encoding, see compressArtifacts and updateManifest.
+
+    Parameters:
+    -----------
+    css_file : str
+        The CSS file, in the directory of the manifest.
+    manifest_file : str
+        The JSON manifest.
+
+    Returns:
+    -----------
+    Returns a list of (name, size) tuples of the written artifacts, empty if they were up to date."""
+
+    entries, written = compressArtifacts(css_file, manifest_file)
+    if entries:
+        updateManifest(manifest_file, entries)
+    return written
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" compile.py stage benchmark
+
+Times each stage of compile.py (extractVariables, constructStylLines,
+cleanLeftoverComments, generateVersionString, checkStylCss) and the full
+build against Dark-Telegram.user.styl and synthetic user styles scaled 10
+and 100 times (more @var lines, more rule blocks and more data URIs).
+
+The results can be saved as a JSON baseline, later runs are compared with
+it and fail when a stage got slower than the threshold. A run also fails
+when the time per line of a stage grows with the input size, i.e. when a
+stage is not linear. See help_msg for the commands. """
+
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+import compile
+import svgmin
+
+
+# the time per line of the biggest input may be at most this many times the smallest one's,
+# a quadratic stage gets about as many times slower per line as the input got bigger
+MAX_SLOWDOWN = 3.0
+
+# a stage is run again until it took this many seconds in total, or ran the maximal number of times
+MIN_TOTAL_TIME = 0.5
+
+# a stage is not reported as slower than the baseline by less than this many seconds, as timer noise
+MIN_REGRESSION = 0.001
+
+# the number of unique data URIs added by each copy of the rule blocks
+URIS_PER_COPY = 8
+
+# the benchmarked stages, see stages
+STAGE_NAMES = ("extractVariables", "constructStylLines", "cleanLeftoverComments", "generateVersionString",
+               "checkStylCss", "build")
+
+help_msg = "\n\nBenchmarking the stages of compile.py\n" + \
+    "=====================================\n\n" + \
+    "Description:\n" + \
+    "   Times each stage of compile.py against Dark-Telegram.user.styl scaled up, compares the times with a\n" + \
+    "   baseline and checks each stage is linear. Exits with 1 when a stage regressed.\n\n" + \
+    "Usage:\n" + \
+    "   python benchmarks/compile_bench.py [command(s)(optional)]\n\n" + \
+    "Commands:\n" + \
+    "   --stages, -st, /st [list]       - The comma separated stages to run. (default is all of them)\n" + \
+    "                                     " + ", ".join(STAGE_NAMES[:3]) + ",\n" + \
+    "                                     " + ", ".join(STAGE_NAMES[3:]) + "\n" + \
+    "   --scales, -x, /x [list]         - The comma separated scales to run. (default is 1,10,100)\n" + \
+    "   --iterations, -i, /i [count]    - The maximal number of runs of each stage, the best one counts.\n" + \
+    "                                     (default is 5)\n" + \
+    "   --save, -s, /s                  - Will save the results to the baseline, keeping the stages not run.\n" + \
+    "   --baseline, -b, /b [file]       - The baseline JSON file. (default is benchmarks/compile_baseline.json)\n" + \
+    "   --threshold, -t, /t [fraction]  - How much slower than the baseline a stage may get. (default is 0.25)\n" + \
+    "   --help, -h, /h                  - Will display this message.\n"
+
+
+def getArgValue(names, default=None):
+    """ Gets the argument following the first of the given argument names or default if none was given. """
+
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg in names:
+            return sys.argv[i + 1]
+    return default
+
+
+def sourceParts(in_file):
+    """ Splits a given user style into the lines before its variables, its variable lines,
+    the lines up to its rule blocks, its rule blocks and the lines closing them. """
+
+    with open(in_file, 'r') as read_obj:
+        lines = read_obj.readlines()
+    first_var = next(i for i, line in enumerate(lines) if line.lstrip().startswith("@var"))
+    end = next(i for i, line in enumerate(lines) if "*/" in line and "/UserStyle" in line)
+    body = next(i for i, line in enumerate(lines) if line.startswith("@-moz-document domain(")) + 1
+    close = max(i for i, line in enumerate(lines) if line.startswith("}"))
+    return lines[:first_var], lines[first_var:end], lines[end:body], lines[body:close], lines[close:]
+
+
+def uriBlock(copy) -> list:
+    """ Generates a rule block using unique SVG data URIs. """
+
+    lines = ["    .bench-" + str(copy) + " {\n"]
+    for i in range(URIS_PER_COPY):
+        svg = "%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3E%3Ccircle cx='8' cy='8' r='" + \
+              str(copy) + "." + str(i) + "'/%3E%3C/svg%3E"
+        lines.append("        .icon-" + str(i) + " {\n")
+        lines.append("            background-image url(\"data:image/svg+xml," + svg + "\")\n")
+        lines.append("        }\n")
+    lines.append("    }\n")
+    return lines
+
+
+def syntheticSource(parts, scale) -> list:
+    """ Generates the lines of a user style whose variables and rule blocks are repeated scale times. """
+
+    head, variables, root, body, tail = parts
+    lines = list(head)
+    for i in range(scale):
+        for line in variables:
+            if i > 0 and line.lstrip().startswith("@var"):
+                # renaming the variable: @var type name 'label' ...
+                words = line.split(None, 3)
+                line = line.replace(" " + words[2] + " ", " " + words[2] + "_" + str(i) + " ", 1)
+            lines.append(line)
+    lines.extend(root)
+    for i in range(scale):
+        lines.extend(body)
+        if i > 0:
+            lines.extend(uriBlock(i))
+    return lines + tail
+
+
+def timeStage(stage, repeats) -> float:
+    """ Gets the best time in seconds of running a given stage, see MIN_TOTAL_TIME. """
+
+    best = None
+    total = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stage()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        if total >= MIN_TOTAL_TIME:
+            break
+    return best
+
+
+def stages(lines) -> dict:
+    """ Gets the benchmarked stages of a given user style, by name. Each stage is a callable running it
+    within the current directory, which holds the user style twins. """
+
+    compile.writeLines(compile.user_styl_file, lines)
+    compile.writeLines(compile.user_css_file, lines)
+    user_style_block = compile.extractVariables(iter(lines))
+    source = "".join(compile.constructStylLines(iter(lines), user_style_block))
+    css_lines = compile.compileStyl(source).splitlines(True)
+
+    def build():
+        context = compile.BuildContext(compile.user_styl_file, svg_minifier=svgmin.SvgMinifier())
+        if not compile.build(context):
+            raise RuntimeError("the build failed")
+
+    return {
+        "extractVariables": lambda: compile.extractVariables(iter(lines)),
+        "constructStylLines": lambda: "".join(compile.constructStylLines(iter(lines), user_style_block)),
+        "cleanLeftoverComments": lambda: "".join(compile.cleanLeftoverComments(css_lines)),
+        "generateVersionString": lambda: compile.generateVersionString(compile.user_styl_file),
+        "checkStylCss": lambda: compile.checkStylCss(),
+        "build": build,
+    }
+
+
+def runBenchmarks(scales, repeats, names=STAGE_NAMES) -> dict:
+    """ Runs the stages of given names at every given scale.
+
+    Returns:
+    -----------
+    Returns a dict of stage name -> dict of scale (as str) -> {"seconds", "lines"}."""
+
+    parts = sourceParts(os.path.join(root_dir, compile.user_styl_file))
+    results = {}
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="compile_bench.")
+    try:
+        os.chdir(work_dir)
+        for scale in scales:
+            lines = syntheticSource(parts, scale)
+            # the stages report their progress, which is not measured
+            with contextlib.redirect_stdout(io.StringIO()):
+                scale_stages = stages(lines)
+            for name in names:
+                stage = scale_stages[name]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds = timeStage(stage, repeats)
+                results.setdefault(name, {})[str(scale)] = {"seconds": seconds, "lines": len(lines)}
+                print("{:>22} {:>4}x {:>9,} lines {:>10.2f}ms {:>7.3f}us/line".format(
+                    name, scale, len(lines), seconds * 1000, seconds * 1e6 / len(lines)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def checkLinear(results) -> list:
+    """ Gets the stages whose time per line at the biggest scale is over MAX_SLOWDOWN times the smallest one's. """
+
+    failures = []
+    for name, by_scale in results.items():
+        runs = sorted(by_scale.values(), key=lambda r: r["lines"])
+        if len(runs) < 2:
+            continue
+        slowdown = (runs[-1]["seconds"] / runs[-1]["lines"]) / (runs[0]["seconds"] / runs[0]["lines"])
+        if slowdown > MAX_SLOWDOWN:
+            failures.append(name + " is not linear, " + str(round(slowdown, 2)) + "x the time per line")
+    return failures
+
+
+def checkBaseline(results, baseline, threshold) -> list:
+    """ Gets the stages which got slower than the baseline by more than a given fraction. """
+
+    failures = []
+    for name, by_scale in results.items():
+        for scale, result in by_scale.items():
+            base = baseline.get(name, {}).get(scale)
+            if base is None or base["lines"] != result["lines"]:
+                continue
+            change = result["seconds"] / base["seconds"] - 1
+            if change > threshold and result["seconds"] - base["seconds"] >= MIN_REGRESSION:
+                failures.append(name + " at " + scale + "x is " + str(round(change * 100)) + "% slower than the baseline")
+    return failures
+
+
+if __name__ == "__main__":
+    compile.debug = False
+
+    if "--help" in sys.argv or "-h" in sys.argv or "/h" in sys.argv:
+        print(help_msg)
+        sys.exit(0)
+
+    save = "--save" in sys.argv or "-s" in sys.argv or "/s" in sys.argv
+    baseline_file = getArgValue(("--baseline", "-b", "/b"), os.path.join(root_dir, "benchmarks", "compile_baseline.json"))
+    names = getArgValue(("--stages", "-st", "/st"), ",".join(STAGE_NAMES)).split(",")
+    unknown = [name for name in names if name not in STAGE_NAMES]
+    try:
+        threshold = float(getArgValue(("--threshold", "-t", "/t"), 0.25))
+        scales = [int(s) for s in getArgValue(("--scales", "-x", "/x"), "1,10,100").split(",")]
+        # --repeats, -r, /r is the former name of --iterations
+        repeats = int(getArgValue(("--iterations", "-i", "/i", "--repeats", "-r", "/r"), 5))
+    except ValueError as e:
+        unknown = [str(e)]
+    if unknown or not scales or min(scales) < 1 or repeats < 1:
+        print("Invalid arguments" + (": " + ", ".join(unknown) if unknown else "") + ".")
+        print(help_msg)
+        sys.exit(2)
+
+    results = runBenchmarks(scales, repeats, names)
+    failures = checkLinear(results)
+
+    if save:
+        baseline = {}
+        if os.path.isfile(baseline_file):
+            with open(baseline_file, 'r') as read_obj:
+                baseline = json.load(read_obj)
+        for name, by_scale in results.items():
+            baseline.setdefault(name, {}).update(by_scale)
+        with open(baseline_file, 'w') as write_obj:
+            json.dump(baseline, write_obj, indent=4)
+            write_obj.write("\n")
+        print("Saved the baseline to '" + baseline_file + "'.")
+    elif os.path.isfile(baseline_file):
+        with open(baseline_file, 'r') as read_obj:
+            failures += checkBaseline(results, json.load(read_obj), threshold)
+    else:
+        print("No baseline at '" + baseline_file + "', run with --save to create one.")
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("No regressions.")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Full vs incremental rebuild benchmark
+
+Times rebuilding the stylus of Dark-Telegram.user.styl after a change of a
+single UserStyle variable: fully, as compile.py builds without a dependency
+graph (parsing with a warm parse cache, folding and evaluating everything),
+and incrementally, evaluating again only the statements depending on the
+changed variable (see depgraph). Each incremental result is checked against
+the full one, the run fails if they differ.
+
+Usage:
+    python benchmarks/incremental_bench.py [commands(optional)]
+
+Commands:
+    --vars, -v, /v [list]      - The comma separated variables to change. (default is msgb,textc1,accent,enableCompact,tail)
+    --repeats, -r, /r [count]  - The number of runs of each rebuild, the best one counts. (default is 5) """
+
+
+import os
+import sys
+import time
+import itertools
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+import compile
+import stylc
+import depgraph
+from userstyle import Var
+
+
+def getArgValue(names, default=None):
+    """ Gets the argument following the first of the given argument names or default if none was given. """
+
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg in names:
+            return sys.argv[i + 1]
+    return default
+
+
+def changedValue(v) -> str:
+    """ Gets a value of a given variable other than its current one. """
+
+    value = v.value.strip()
+    if v.type_name == "checkbox":
+        return "0" if value == "1" else "1"
+    if v.type_name == "color":
+        return "#123456" if value != "#123456" else "#654321"
+    if v.type_name == "select":
+        return next(o for _, o in v.options if o != value.strip("'\""))
+    if v.type_name in ("range", "number"):
+        number = float(value[:-len(v.unit)] if v.unit and value.endswith(v.unit) else value)
+        return str(int(number) + 1 if number.is_integer() else number + (v.step or 0.01)) + (v.unit or "")
+    raise ValueError("cannot change the " + v.type_name + " variable " + v.var_name)
+
+
+def best(run, repeats):
+    """ Gets the best (seconds, result) of running a given callable a given number of times. """
+
+    result = None
+    seconds = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return seconds, result
+
+
+if __name__ == "__main__":
+    compile.debug = False
+
+    names = getArgValue(("--vars", "-v", "/v"), "msgb,textc1,accent,enableCompact,tail").split(",")
+    repeats = int(getArgValue(("--repeats", "-r", "/r"), 5))
+
+    lines, var_lines = itertools.tee(compile.readLines(os.path.join(root_dir, compile.user_styl_file)))
+    user_style_block = compile.extractVariables(var_lines)
+    body = "".join(compile.constructStylLines(lines))
+    variables = {v.var_name: v for v in user_style_block.body if isinstance(v, Var)}
+    parse_cache = stylc.ParseCache()
+
+    failures = []
+    print("{:>16} {:>10} {:>12} {:>10} {:>12}".format("variable", "full", "incremental", "speedup", "statements"))
+    for name in names:
+        block = compile.overrideVariables(user_style_block, {name: changedValue(variables[name])})
+        head = "".join(compile.userStyleLines(block))
+        values = compile.variableValues(block)
+        base_head = "".join(compile.userStyleLines(user_style_block))
+        base_values = compile.variableValues(user_style_block)
+
+        def full():
+            return stylc.render(head + body, cache=parse_cache)
+
+        compiler = depgraph.IncrementalCompiler(parse_cache=parse_cache)
+
+        def incremental():
+            # going back to the base values first so every run changes the variable
+            compiler.compile(base_head, body, base_values)
+            start = time.perf_counter()
+            css = compiler.compile(head, body, values)
+            incremental.seconds = time.perf_counter() - start
+            return css
+
+        full_seconds, full_css = best(full, repeats)
+        incremental_seconds = None
+        for _ in range(repeats):
+            css = incremental()
+            incremental_seconds = incremental.seconds if incremental_seconds is None else \
+                min(incremental_seconds, incremental.seconds)
+            if css != full_css:
+                failures.append("the incremental rebuild of " + name + " differs from the full one")
+                break
+
+        print("{:>16} {:>8.2f}ms {:>10.2f}ms {:>9.1f}x {:>5} of {:<5}".format(
+            name, full_seconds * 1000, incremental_seconds * 1000, full_seconds / incremental_seconds,
+            compiler.evaluated, compiler.statementCount))
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("Incremental rebuilds match the full ones.")
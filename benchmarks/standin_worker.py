@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Stand-in stylus worker
+
+Speaks the protocol of stylus-worker.js (see stylusworker.py) compiling
+with the built-in compiler, so the persistent worker can be tried and
+timed where Node or stylus are not installed:
+
+    python compile.py -wc "python benchmarks/standin_worker.py"
+
+With --once it rather compiles the source of stdin to stdout and exits,
+as the stylus binary does.
+
+Usage:
+    python benchmarks/standin_worker.py [commands(optional)]
+
+Commands:
+    --once, -o, /o                - Will compile stdin to stdout once, as the stylus binary.
+    --crash-after, -ca, /ca [n]   - Will exit with code 3 when the n-th request arrives, without answering it.
+    --delay, -dl, /dl [ms]        - Will wait before answering each request, as a slower compiler. """
+
+
+import os
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+import stylc
+import stylusworker
+
+
+def getArgValue(names, default=None):
+    """ Gets the argument following the first of the given argument names or default if none was given. """
+
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg in names:
+            return sys.argv[i + 1]
+    return default
+
+
+def render(request) -> dict:
+    """ Compiles the source of a given request into its response. """
+
+    try:
+        css = stylc.render(request["source"], request.get("compress", False), request.get("linenos", False),
+                           request.get("filename", "darkmode.styl"))
+    except stylc.StylusError as e:
+        return {"id": request["id"], "error": str(e)}
+    return {"id": request["id"], "css": css}
+
+
+if __name__ == "__main__":
+    if "--once" in sys.argv or "-o" in sys.argv or "/o" in sys.argv:
+        try:
+            sys.stdout.write(stylc.render(sys.stdin.read(), linenos="--line-numbers" in sys.argv))
+        except stylc.StylusError as e:
+            sys.stderr.write(str(e) + "\n")
+            sys.exit(1)
+        sys.exit(0)
+
+    crash_after = int(getArgValue(("--crash-after", "-ca", "/ca"), 0))
+    delay = float(getArgValue(("--delay", "-dl", "/dl"), 0)) / 1000
+
+    count = 0
+    while True:
+        request = stylusworker.readFrame(sys.stdin.buffer)
+        if request is None:
+            break
+        count += 1
+        if count == crash_after:
+            sys.exit(3)
+        if delay:
+            time.sleep(delay)
+        stylusworker.writeFrame(sys.stdout.buffer, render(request))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" UserStyle parser benchmark
+
+Parses synthetic UserStyle headers made of the variables of
+Dark-Telegram.user.styl repeated 1, 10 and 100 times and checks that the
+time per line stays flat, i.e. that parsing is linear in the header size.
+
+Usage:
+    python benchmarks/userstyle_bench.py [repeats] """
+
+
+import os
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+import userstyle
+
+
+# the time per line of the biggest header may be at most this many times the smallest one's
+MAX_SLOWDOWN = 2.0
+
+
+def headerParts(in_file):
+    """ Splits the UserStyle comment of a given file into its meta lines, its variable lines and the rest of the file. """
+
+    with open(in_file, 'r') as read_obj:
+        lines = read_obj.readlines()
+    start = next(i for i, line in enumerate(lines) if "/*" in line and "UserStyle" in line)
+    end = next(i for i, line in enumerate(lines) if "*/" in line and "/UserStyle" in line)
+    first_var = next(i for i in range(start, end) if lines[i].lstrip().startswith("@var"))
+    return lines[:first_var], lines[first_var:end], lines[end:]
+
+
+def syntheticHeader(parts, scale) -> list:
+    """ Generates the lines of a user style whose variables are repeated scale times under new names. """
+
+    head, variables, tail = parts
+    lines = list(head)
+    for i in range(scale):
+        for line in variables:
+            if line.lstrip().startswith("@var"):
+                # renaming the variable: @var type name 'label' ...
+                words = line.split(None, 3)
+                line = line.replace(" " + words[2] + " ", " " + words[2] + "_" + str(i) + " ", 1)
+            lines.append(line)
+    # the rest of the file is not read past the :root block
+    return lines + tail
+
+
+def timeParse(lines, repeats) -> float:
+    """ Gets the best time in seconds of parsing the given lines repeats times. """
+
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        userstyle.parseUserStyle(iter(lines))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    parts = headerParts(os.path.join(root_dir, "Dark-Telegram.user.styl"))
+
+    results = []
+    for scale in (1, 10, 100):
+        lines = syntheticHeader(parts, scale)
+        header_lines = len(parts[0]) + len(parts[1]) * scale
+        variables = len(userstyle.parseUserStyle(iter(lines)).vars)
+        seconds = timeParse(lines, repeats)
+        per_line = seconds / header_lines
+        results.append(per_line)
+        print("{:>4}x {:>7,} header lines {:>6,} vars {:>9.2f}ms {:>7.2f}us/line".format(
+            scale, header_lines, variables, seconds * 1000, per_line * 1e6))
+
+    slowdown = results[-1] / results[0]
+    print("time per line at 100x is " + str(round(slowdown, 2)) + "x the time per line at 1x")
+    if slowdown > MAX_SLOWDOWN:
+        print("Parsing is not linear.")
+        sys.exit(1)
+    print("Parsing is linear.")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Stylus process per compile vs persistent worker benchmark
+
+Times compiling the stylus of Dark-Telegram.user.styl a number of times by
+starting a compiler process for each compile, as compile.py --stylus runs
+the stylus binary, and by a single persistent worker (see stylusworker),
+one compile at a time and with every compile in flight at once. A worker
+crashing every few requests is then checked to still compile them all.
+
+The stand-in worker (benchmarks/standin_worker.py) is used by default so
+Node and stylus are not needed. The results of the worker are checked
+against the ones of a process per compile, the run fails if they differ.
+
+Usage:
+    python benchmarks/worker_bench.py [commands(optional)]
+
+Commands:
+    --compiles, -n, /n [count]        - The number of compiles of each mode. (default is 10)
+    --worker-command, -wc, /wc [cmd]  - The command starting the worker. (default is the stand-in worker)
+    --once-command, -oc, /oc [cmd]    - The command compiling stdin to stdout once. (default is the stand-in with --once) """
+
+
+import os
+import sys
+import time
+import shlex
+import subprocess
+import itertools
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+import compile
+import stylc
+import stylusworker
+
+
+standin_worker = [sys.executable, os.path.join(root_dir, "benchmarks", "standin_worker.py")]
+
+
+def getArgValue(names, default=None):
+    """ Gets the argument following the first of the given argument names or default if none was given. """
+
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg in names:
+            return sys.argv[i + 1]
+    return default
+
+
+def timed(run):
+    """ Gets the (seconds, result) of running a given callable. """
+
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    compile.debug = False
+
+    count = int(getArgValue(("--compiles", "-n", "/n"), 10))
+    worker_command = getArgValue(("--worker-command", "-wc", "/wc"))
+    worker_command = shlex.split(worker_command) if worker_command else standin_worker
+    once_command = getArgValue(("--once-command", "-oc", "/oc"))
+    once_command = shlex.split(once_command) if once_command else standin_worker + ["--once"]
+
+    lines, var_lines = itertools.tee(compile.readLines(os.path.join(root_dir, compile.user_styl_file)))
+    user_style_block = compile.extractVariables(var_lines)
+    source = "".join(compile.constructStylLines(lines, user_style_block))
+    expected = None
+
+    def once():
+        return [subprocess.run(once_command, input=source.encode(), stdout=subprocess.PIPE, check=True)
+                .stdout.decode() for _ in range(count)]
+
+    def sequential():
+        with stylusworker.StylusWorker(worker_command) as worker:
+            return [worker.compile(source) for _ in range(count)]
+
+    def in_flight():
+        with stylusworker.StylusWorker(worker_command) as worker:
+            futures = [worker.submit(source) for _ in range(count)]
+            return [f.result() for f in futures]
+
+    failures = []
+    results = {}
+    print("{:>22} {:>10} {:>12}".format("mode", "total", "per compile"))
+    for name, run in (("process per compile", once), ("worker, one at a time", sequential),
+                      ("worker, all in flight", in_flight)):
+        try:
+            seconds, css = timed(run)
+        except (stylusworker.WorkerError, subprocess.CalledProcessError) as e:
+            failures.append("'" + name + "' failed: " + str(e))
+            continue
+        results[name] = seconds
+        expected = expected or css[0]
+        if any(c != expected for c in css):
+            failures.append("the CSS of '" + name + "' differs from the one of a process per compile")
+        print("{:>22} {:>8.0f}ms {:>10.1f}ms".format(name, seconds * 1000, seconds * 1000 / count))
+
+    if worker_command == standin_worker:
+        # every third request kills the worker, the requests in flight are sent to the next one
+        expected = stylc.render(source, filename="darkmode.styl")
+        worker = stylusworker.StylusWorker(standin_worker + ["--crash-after", "3"], max_restarts=count)
+        try:
+            futures = [worker.submit(source) for _ in range(count)]
+            css = [f.result() for f in futures]
+            if any(c != expected for c in css):
+                failures.append("the CSS of the crashing worker differs from the built-in compiler's")
+            print("crashing worker compiled " + str(len(css)) + " sources with " + str(worker.started) + " workers")
+        except stylusworker.WorkerError as e:
+            failures.append("the crashing worker failed: " + str(e))
+        finally:
+            worker.close()
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("The worker is {:.1f}x faster than a process per compile.".format(
+        results["process per compile"] / results["worker, one at a time"]))
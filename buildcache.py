@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Build cache for compile.py
+
+A content-addressed cache of compiled CSS. Entries are keyed by a hash
+of everything that affects the output, so a build whose inputs did not
+change can reuse the CSS of a previous build instead of compiling. """
+
+
+import os
+import hashlib
+import tempfile
+
+
+def cacheKey(*parts) -> str:
+    """ Generates a cache key from the given parts.
+
+    Parameters:
+    -----------
+    parts : str or bytes
+        Everything that affects the cached output. The order matters.
+
+    Returns:
+    -----------
+    Returns the hex sha256 digest of the parts."""
+
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        # prefixing each part with its length so parts can't run into each other
+        h.update(str(len(part)).encode() + b":")
+        h.update(part)
+    return h.hexdigest()
+
+
+def fileHash(in_file) -> str:
+    """ Gets the hex sha256 digest of a given file's content. """
+
+    h = hashlib.sha256()
+    with open(in_file, 'rb') as read_obj:
+        for chunk in iter(lambda: read_obj.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildCache:
+    """
+    Used to store compiled CSS, or any other build output, by cache key.
+
+    The least recently used entries are evicted once the cache grows over max_size.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store the entries in. Created when needed. (default '.buildcache')
+    max_size : int
+        The maximal total size of the entries in bytes. (default 16 MB)
+    suffix : str
+        The file name suffix of the entries. (default '.css')
+    """
+
+    def __init__(self, directory=".buildcache", max_size=16 * 1024 * 1024, suffix=".css"):
+        self.directory = directory
+        self.max_size = max_size
+        self.suffix = suffix
+
+    def path(self, key) -> str:
+        """ Gets the path of the entry of a given key. """
+
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key, binary=False):
+        """ Gets the CSS stored for a given key.
+
+        Returns:
+        -----------
+        Returns the CSS as str, or as bytes if binary is True, or None if there is no entry for this key."""
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb' if binary else 'r', newline=None if binary else '') as read_obj:
+                css = read_obj.read()
+        except OSError:
+            return None
+
+        # marking the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return css
+
+    def put(self, key, css):
+        """ Stores the CSS (str or bytes) of a given key and evicts old entries if the cache got too big. """
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb' if isinstance(css, bytes) else 'w',
+                           newline=None if isinstance(css, bytes) else '') as write_obj:
+                write_obj.write(css)
+            os.replace(tmp_file, self.path(key))
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.evict()
+
+    def entries(self) -> list:
+        """ Gets the entries as (last used, size, path) tuples, least recently used first. """
+
+        result = []
+        try:
+            it = os.scandir(self.directory)
+        except OSError:
+            return result
+        with it:
+            for e in it:
+                if e.name.endswith(self.suffix) and e.is_file():
+                    st = e.stat()
+                    result.append((st.st_mtime, st.st_size, e.path))
+        result.sort()
+        return result
+
+    def evict(self) -> int:
+        """ Removes the least recently used entries until the cache fits max_size.
+
+        Returns:
+        -----------
+        Returns the number of removed entries."""
+
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
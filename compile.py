@@ -20,62 +20,17 @@ to be compatible with services like Franz\Ferdi. """
 
 import sys
 import os.path
+import re
+import json
+import copy
 import shutil
 import datetime
-from subprocess import check_output
-class Var:
-    """
-    Used to represent a line of a variable
-
-    Parameters
-    ----------
-    type_name : str
-        The name of the variable type. optional.
-    var_name : str
-        Variable name.
-    comment : str
-        This variable comment. optional
-    value : str
-        This variable value.
-    """
-
-    type_name = None
-    var_name = None
-    comment = None
-    value = None
-
-    def toString(self, is_meta=False, indent_level=0):
-        """ Generate a string based on current variable. 
-        Parameters
-        ----------
-        is_meta : bool
-            Treat this variable as a meta variable and include an assignment operator if not meta. (default False)
-        indent_level : int
-            The level of indentation for this variable.
-        """
-
-        # built the resulting string
-        s = ""
-        if self.var_name is not None:
-            s += self.var_name
-            if self.value is not None:
-                if not is_meta:
-                    s += " ="
-                s += " " + self.value
-                if self.comment is not None:
-                    s += " // " + self.comment
-                    if self.type_name is not None:
-                        s += " (" + self.type_name + ")"
-            else:
-                print("Empty value in " + self.var_name)
+import time
+import itertools
+import functools
+import contextlib
 
-        # build indentation
-        indent = ""
-        if s != "":
-            for i in range(indent_level):
-                indent += "    "
-
-        return indent + s + "\n"
+import stylc
 
 
 class Block:
@@ -94,29 +49,34 @@ class Block:
         The closing string of this block. Usually just a closing curly brace.
     indent_level : int
         The level of indentation for this block. (default 0)
+    verbose : bool
+        Whether to print the added items. (default debug)
 
     """
 
-    header = None
-    meta = []
-    body = []
-    footer = None
-    indent_level = 0
+    def __init__(self, verbose=None):
+        self.header = None
+        self.meta = []
+        self.body = []
+        self.footer = None
+        self.indent_level = 0
+        self.verbose = verbose
 
     def setHeader(self, header: str):
         """ Sets a given str as the current block header. """
         self.header = header.strip()
 
-    def addMeta(self, meta: Var):
+    def addMeta(self, meta):
         """ Adds a given Var to the meta array. """
         self.meta.append(meta)
-        log("Added meta variable " + meta.toString(True))
+        log("Added meta variable " + meta.toString(True), self.verbose)
 
     def addVar(self, v):
         """ Adds a given object to the body array. """
+        from userstyle import Var
         self.body.append(v)
         if isinstance(v, Var):
-            log("Added variable " + v.toString())
+            log("Added variable " + v.toString(), self.verbose)
 
     def setFooter(self, footer: str):
         """ Sets a given str as the current block footer. """
@@ -128,6 +88,7 @@ class Block:
 
     def metaToString(self) -> str:
         """ Generate a string based on current block's meta elements. """
+        from userstyle import Var
         result = ""
         for m in self.meta:
             if isinstance(m, Var) and m.var_name.find("preprocessor") < 0:
@@ -138,6 +99,7 @@ class Block:
 
     def bodyToString(self) -> str:
         """ Generate a string based on current block's body elements. """
+        from userstyle import Var
         result = ""
         for v in self.body:
             if isinstance(v, Var):
@@ -164,11 +126,88 @@ class Block:
         return result + "\n"
 
 
+class BuildContext:
+    """
+    Used to hold the state of the builds of a user style file.
+    A context is reused between the builds of watch mode so unchanged parts are not parsed again.
+
+    Parameters:
+    -----------
+    in_file : str
+        The user style file to build.
+    compress : bool
+        Whether to minify the resulted CSS. (default False)
+    use_stylus : bool
+        Whether to use the stylus binary rather than the built-in compiler. (default False)
+    cache : buildcache.BuildCache
+        The cache to reuse the CSS of builds with the same inputs from. optional.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs of the CSS and of the sprite. (default one without a cache)
+    sprite : bool
+        Whether to also build the icons sprite of Resources. (default False)
+    pruner : prune.Pruner
+        The pruner dropping the selectors that can not match the DOM snapshots. optional.
+    splitter : critical.CssSplitter
+        The splitter of the CSS into critical and deferred chunks. optional.
+    graph_cache : buildcache.BuildCache
+        The cache of the variable dependency graph. When given, a build whose source only changed in its
+        variables evaluates again only the statements depending on them, see depgraph. optional.
+    optimizer : cssopt.CssOptimizer
+        The optimizer merging rules and removing overridden declarations. optional.
+    analyze : bool
+        Whether to estimate the render cost of the rules of the built CSS, see analyzeCss. (default False)
+    themer : themable.Themer
+        The themer writing the variables safe at runtime as CSS custom properties. optional.
+    stylus_worker : stylusworker.StylusWorker
+        The persistent worker compiling with stylus rather than running the stylus binary for each build,
+        implies use_stylus. optional.
+    fold : bool
+        Whether to also report what folding the conditions on the UserStyle variables changes, see
+        reportFolding. The CSS is compiled without folding either way. (default False)
+
+    """
+
+    def __init__(self, in_file, compress=False, use_stylus=False, cache=None, svg_minifier=None, sprite=False,
+                 pruner=None, splitter=None, graph_cache=None, optimizer=None, analyze=False, themer=None,
+                 stylus_worker=None, fold=False):
+        import depgraph
+        import svgmin
+        self.in_file = in_file
+        self.compress = compress
+        self.use_stylus = use_stylus or stylus_worker is not None
+        self.cache = cache
+        self.svg_minifier = svg_minifier or svgmin.SvgMinifier()
+        self.sprite = sprite
+        self.pruner = pruner
+        self.splitter = splitter
+        self.optimizer = optimizer
+        self.analyze = analyze
+        self.themer = themer
+        self.stylus_worker = stylus_worker
+        self.fold = fold
+        self.var_lines = []
+        self.user_style_block = None
+        self.parse_cache = stylc.ParseCache()
+        self.incremental = None
+        if graph_cache is not None and not self.use_stylus:
+            self.incremental = depgraph.IncrementalCompiler(graph_cache, self.parse_cache)
+        if themer is not None and themer.compiler.parse_cache is None:
+            # sharing the parsed sections with the build
+            themer.compiler.parse_cache = self.parse_cache
+
+
 user_styl_file = "Dark-Telegram.user.styl"
 user_css_file = "Dark-Telegram.user.css"
 
+# the select variable of the browser targets and the @-moz-document rule of the domain targets
+browser_variable = "browser"
+domain_re = re.compile(r"""@-moz-document\s+domain\(\s*["']([^"']+)["']\s*\)""")
+
+# whether to print debug output and keep the intermediate files, set by --debug
 debug = False
-user_style_block = Block()
+
+# the profiler of the stages of this run, set by --profile
+stage_profiler = None
 
 help_msg = "\n\nCompiling Dark-Telegram.user.styl file to plain CSS\n" + \
     "===========================================\n\n" + \
@@ -178,23 +217,124 @@ help_msg = "\n\nCompiling Dark-Telegram.user.styl file to plain CSS\n" + \
     "   python compile.py [command(s)(optional)]\n\n" + \
     "Commands:\n" + \
     "   --debug, -d, /d             - Will display more output and won't clear files.\n" + \
-    "   --compress, -c, /c          - Will compress the resulted CSS.\n" + \
+    "   --compress, -c, /c          - Will minify the resulted CSS.\n" + \
     "   --noversionstring, -nv, /nv - Whether to ignore version string.\n" + \
     "   --sync, -s, /s              - Will only sync styl and CSS files.\n" + \
     "   --timestamp, -t, /t         - Will use file's timestamp rather than version when syncing files.\n" + \
+    "   --stylus, -st, /st          - Will compile using the stylus binary instead of the built-in compiler.\n" + \
+    "   --stylus-worker, -sw, /sw   - Will compile using a single long-lived stylus worker (stylus-worker.js, needs Node and\n" + \
+    "                                 stylus) rather than running the stylus binary for each build, implies --stylus.\n" + \
+    "                                 Presets and targets compiled with stylus use a stylus worker in each process.\n" + \
+    "   --worker-command, -wc, /wc [command]\n" + \
+    "                               - The command starting the stylus worker, implies --stylus-worker.\n" + \
+    "                                 e.g. 'python benchmarks/standin_worker.py' (default is 'node stylus-worker.js')\n" + \
+    "   --watch, -w, /w             - Will keep running and recompile whenever the styl file or Resources change.\n" + \
+    "   --no-cache, -nc, /nc        - Will compile even if the build cache holds the CSS of the same inputs.\n" + \
+    "   --presets, -p, /p [file]    - Will compile every preset of the given JSON\\TOML file to build/darkmode.[preset].css.\n" + \
+    "   --targets, -tg, /tg [browsers:domains]\n" + \
+    "                               - Will compile every browser x domain target to build/targets/darkmode.[browser].[domain].css.\n" + \
+    "                                 Browsers are comma separated 'browser' values (default all), domains are comma separated\n" + \
+    "                                 domains or URL prefixes (default the user style's, 'none' for Franz/Ferdi).\n" + \
+    "   --jobs, -j, /j [count]      - The number of processes compiling presets. (default is the number of CPUs)\n" + \
+    "   --sprite, -sp, /sp          - Will also combine the SVG icons of Resources into build/icons.svg.\n" + \
+    "   --prune, -pn, /pn [files]   - Will drop the selectors that can not match the given comma separated HTML snapshots\n" + \
+    "                                 (file names or glob patterns) and list them in build/prune-report.txt.\n" + \
+    "   --allow, -al, /al [file]    - The allowlist of dynamically added classes (.class), ids (#id) and tags kept\n" + \
+    "                                 by --prune, one pattern per line with * and ? wildcards.\n" + \
+    "   --optimize, -op, /op        - Will merge rules sharing selectors or declarations and remove overridden declarations,\n" + \
+    "                                 listing what changed in build/optimize-report.txt.\n" + \
+    "   --optimize-check, -oc, /oc  - Will also check the optimized CSS has the same cascade, implies --optimize.\n" + \
+    "                                 The CSS is kept as it was if it does not.\n" + \
+    "   --split, -sl, /sl           - Will also split the CSS into darkmode.critical.css, the colours and widths of the\n" + \
+    "                                 first paint, and darkmode.deferred.css, the icons, animations and other extras.\n" + \
+    "   --split-rules, -sr, /sr [file]\n" + \
+    "                               - The JSON file of the split rules, implies --split. (see critical.DEFAULT_RULES)\n" + \
+    "   --themable, -th, /th        - Will write the colours, lengths and percentages safe to change at runtime as CSS custom\n" + \
+    "                                 properties of a :root block (--dt-[variable]) rather than their values, listing\n" + \
+    "                                 them in build/themable-report.txt. Checkboxes and selects are still compiled in.\n" + \
+    "   --analyze, -az, /az         - Will estimate the render cost of each rule of the CSS (selectors, filters, shadows,\n" + \
+    "                                 animations...) and rank them by section in build/analyze-report.txt.\n" + \
+    "   --fold, -fo, /fo            - Will also compile with the conditions on the UserStyle variables folded ahead and\n" + \
+    "                                 report the bytes, rules and time it saves. The CSS written is not folded.\n" + \
+    "   --depends, -dp, /dp [var]   - Will list the compiled rules depending on the given UserStyle variable.\n" + \
+    "   --serve, -sv, /sv [port]    - Will serve the CSS compiled with the variables of the query on a local port,\n" + \
+    "                                 e.g. http://127.0.0.1:8080/darkmode.css?enableCompact=1&compress=1\n" + \
+    "   --profile, -pr, /pr         - Will time each stage and write a Chrome trace to build/profile.json.\n" + \
+    "                                 Memory tracing slows the build down, compare the times with each other only.\n" + \
+    "                                 Prints the total time, peak memory and slowest stage, each stage with --debug.\n" + \
+    "   --delta, -dl, /dl [old] [new] [delta]\n" + \
+    "                               - Will write the rule level delta turning the old compiled CSS into the new one.\n" + \
+    "   --patch, -pa, /pa [old] [delta] [new]\n" + \
+    "                               - Will rebuild the new compiled CSS from the old one and a delta.\n" + \
     "   --help, -h, /h              - Will show this message.\n\n" + \
     "Example:\n" + \
     "   python compile.py -c -d\n\n" + \
-    "   -> Will compile and compress 'Dark-Telegram.user.styl' file showing a bunch of info as output.\n" + \
+    "   -> Will compile and compress 'Dark-Telegram.user.styl' file showing a bunch of info as output.\n\n" + \
+    "   python compile.py -p presets.example.json -j 4\n\n" + \
+    "   -> Will compile each preset of 'presets.example.json' using 4 processes.\n\n" + \
+    "   python compile.py -tg chromium,firefox:web.telegram.org/k,web.telegram.org/z\n\n" + \
+    "   -> Will compile the /k and /z clients' CSS for Chromium and FireFox, parsing the user style once.\n\n" + \
+    "   python compile.py -dl darkmode.old.css darkmode.css darkmode.delta.json\n\n" + \
+    "   -> Will write the rules added, removed and changed since 'darkmode.old.css' and summarize them.\n" + \
     "\n"
 
 
-def log(msg):
-    """ Prints a message if debug is True. """
+def getArgValue(names, default=None):
+    """ Gets the argument following the first of the given argument names or default if none was given. """
+
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg in names:
+            return sys.argv[i + 1]
+    return default
+
+
+def getArgValues(names, count):
+    """ Gets the given count of arguments following the first of the given argument names or None if none was given. """
+
+    for i, arg in enumerate(sys.argv):
+        if arg in names:
+            values = sys.argv[i + 1:i + 1 + count]
+            return values if len(values) == count else None
+    return None
+
+
+def stage(name):
+    """ Gets a context profiling the code within it as a stage of a given name when --profile was given. """
+
+    if stage_profiler is None:
+        return contextlib.nullcontext()
+    return stage_profiler.stage(name)
+
+
+def countLines(count):
+    """ Adds a given number of lines to the profiled stage when --profile was given. """
+
+    if stage_profiler is not None:
+        stage_profiler.addLines(count)
+
+
+def writeProfile(out_file=os.path.join("build", "profile.json")):
+    """ Writes the stages profiled so far as a Chrome trace and prints their summary, and their table in debug mode,
+    then stops profiling. """
+
+    global stage_profiler
+
+    if stage_profiler is None:
+        return
+    stage_profiler.stop()
+    stage_profiler.writeTrace(out_file)
+    log(stage_profiler.table())
+    print(stage_profiler.summary())
+    print("Profile written to '" + out_file + "'.")
+    stage_profiler = None
+
+
+def log(msg, verbose=None):
+    """ Prints a message if verbose is True, or if debug is True when verbose is None. """
 
     global debug
 
-    if debug:
+    if debug if verbose is None else verbose:
         print(msg)
 
 
@@ -211,311 +351,903 @@ def stripLine(line):
     return l
 
 
-def getVarType(line) -> str:
-    """ Gets the type from a given string and returns it as str """
+def readLines(in_file):
+    """ Yields the lines of a given file one by one. """
 
-    l = line.strip().split(' ')
-    if l[0].startswith("@"):
-        if l[0].startswith("@var"):
-            return l[1].strip()
-        else:
-            return "META"
-    elif l[0].startswith("--"):
-        return "ROOT"
-    return "UNKNOWN"
+    with open(in_file, 'r') as read_obj:
+        for line in read_obj:
+            yield line
 
 
-def extractMeta(line):
-    """ Extracts a new meta Var based on the given string """
+def writeLines(out_file, lines) -> bool:
+    """ Writes the given lines to a file atomically, see sync.replaceFile.
+    The target is left untouched when it already has the same content.
 
-    line = stripLine(line)
+    Parameters:
+    -----------
+    out_file : str
+        The file to write to.
+    lines : iterable of str
+        The lines to write. Can be a generator.
 
-    args = line.strip().split(' ', 1)
-    v = Var()
-    v.var_name = args[0].strip()
-    v.value = args[1].strip()
+    Returns:
+    -----------
+    Returns True if the file was written False if it did not change."""
 
-    return v
+    import sync
 
+    content = "".join(lines)
+    if os.path.isfile(out_file):
+        # comparing with the text as it would be written, newlines translated
+        with open(out_file, 'r', newline='') as read_obj:
+            if read_obj.read() == content.replace("\n", os.linesep):
+                log("'" + out_file + "' did not change.")
+                return False
+    sync.replaceFile(out_file, lambda write_obj: write_obj.write(content))
+    return True
 
-def extractRangeValue(range):
-    """ Extracts a value from the given range/number string """
 
-    r = stripLine(range)
-    r = r.replace('[', '').replace(']', '')
-    val = r.split(',')[0]
-    if r.find("\"") >= 0:
-        val += r.split("\"")[1]
-    elif r.find("'") >= 0:
-        val += r.split("'")[1]
-    return val
+def copyFile(in_file, out_file) -> bool:
+    """ Copies a file atomically, unless the target already has the same content.
 
+    Returns:
+    -----------
+    Returns True if the file was copied False if the target did not change."""
 
-def extractVar(line):
-    """ Extracts a new Var based on the given string """
+    import sync
 
-    global debug
+    if os.path.isfile(out_file) and sync.sameContent(in_file, out_file):
+        log("'" + out_file + "' is already the same as '" + in_file + "'.")
+        return False
 
-    line = stripLine(line)
+    sync.copyFile(in_file, out_file)
+    return True
 
-    args = line.strip().split(' ', 3)
-    props = line.split('\'', 1)[1].split('\'', 1)
 
-    v = Var()
-    v.type_name = args[1].strip()
-    v.var_name = args[2].strip()
-    v.value = props[1].strip()
-    if debug:
-        v.comment = props[0].strip()
+def extractVariables(lines) -> Block:
+    """ Extracts variables from the given lines.
 
-    return v
+    Stops consuming lines right after the :root block.
 
+    Parameters:
+    -----------
+    lines : iterable of str
+        The lines of the user style.
 
-def extractRootVar(line):
-    """ Extracts a new root Var based on the given string """
+    Returns:
+    -----------
+    Returns the UserStyle Block holding the extracted variables."""
 
-    line = stripLine(line)
+    import userstyle
 
-    args = line.strip().split(' ', 1)
+    log("Extracting variables...")
 
-    v = Var()
-    if len(args) > 1:
-        v.var_name = args[0].strip()
-        v.value = args[1].strip()
-        if v.var_name.startswith("--"):
-            v.var_name = v.var_name[2:]
-        if v.var_name is v.value:
-            v.var_name = v.value = None
+    global debug
 
-    return v
+    # if we want to include blank lines, not really needed but good for debugging
+    user_style_block = userStyleBlock(userstyle.parseUserStyle(lines, debug), debug)
 
+    log("Done extracting variables...")
+    return user_style_block
 
-def extractVariables(in_file):
-    """ Extracts variables from a given file. """
 
-    log("Extracting variables...")
+def userStyleBlock(style, comments=False, verbose=None) -> Block:
+    """ Creates the UserStyle Block of a given userstyle.UserStyle.
 
-    global user_style_block
-    global debug
+    Parameters:
+    -----------
+    style : userstyle.UserStyle
+        The parsed UserStyle metadata.
+    comments : bool
+        Whether to comment each variable with its label. default is False.
+    verbose : bool
+        Whether to print the added variables. default is debug.
 
-    reading_user_style = False
-    reading_select_block = False
-    select_block = None
-    reading_root = False
-
-    with open(in_file, 'r') as rObj:
-        for line in rObj:
-            # finding UserStyle comment block
-            if line.find("/*") >= 0 and line.find("UserStyle") >= 0:
-                log("found UserStyle block start..")
-                user_style_block = Block()
-                user_style_block.setHeader(line)
-                reading_user_style = True
-
-            # finding UserStyle end block
-            elif line.find("*/") >= 0 and line.find("/UserStyle") >= 0:
-                log("found UserStyle block end..")
-                user_style_block.setFooter(line)
-                reading_user_style = False
-
-            # within UserStyle block
-            elif reading_user_style:
-                # within a Select block
-                if reading_select_block:
-                    # finding the selected value
-                    if line.find('*') >= 0:
-                        select_block += " " + \
-                            line.replace(' ', '').replace(
-                                ',', '').split(':')[1]
-                    # finding the end of the select block
-                    elif line.find('}') >= 0:
-                        reading_select_block = False
-                        v = extractVar(select_block)
-                        user_style_block.addVar(v)
-                        select_block = None
-
-                # finding a @var variable
-                elif line.find("@var") >= 0:
-                    vType = getVarType(line)
-                    if vType != "UNKNOWN" and vType != "ROOT":
-                        # finding range and number variables with values within square brackets
-                        if vType == "range" or vType == "number":
-                            v = extractVar(line)
-                            v.value = extractRangeValue(v.value)
-                            user_style_block.addVar(v)
-                        # finding beggining of select blocks
-                        elif vType == "select":
-                            select_block = line.replace('{', '')
-                            reading_select_block = True
-                        # finding all other regular variables
-                        else:
-                            v = extractVar(line)
-                            user_style_block.addVar(v)
-
-                # finding a meta variable
-                elif line.find("@") >= 0:
-                    m = extractMeta(line)
-                    user_style_block.addMeta(m)
-
-                # if we want to include blank lines, not really needed but good for debugging
-                elif debug:
-                    user_style_block.addVar(None)
-
-            # finding :root header
-            elif line.find(":root") >= 0 and line.find("{") >= 0:
-                log("found root start")
-                # root block won't need a header or a footer nor meta variables
-                reading_root = True
+    Returns:
+    -----------
+    Returns the Block holding the meta and the variables of the UserStyle and its :root block."""
 
-            # gathering root variables
-            elif reading_root:
-                # finding the end of the root block
-                if line.find("}") >= 0:
-                    log("found root block end")
-                    reading_root = False
-                    # this is the last block we need to save its children
-                    # so we do not need to read the rest of the file
-                    break
-                else:
-                    v = extractRootVar(line)
-                    if v.var_name is not None and v.value is not None:
-                        user_style_block.addVar(v)
+    user_style_block = Block(verbose)
+    if style.header is not None:
+        user_style_block.setHeader(style.header)
+    if style.footer is not None:
+        user_style_block.setFooter(style.footer)
+    for m in style.meta:
+        user_style_block.addMeta(m)
+    for v in style.vars:
+        if v is not None and comments:
+            v.comment = v.label
+        user_style_block.addVar(v)
+    # the root variables are stylus variables as well
+    for v in style.root:
+        user_style_block.addVar(v)
+    return user_style_block
 
-            # else:
-            #     log("error?")
-            #     break
 
-    log("Done extracting variables...")
+def userStyleLines(user_style_block):
+    """ Generates the stylus lines of the given UserStyle block (its comment followed by its variables). """
 
+    yield user_style_block.header + "\n"
+    yield user_style_block.metaToString()
+    yield user_style_block.footer + "\n"
 
-def constructStylFile(in_file) -> str:
-    """ Construct a new temp file based on the given file """
+    # and after that we can insert the variables from the UserStyle block
+    yield user_style_block.bodyToString()
 
-    log("Generating temporary style file...")
 
-    global user_style_block
+def replaceVarCalls(line) -> str:
+    """ Replaces the var(--x) calls of a given line with the stylus variable x. """
+
+    l = line
+    if line.find("var(--") >= 0:
+        parts = line.split("var(--")
+        l = parts[0]
+        for i, p in enumerate(parts):
+            if i > 0:
+                l += p.replace(')', '', 1)
+    return l
+
+
+def constructStylLines(lines, user_style_block=None, verbose=None):
+    """ Generates the lines of a stylus file based on the given lines and UserStyle block.
+
+    Parameters:
+    -----------
+    lines : iterable of str
+        The lines of the user style.
+    user_style_block : Block
+        The UserStyle block holding the variables to insert. When None only the lines after it are generated.
+    verbose : bool
+        Whether to print the progress. default is debug.
+
+    Returns:
+    -----------
+    Yields the lines of the stylus file one by one."""
+
+    log("Generating stylus lines...", verbose)
 
-    out_file = "darkmode.styl"
     target = "@-moz-document domain("
     ignore = True
     within_root = False
     last_brace_line = ''
-    temp_lines = ''
+    temp_lines = []
 
-    # we will now write to a temp file the content of the given file replacing variables with our global variables
-    with open(in_file, 'r') as read_obj, open(out_file, 'w') as write_obj:
-        for line in read_obj:
-            if line.startswith(target):
-                # at this point we can insert the saved UserStyle from global variables
-                write_obj.write(user_style_block.header + "\n")
-                write_obj.write(user_style_block.metaToString())
-                write_obj.write(user_style_block.footer + "\n")
+    # we will now yield the content of the given lines replacing variables with the UserStyle variables
+    for line in lines:
+        if line.startswith(target):
+            # at this point we can insert the saved UserStyle from the block
+            if user_style_block is not None:
+                yield from userStyleLines(user_style_block)
+
+            # we can ignore this here
+            # yield line
+
+            # making sure we stop ignoring from here
+            ignore = False
 
-                # we can ignore this here
-                # write_obj.write(line)
+        elif not ignore:
+            if within_root:
+                if line.find("}") >= 0:
+                    # end of root block here
+                    within_root = False
+                    # we can now insert all of the root css elements as stylus variables
+                    # yield rootBlock.bodyToString()
+
+            elif line.find(":root") >= 0 and line.find("{") >= 0:
+                within_root = True
 
-                # and after that we can insert the variables from the UserStyle block
-                write_obj.write(user_style_block.bodyToString())
+            else:
+                # change var(--x) if exists
+                l = replaceVarCalls(line)
 
-                # making sure we stop ignoring from here
-                ignore = False
+                # if the current line ends with a curly brace (meaning the end of a block)
+                if l.lstrip().startswith('}'):
+                    # means that there's a new 'end of a block' and we need to
+                    # include the old one we found earlier (if not the first time we found)
+                    # and add all of the lines we kept before
+                    # at this point the output is similar to the input at this location
+                    # except for the line we ignore at the start
+                    yield last_brace_line
+                    yield from temp_lines
 
-            elif not ignore:
-                if within_root:
-                    if line.find("}") >= 0:
-                        # end of root block here
-                        within_root = False
-                        # we can now insert all of the root css elements as stylus variables
-                        # write_obj.write(rootBlock.bodyToString())
+                    # now we will keep the new 'end block' line until we found another one
+                    last_brace_line = l
 
-                elif line.find(":root") >= 0 and line.find("{") >= 0:
-                    within_root = True
+                    # reset variables
+                    temp_lines.clear()
 
                 else:
-                    l = line
+                    # here we simply save the current line until the next 'end block' line
+                    temp_lines.append(l)
+
+
+def variableNames(user_style_block) -> list:
+    """ Gets the names of the stylus variables of a given UserStyle Block. """
+
+    from userstyle import Var
+
+    return [v.var_name for v in user_style_block.body if isinstance(v, Var)]
+
+
+def compileStyl(source, use_stylus=False, filename="darkmode.styl", cache=None, worker=None):
+    """ Compiles a given stylus source to CSS. Use minifyCss to compress the result.
+
+    Parameters:
+    -----------
+    source : str
+        The stylus source to compile.
+    use_stylus : bool
+        Whether to use the stylus binary rather than the built-in compiler. default is False.
+        The stylus binary is also used when the built-in compiler fails and stylus is installed.
+    filename : str
+        The name of the source used by line numbers in debug mode. default is 'darkmode.styl'.
+    cache : stylc.ParseCache
+        A cache of the sections parsed by a previous compile. optional.
+    worker : stylusworker.StylusWorker
+        The persistent worker to compile with rather than running the stylus binary. optional.
+
+    Returns:
+    -----------
+    Returns the compiled CSS as str or None if the source could not be compiled."""
+
+    global debug
+
+    if not use_stylus:
+        log("Compiling '" + filename + "' with stylc " + stylc.version + "...")
+        try:
+            return stylc.render(source, linenos=debug, filename=filename, cache=cache)
+        except stylc.StylusError as e:
+            print("Built-in compiler error: " + str(e))
+            if worker is None and shutil.which("stylus") is None:
+                return None
+            print("Falling back to the stylus " + ("worker" if worker is not None else "binary") + "...")
+
+    if worker is not None:
+        import stylusworker
+
+        log("Compiling '" + filename + "' with the stylus worker...")
+        try:
+            return worker.compile(source, debug, filename)
+        except stylusworker.WorkerError as e:
+            print("Stylus worker error: " + str(e))
+            return None
+
+    # imported here as only the stylus binary needs it, which keeps importing this module fast
+    from subprocess import check_output, CalledProcessError
+
+    # call the shell command to compile the source given through stdin
+    styl_cmd = "stylus"
+    if debug:
+        styl_cmd += " --line-numbers"
+
+    try:
+        return check_output(styl_cmd, shell=True, input=source.encode()).decode()
+    except CalledProcessError as e:
+        print("stylus exited with code " + str(e.returncode))
+        return None
+
+
+def variableValues(user_style_block) -> dict:
+    """ Gets the stylus value of each variable of a given UserStyle block, by name. """
+
+    from userstyle import Var
+
+    return {v.var_name: v.value for v in user_style_block.body if isinstance(v, Var)}
+
+
+def reportFolding(source, names, cache=None):
+    """ Compiles a given stylus source with and without folding the conditions on the UserStyle variables of
+    given names ahead (see stylc.ConstantFolder) and prints what folding measurably changes.
+
+    Parameters:
+    -----------
+    source : str
+        The stylus source to compile.
+    names : list of str
+        The names of the UserStyle variables to fold.
+    cache : stylc.ParseCache
+        A cache of the sections parsed by a previous compile, making both compiles parse as little. optional."""
+
+    import cssdelta
+
+    def rules(css):
+        return sum(1 for rule in cssdelta.splitRules(css) if rule.kind == "rule")
+
+    try:
+        start = time.perf_counter()
+        css = stylc.render(source, cache=cache)
+        seconds = time.perf_counter() - start
+        folder = stylc.ConstantFolder(names)
+        start = time.perf_counter()
+        folded = stylc.render(source, cache=cache, folder=folder)
+        folded_seconds = time.perf_counter() - start
+    except stylc.StylusError as e:
+        print("Cannot fold the source: " + str(e))
+        return
+
+    print("  folded " + str(folder.branches) + " branches, dropping " + str(folder.statements) + " statements (" +
+          str(folder.rules) + " rules) and " + str(folder.mixins) + " mixins before evaluating")
+    print("  folding saved " + "{:,}".format(len(css.encode()) - len(folded.encode())) + " bytes and " +
+          str(rules(css) - rules(folded)) + " rules of CSS, compiling took " + str(round(folded_seconds * 1000)) +
+          "ms rather than " + str(round(seconds * 1000)) + "ms" +
+          (", the CSS is the same" if css == folded else ""))
+
+
+def compileIncremental(compiler, user_style_block, source):
+    """ Compiles a given stylus source, evaluating again only the statements depending on the variables
+    changed since the previous compile, see depgraph.IncrementalCompiler.
+
+    Parameters:
+    -----------
+    compiler : depgraph.IncrementalCompiler
+        The compiler holding the state of the previous compile.
+    user_style_block : Block
+        The UserStyle block the source starts with.
+    source : str
+        The stylus source to compile, see constructStylLines.
+
+    Returns:
+    -----------
+    Returns the compiled CSS as str or None if the source could not be compiled.
+    Falls back to compileStyl when the incremental compile fails."""
+
+    head = "".join(userStyleLines(user_style_block))
+    if source.startswith(head):
+        start = time.perf_counter()
+        try:
+            css = compiler.compile(head, source[len(head):], variableValues(user_style_block))
+        except stylc.StylusError as e:
+            log("Incremental compile error: " + str(e))
+        else:
+            elapsed = str(round((time.perf_counter() - start) * 1000)) + "ms"
+            if compiler.incremental:
+                changed = ", ".join(compiler.changed) if compiler.changed else "no variables"
+                print("  recompiled " + str(compiler.evaluated) + " of " + str(compiler.statementCount) +
+                      " statements in " + elapsed + ", changed " + changed)
+            else:
+                print("  compiled " + str(compiler.evaluated) + " statements in " + elapsed +
+                      " and mapped their dependencies")
+            return css
+    return compileStyl(source, False)
+
+
+def printDependents(in_file, name) -> bool:
+    """ Prints the compiled rules depending on a given UserStyle variable, see depgraph.DependencyGraph.
+
+    Returns:
+    -----------
+    Returns True if the variable exists False otherwise."""
+
+    import depgraph
+
+    lines, var_lines = itertools.tee(readLines(in_file))
+    user_style_block = extractVariables(var_lines)
+    values = variableValues(user_style_block)
+    if name not in values:
+        print("Unknown variable '" + name + "'.")
+        return False
+
+    compiler = depgraph.IncrementalCompiler()
+    head = "".join(userStyleLines(user_style_block))
+    compiler.compile(head, "".join(constructStylLines(lines)), values)
+    rules = compiler.rulesOf(name)
+    print("'" + name + "' affects " + str(len(rules)) + " rules of " +
+          str(len(compiler.state["graph"].dependents[name])) + " statements:")
+    for rule in rules:
+        print("  " + rule)
+    return True
+
+
+def minifyCss(lines) -> str:
+    """ Minifies the given CSS lines and reports the size and time it took.
+
+    Parameters:
+    -----------
+    lines : iterable of str
+        The lines of the compiled CSS.
+
+    Returns:
+    -----------
+    Returns the minified CSS as str."""
+
+    import cssmin
+
+    size = 0
+
+    def measure(lines):
+        nonlocal size
+        for line in lines:
+            size += len(line)
+            yield line
+
+    start = time.perf_counter()
+    css = "".join(cssmin.minify(measure(lines)))
+    elapsed = time.perf_counter() - start
+    saved = size - len(css)
+    print("  minified " + "{:,}".format(size) + " -> " + "{:,}".format(len(css)) + " bytes (-" +
+          str(round(saved * 100 / max(size, 1), 1)) + "%) in " + str(round(elapsed * 1000)) + "ms")
+    return css
+
+
+def resourceNames(directory="Resources") -> dict:
+    """ Gets the SVG files of a given directory by their content, to name the assets of the CSS. """
+
+    names = {}
+    if not os.path.isdir(directory):
+        return names
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".svg"):
+            with open(os.path.join(directory, name), 'rb') as read_obj:
+                names.setdefault(read_obj.read(), name)
+    return names
+
+
+def inlineDataUris(css, compress=False, report=True, svg_minifier=None) -> str:
+    """ Minifies the SVGs of the data URIs of the given CSS, re-encodes the URIs to their shortest form
+    and hoists the repeated ones into custom properties, reporting the bytes saved per asset.
+
+    Parameters:
+    -----------
+    css : str
+        The compiled CSS.
+    compress : bool
+        Whether the CSS is minified. default is False.
+    report : bool
+        Whether to print the bytes saved per asset. default is True.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs. default is None, which keeps the SVGs as they are.
+
+    Returns:
+    -----------
+    Returns the CSS as str."""
+
+    import datauri
+
+    start = time.perf_counter()
+    css, assets = datauri.inlineAssets(css, compress, optimize=svg_minifier.minify if svg_minifier else None)
+    elapsed = time.perf_counter() - start
+    if not report or not assets:
+        return css
+
+    names = resourceNames()
+    before = 0
+    after = 0
+    for i, asset in enumerate(assets):
+        size = asset.after(compress)
+        before += asset.before
+        after += size
+        print("  asset " + str(i + 1) + " " + names.get(asset.svg, asset.mime) + " (" + asset.encoding + ", " +
+              str(asset.uses) + "x" +
+              (", --" + asset.name if asset.name else "") + "): " + "{:,}".format(asset.before) + " -> " +
+              "{:,}".format(size) + " bytes (-" + "{:,}".format(asset.before - size) + ")")
+    print("  data URIs " + "{:,}".format(before) + " -> " + "{:,}".format(after) + " bytes (-" +
+          str(round((before - after) * 100 / max(before, 1), 1)) + "%) in " + str(round(elapsed * 1000)) + "ms")
+    if svg_minifier is not None:
+        log("  " + str(svg_minifier.misses) + " SVGs minified, " + str(svg_minifier.hits) + " reused.")
+    return css
+
+
+def writeArtifacts(css_file, manifest_file) -> bool:
+    """ Writes the gzip and xz copies of a given CSS file and their manifest and reports them, see artifacts.writeArtifacts.
+
+    Returns:
+    -----------
+    Returns True if the artifacts were written False if they could not be."""
+
+    import artifacts
+
+    try:
+        written = artifacts.writeArtifacts(css_file, manifest_file)
+    except OSError as e:
+        return reportArtifacts(css_file, [], str(e))
+    return reportArtifacts(css_file, written)
+
+
+def reportArtifacts(css_file, written, error=None) -> bool:
+    """ Reports the given written artifacts of a given CSS file or the error writing them, see artifacts.compressArtifacts.
+
+    Returns:
+    -----------
+    Returns True if the artifacts were written or up to date False if they could not be written."""
+
+    if error is not None:
+        print("Cannot write the artifacts of '" + css_file + "': " + error)
+        return False
+    if written:
+        print("  compressed " + ", ".join(name + " " + "{:,}".format(size) + " bytes" for name, size in written))
+    else:
+        log("Artifacts of '" + css_file + "' are up to date.")
+    return True
+
+
+def readText(in_file) -> str:
+    """ Reads a given text file as is, without translating its line breaks. """
+
+    with open(in_file, 'r', newline='') as read_obj:
+        return read_obj.read()
+
+
+def writeCssDelta(old_file, new_file, delta_file) -> bool:
+    """ Writes the rule level delta turning a compiled CSS file into another and prints its summary, see cssdelta.makeDelta.
+
+    Parameters:
+    -----------
+    old_file : str
+        The CSS file of the previous release.
+    new_file : str
+        The CSS file of the new release.
+    delta_file : str
+        The JSON file to write the delta to.
+
+    Returns:
+    -----------
+    Returns True if the delta was written False if it could not be."""
+
+    import cssdelta
+    import sync
+
+    try:
+        old_css = readText(old_file)
+        new_css = readText(new_file)
+    except OSError as e:
+        print("Cannot read the CSS: " + str(e))
+        return False
+
+    delta = cssdelta.makeDelta(old_css, new_css)
+    sync.replaceFile(delta_file, lambda write_obj: write_obj.write(cssdelta.dumpDelta(delta) + "\n"))
+    print("Delta of '" + old_file + "' -> '" + new_file + "' written to '" + delta_file + "'.")
+    print(cssdelta.summary(old_css, new_css, delta, 1000 if debug else 10))
+    return True
+
+
+def applyCssDelta(old_file, delta_file, out_file) -> bool:
+    """ Rebuilds a compiled CSS file from the previous one and a delta, see cssdelta.applyDelta.
+
+    Parameters:
+    -----------
+    old_file : str
+        The CSS file the delta was made from.
+    delta_file : str
+        The JSON delta.
+    out_file : str
+        The CSS file to write, may be old_file.
+
+    Returns:
+    -----------
+    Returns True if the CSS was rebuilt False if the delta does not apply."""
+
+    import cssdelta
+    import sync
+
+    try:
+        old_css = readText(old_file)
+        with open(delta_file, 'r', encoding="utf-8") as read_obj:
+            delta = json.load(read_obj)
+        new_css = cssdelta.applyDelta(old_css, delta)
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+        print("Cannot apply '" + delta_file + "' to '" + old_file + "': " + str(e))
+        return False
+
+    sync.replaceFile(out_file, lambda write_obj: write_obj.write(new_css), newline='')
+    stats = cssdelta.deltaStats(old_css, delta)
+    print("'" + out_file + "' rebuilt, {added:,} rules added, {removed:,} removed and {changed:,} changed.".format(**stats))
+    return True
+
+
+def loadPruner(snapshots, allow_file=None):
+    """ Creates the pruner of the given DOM snapshots, see prune.Pruner.
+
+    Parameters:
+    -----------
+    snapshots : str
+        The comma separated HTML snapshot files or glob patterns.
+    allow_file : str
+        The allowlist file. optional.
+
+    Returns:
+    -----------
+    Returns the prune.Pruner or None if the snapshots or the allowlist could not be read."""
+
+    import glob
+    import prune
+
+    files = []
+    for pattern in snapshots.split(","):
+        matches = sorted(glob.glob(pattern.strip()))
+        if not matches:
+            print("No DOM snapshot matches '" + pattern.strip() + "'.")
+            return None
+        files.extend(matches)
+
+    index = prune.DomIndex()
+    try:
+        index.addFiles(files)
+        allowlist = prune.loadAllowlist(allow_file) if allow_file else []
+    except OSError as e:
+        print("Cannot read the pruning inputs: " + str(e))
+        return None
+    log("Indexed " + str(len(files)) + " DOM snapshots, " + str(len(index.tags)) + " tags, " + str(len(index.ids)) +
+        " ids and " + str(len(index.classes)) + " classes.")
+    return prune.Pruner(index, allowlist)
+
+
+def pruneCss(css, pruner, report_file=os.path.join("build", "prune-report.txt")) -> str:
+    """ Drops the selectors of a given CSS that can not match the snapshots of a given pruner
+    and writes the dropped selectors to a report file.
+
+    Returns:
+    -----------
+    Returns the pruned CSS."""
+
+    css = pruner.prune(css)
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    writeLines(report_file, [pruner.report()])
+    print("  pruned " + "{:,}".format(len(pruner.removed)) + " selectors, " + "{:,}".format(pruner.saved) +
+          " bytes saved, see '" + report_file + "'")
+    return css
+
+
+def optimizeCss(css, optimizer, report_file=os.path.join("build", "optimize-report.txt")) -> str:
+    """ Optimizes the rules of a given CSS with a given optimizer, see cssopt.CssOptimizer,
+    and writes what changed to a report file.
+
+    Returns:
+    -----------
+    Returns the optimized CSS, the given CSS if the check of the optimizer failed."""
+
+    css = optimizer.optimize(css)
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    writeLines(report_file, [optimizer.report()])
+    if optimizer.differences:
+        print("  the optimized cascade differs, kept the CSS as it was, see '" + report_file + "'")
+    else:
+        print("  optimized " + "{:,}".format(optimizer.stats["rules_removed"]) + " rules and " +
+              "{:,}".format(optimizer.stats["declarations_removed"]) + " declarations away, " +
+              "{:,}".format(optimizer.stats["saved"]) + " bytes saved, see '" + report_file + "'")
+    return css
+
 
-                    # change var(--x) if exists
-                    if line.find("var(--") >= 0:
-                        parts = line.split("var(--")
-                        l = parts[0]
-                        for i, p in enumerate(parts):
-                            if i > 0:
-                                l += p.replace(')', '', 1)
+def themeCss(source, user_style_block, themer, report_file=os.path.join("build", "themable-report.txt")):
+    """ Compiles a given stylus source with the variables safe at runtime as CSS custom properties,
+    see themable.Themer, and writes which variables are to a report file.
 
-                    # if the current line ends with a curly brace (meaning the end of a block)
-                    if l.lstrip().startswith('}'):
-                        # means that there's a new 'end of a block' and we need to
-                        # include the old one we found earlier (if not the first time we found)
-                        # and add all of the lines we kept before
-                        temp_lines = last_brace_line + temp_lines
+    Parameters:
+    -----------
+    source : str
+        The stylus source to compile, see constructStylLines.
+    user_style_block : Block
+        The UserStyle block the source starts with.
+    themer : themable.Themer
+        The themer.
+
+    Returns:
+    -----------
+    Returns the themable CSS as str or None if it could not be compiled."""
+
+    from userstyle import Var
+
+    head = "".join(userStyleLines(user_style_block))
+    if not source.startswith(head):
+        print("Cannot find the UserStyle block of the source, the CSS is not themable.")
+        return None
+
+    def headOf(values):
+        return "".join(userStyleLines(overrideVariables(user_style_block, values, False)))
+
+    variables = [v for v in user_style_block.body if isinstance(v, Var)]
+    try:
+        css = themer.theme(variables, source[len(head):], headOf)
+    except stylc.StylusError as e:
+        print("Cannot compile the themable CSS: " + str(e))
+        return None
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    writeLines(report_file, [themer.report()])
+    if css is None:
+        print("  the themable CSS differs from the compiled one, kept the values, see '" + report_file + "'")
+    else:
+        print("  wrote " + str(len(themer.themed)) + " variables as custom properties in " + str(themer.compiles) +
+              " compiles, " + str(len(themer.rejected)) + " candidates resolved, see '" + report_file + "'")
+    return css
+
+
+def styleLineMap(lines, head_count) -> list:
+    """ Maps the lines of the stylus source generated from the given user style lines to them, see constructStylLines.
+
+    Parameters:
+    -----------
+    lines : list of str
+        The lines of the user style.
+    head_count : int
+        The number of lines of the UserStyle block the generated source starts with, see userStyleLines.
+
+    Returns:
+    -----------
+    Returns a list holding the user style line number of each line of the generated source, None for the
+    lines of the UserStyle block."""
+
+    line_map = [None] * head_count
+    target = next((i for i, line in enumerate(lines) if line.startswith("@-moz-document domain(")), len(lines))
+    k = target + 1
+    for line in constructStylLines(iter(lines)):
+        # the generated lines are the user style lines in order, some of them left out
+        for _ in range(line.count("\n")):
+            while k < len(lines) and replaceVarCalls(lines[k]) != line:
+                k += 1
+            line_map.append(k + 1 if k < len(lines) else None)
+            k += 1
+    return line_map
 
-                        # then we need to write it all as usual
-                        # at this point the output file is similar to the input file at this location
-                        # except for the line we ignore at the start
-                        write_obj.write(temp_lines)
 
-                        # now we will keep the new 'end block' line until we found another one
-                        last_brace_line = l
+def analyzeCss(css_file, context, report_file=os.path.join("build", "analyze-report.txt"), limit=5):
+    """ Estimates the render cost of the rules of a given CSS file built from the user style of a given context,
+    see analyze.CostAnalyzer, and writes the costs by section and rule to a report file.
 
-                        # reset variables
-                        temp_lines = ''
+    The rules are traced back to the user style lines by compiling it again with line numbers.
 
-                    else:
-                        # here we simply save the current line in a temp variable
-                        temp_lines += l
+    Returns:
+    -----------
+    Returns True if the CSS was analyzed False otherwise."""
+
+    import analyze
+
+    lines = list(readLines(context.in_file))
+    head = "".join(userStyleLines(context.user_style_block))
+    body = "".join(constructStylLines(iter(lines)))
+    try:
+        numbered = stylc.render(head + body, linenos=True, filename=context.in_file, cache=context.parse_cache)
+    except stylc.StylusError as e:
+        print("Cannot trace the rules to their source: " + str(e))
+        numbered = ""
+    line_map = styleLineMap(lines, head.count("\n"))
+
+    analyzer = analyze.CostAnalyzer(analyze.styleSections([stripLine(l) for l in lines]),
+                                    analyze.sourceLines(numbered, line_map))
+    analyzer.analyze(readText(css_file))
+    os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    writeLines(report_file, [analyzer.report()])
+
+    total = max(sum(cost.score for cost in analyzer.costs), 1)
+    print("  analyzed " + "{:,}".format(len(analyzer.costs)) + " rules, the costliest sections:")
+    for section, score, count in analyzer.sectionScores()[:limit]:
+        print("    {:>5.1f}% {:>4} rules  {}".format(score * 100 / total, count, section))
+    print("  and rules:")
+    for cost in analyzer.costs[:limit]:
+        selector = cost.selector if len(cost.selector) <= 60 else cost.selector[:57] + "..."
+        print("    {:>5,} line {:>5}  {}  ({})".format(cost.score, cost.line or "?", selector, cost.describe(2)))
+    print("  see '" + report_file + "'")
+    return True
+
+
+def writeSplit(css, splitter, critical_file="darkmode.critical.css", deferred_file="darkmode.deferred.css"):
+    """ Splits a given CSS into its critical and deferred chunks, writes them and reports their sizes,
+    see critical.CssSplitter.
+
+    Parameters:
+    -----------
+    css : str
+        The compiled CSS.
+    splitter : critical.CssSplitter
+        The splitter.
+    critical_file : str
+        The file to write the critical chunk to. default is darkmode.critical.css.
+    deferred_file : str
+        The file to write the deferred chunk to. default is darkmode.deferred.css."""
+
+    import artifacts
+    import cssdelta
+
+    critical_css, deferred_css = splitter.split(css)
+    total = max(len(css.encode()), 1)
+    for name, out_file, chunk in (("critical", critical_file, critical_css), ("deferred", deferred_file, deferred_css)):
+        writeLines(out_file, [chunk])
+        data = chunk.encode()
+        rules = sum(1 for r in cssdelta.splitRules(chunk) if r.kind == "rule")
+        print("  " + name + " " + out_file + " " + "{:,}".format(len(data)) + " bytes (" +
+              str(round(len(data) * 100 / total, 1)) + "%, " + "{:,}".format(len(artifacts.gzipBytes(data))) +
+              " gzipped), " + "{:,}".format(rules) + " rules")
+
+
+def buildSprite(svg_minifier, directory="Resources", out_file=os.path.join("build", "icons.svg")) -> bool:
+    """ Combines the minified SVG icons of a given directory into a single sprite, see svgmin.spriteSvg.
+
+    Parameters:
+    -----------
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the icons.
+    directory : str
+        The directory of the icons. default is 'Resources'.
+    out_file : str
+        The sprite file. default is 'build/icons.svg'.
+
+    Returns:
+    -----------
+    Returns True if the sprite was built False otherwise."""
 
-                    # else:
-                    #     write_obj.write(line)
+    import svgmin
 
-    return out_file
+    icons = {}
+    size = 0
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith(".svg"):
+            with open(os.path.join(directory, name), 'rb') as read_obj:
+                data = read_obj.read()
+            size += len(data)
+            icons[name[:-len(".svg")]] = svg_minifier.minify(data)
 
+    if not icons:
+        print("No SVG icons in '" + directory + "'.")
+        return False
 
-def cleanLeftoverComments(in_file):
-    """ Clears all the leftover comments excluding UserStyle block comment """
+    sprite = svgmin.spriteSvg(icons)
+    os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+    writeLines(out_file, [sprite.decode("utf-8")])
+    print("  sprite " + out_file + " of " + str(len(icons)) + " icons " + "{:,}".format(size) + " -> " +
+          "{:,}".format(len(sprite)) + " bytes")
+    return True
 
-    log("Cleaning leftover comments...")
 
-    tmp_file = "styl.tmp"
+def cleanLeftoverComments(lines, verbose=None):
+    """ Clears all the leftover comments excluding UserStyle block comment.
+
+    Parameters:
+    -----------
+    lines : iterable of str
+        The lines of the compiled CSS.
+    verbose : bool
+        Whether to print the progress. default is debug.
+
+    Returns:
+    -----------
+    Yields the lines which are not comments one by one."""
+
+    log("Cleaning leftover comments...", verbose)
+
     within_comment = False
     comment_count = 0
 
-    # open in file to read and target file to write to
-    with open(in_file, 'r') as read_obj, open(tmp_file, 'w') as write_obj:
-        # iterating over all lines in the file
-        for line in read_obj:
-            if within_comment:
-                # we are within a comment block and can ignore until we found closing block
-                if line.find("*/") >= 0:
-                    within_comment = False
-                    comment_count += 1
-
-            elif line.startswith("/*") and line.find("*/") > 0:
-                # one line comment we can completely ignore
+    # iterating over all lines
+    for line in lines:
+        if within_comment:
+            # we are within a comment block and can ignore until we found closing block
+            if line.find("*/") >= 0:
+                within_comment = False
                 comment_count += 1
 
-            elif line.startswith("/*") and line.find("*/") < 0 and line.find("==UserStyle==") < 0:
-                # start of a comment block
-                within_comment = True
-            else:
-                # not a comment
-                write_obj.write(line)
+        elif line.startswith("/*") and line.find("*/") > 0:
+            # one line comment we can completely ignore
+            comment_count += 1
 
-    log(str(comment_count) + " comments removed.")
+        elif line.startswith("/*") and line.find("*/") < 0 and line.find("==UserStyle==") < 0:
+            # start of a comment block
+            within_comment = True
+        else:
+            # not a comment
+            yield line
 
-    # renaming output file
-    os.remove(in_file)
-    os.rename(tmp_file, in_file)
+    log(str(comment_count) + " comments removed.", verbose)
 
 
-def generateVersionString(in_file):
-    """ Generates a version string for the given file. """
+def versionLine(head, line) -> str:
+    """ Generates the version string line of a user style.
 
-    log("Generating version string for '" + in_file + "'")
+    Parameters:
+    -----------
+    head : list of str
+        The lines of the user style before the '--version' line, holding '@name' and '@version'.
+    line : str
+        The current '--version' line.
+
+    Returns:
+    -----------
+    Returns the '--version' line with the name, version and date of today, keeping its indentation and line ending."""
 
-    tmp_file = "vstr.tmp"
     name = "Unknown"
     version = "-1"
-    versionStringGenerated = False
+    for l in head:
+        if l.find("@name ") >= 0:
+            name = l.replace("@name ", "").strip()
+        elif l.find("@version ") >= 0:
+            version = "v" + l.replace("@version ", "").strip()
 
     # building the date string of today
     date = datetime.datetime.now()
@@ -532,31 +1264,22 @@ def generateVersionString(in_file):
 
     datestring += ", " + date.strftime("%Y")
 
-    # open in file to read and target file to write to
-    with open(in_file, 'r') as read_obj, open(tmp_file, 'w') as write_obj:
-        # iterating over all lines in the file
-        for line in read_obj:
-            if line.find("@name ") >= 0:
-                name = line.replace("@name ", "").strip()
-            elif line.find("@version ") >= 0:
-                version = "v"+line.replace("@version ", "").strip()
+    i = line.find("--version ")
+    ending = line[len(line.rstrip("\r\n")):] or "\n"
+    return " " * i + "--version \"" + name + " " + version + " -- " + datestring + "\"" + ending
 
-            if not versionStringGenerated:
-                i = line.find("--version ")
-                if i >= 0:
-                    line = ""
-                    # building indentation
-                    for c in range(i):
-                        line += " "
-                    line += "--version \"" + name + " " + version + \
-                        " -- " + datestring + "\"\n"
-                    versionStringGenerated = True
 
-            write_obj.write(line)
+def generateVersionString(in_file):
+    """ Generates a version string for the given file. The file is only rewritten when the version string changed. """
+
+    import sync
+
+    log("Generating version string for '" + in_file + "'")
 
-    # renaming output file
-    os.remove(in_file)
-    os.rename(tmp_file, in_file)
+    if not os.path.isfile(in_file):
+        return
+    if sync.patchLine(in_file, "--version ", versionLine):
+        log("Version string of '" + in_file + "' updated.")
 
 
 def getVersionFromFile(in_file):
@@ -578,7 +1301,7 @@ def getVersionFromFile(in_file):
         for line in read_obj:
             # searching for the line that contains the '@version' string
             if line.find("@version ") >= 0:
-                temp = line.replace("@version", "").replace(" ", "")
+                temp = line.replace("@version", "").strip()
                 if len(temp) > 0:
                     version = temp
                     versionFound = True
@@ -591,25 +1314,14 @@ def getVersionFromFile(in_file):
     return version
 
 
-def compareVersions(v1, v2) -> int:
-    """ Compare two given version strings and return which is bigger.
-
-    Returns 1 when version1 is bigger than version2, -1 when version2 is bigger and 0 when they are equals. """
-
-    v1 = int(v1.replace(".", ""))
-    v2 = int(v2.replace(".", ""))
-
-    if v1 > v2:
-        return 1
-    if v2 > v1:
-        return -1
-    return 0
-
-
 def checkStylCss(useTimestamp=False) -> bool:
     """ Checks the presence of Dark-Telegram.user.styl 
     and Dark-Telegram.user.css and make sure they're synced.
 
+    Files with the same content are left alone. Otherwise the file with the greater version
+    (or the later timestamp) replaces the other. Files of the same version are never copied,
+    as the version stamping touches both, a warning is printed if their content differ.
+
     Parameters:
     -----------
     useTimestamp : bool
@@ -619,139 +1331,919 @@ def checkStylCss(useTimestamp=False) -> bool:
     -----------
     Returns True if the check has passed False otherwise."""
 
-    ok_result = True
-    if os.path.isfile(user_styl_file) and not os.path.isfile(user_css_file):
-        # style file exists but css file does not
-        shutil.copyfile(user_styl_file, user_css_file)
-        log("Dark-Telegram.user.styl -> Dark-Telegram.user.css")
-
-    elif not os.path.isfile(user_styl_file) and os.path.isfile(user_css_file):
-        # style file does not exists but css file does
-        shutil.copyfile(user_css_file, user_styl_file)
-        log("Dark-Telegram.user.css -> Dark-Telegram.user.styl")
+    import sync
 
-    elif not os.path.isfile(user_styl_file) and not os.path.isfile(user_css_file):
+    if not os.path.isfile(user_styl_file) and not os.path.isfile(user_css_file):
         # both files does not exists at all
-        ok_result = False
         print("Cannot find '" + user_styl_file +
               "' or '" + user_css_file + "'.")
+        return False
 
-    else:
-        # both files exists, need to sync them up
-
-        vCompare = 0
+    styl_order = css_order = None
+    if os.path.isfile(user_styl_file) and os.path.isfile(user_css_file):
+        # both files exists, the orders are used if their content differ
+        if not useTimestamp:
+            # checking which file have a grater version
+            styl_order = getVersionFromFile(user_styl_file)
+            css_order = getVersionFromFile(user_css_file)
+            log("Dark-Telegram.user.styl version: " + str(styl_order))
+            log("Dark-Telegram.user.css version: " + str(css_order))
 
         if useTimestamp:
             # checking which file was edited later
-            styl_time = os.path.getmtime(user_styl_file)
-            css_time = os.path.getmtime(user_css_file)
-            log("Dark-Telegram.user.styl timestamp: " + str(styl_time))
-            log("Dark-Telegram.user.css timestamp: " + str(css_time))
-            vCompare = compareVersions(styl_time, css_time)
-        else:
-            # checking which file have a grater version
-            stylv = getVersionFromFile(user_styl_file)
-            cssv = getVersionFromFile(user_css_file)
-            log("Dark-Telegram.user.styl version: " + str(stylv))
-            log("Dark-Telegram.user.css version: " + str(cssv))
-            vCompare = compareVersions(stylv, cssv)
-
-        if vCompare > 0:
-            # styl was modified after or is newer than css
-            shutil.copyfile(user_styl_file, user_css_file)
-            log("Dark-Telegram.user.styl -> Dark-Telegram.user.css")
-
-        elif vCompare < 0:
-            # css was modified after or is newer than styl
-            shutil.copyfile(user_css_file, user_styl_file)
-            log("Dark-Telegram.user.css -> Dark-Telegram.user.styl")
+            styl_order = os.stat(user_styl_file).st_mtime_ns
+            css_order = os.stat(user_css_file).st_mtime_ns
+            log("Dark-Telegram.user.styl timestamp: " + str(styl_order))
+            log("Dark-Telegram.user.css timestamp: " + str(css_order))
+
+    direction = sync.syncFiles(user_styl_file, user_css_file, styl_order, css_order)
+    if direction > 0:
+        # styl was modified after or is newer than css
+        log("Dark-Telegram.user.styl -> Dark-Telegram.user.css")
+    elif direction < 0:
+        # css was modified after or is newer than styl
+        log("Dark-Telegram.user.css -> Dark-Telegram.user.styl")
+    elif os.path.isfile(user_styl_file) and os.path.isfile(user_css_file) and \
+            not sync.sameContent(user_styl_file, user_css_file):
+        # which file was edited is unknown, copying either way could lose the edits
+        print("Warning: '" + user_styl_file + "' and '" + user_css_file + "' have the same " +
+              ("timestamp" if useTimestamp else "version") + " but different content, neither was copied. " +
+              "Raise the version of the edited one.")
+    else:
+        log("Dark-Telegram.user.styl = Dark-Telegram.user.css")
+
+    log("File sync check done.")
+    return True
+
+
+def recordLines(lines, record):
+    """ Yields the given lines while appending each one to the given record list. """
+
+    for line in lines:
+        record.append(line)
+        yield line
+
+
+def buildKey(context) -> str:
+    """ Generates the build cache key of the given context.
+
+    The key covers the source text, the resolved UserStyle variables, the flags,
+    the pruned DOM snapshots and allowlist, the optimizer, the themer and the version of the compiler and of this script."""
+
+    import buildcache
+    import cssdelta
+    import cssmin
+    import datauri
+    import depgraph
+    import svgmin
+
+    pruner_key = "prune=None"
+    if context.pruner is not None:
+        import prune
+        pruner_key = context.pruner.key + " " + buildcache.fileHash(prune.__file__) + " " + \
+            buildcache.fileHash(cssdelta.__file__)
+
+    optimizer_key = "optimize=None"
+    if context.optimizer is not None:
+        import cssopt
+        optimizer_key = context.optimizer.key + " " + buildcache.fileHash(cssopt.__file__) + " " + \
+            buildcache.fileHash(cssdelta.__file__)
+
+    themable_key = "themable=None"
+    if context.themer is not None:
+        import themable
+        themable_key = "themable " + buildcache.fileHash(themable.__file__) + " " + buildcache.fileHash(depgraph.__file__)
+
+    return buildcache.cacheKey(
+        buildcache.fileHash(context.in_file),
+        context.user_style_block.bodyToString(),
+        "compress=" + str(context.compress),
+        "stylus=" + str(context.use_stylus),
+        pruner_key,
+        optimizer_key,
+        themable_key,
+        "stylc " + stylc.version,
+        buildcache.fileHash(stylc.__file__),
+        buildcache.fileHash(cssmin.__file__),
+        buildcache.fileHash(datauri.__file__),
+        buildcache.fileHash(svgmin.__file__),
+        buildcache.fileHash(__file__))
+
+
+def build(context) -> bool:
+    """ Builds darkmode.css from the user style file of the given context,
+    along with its gzip and xz copies and darkmode.manifest.json.
+
+    The UserStyle block and the parsed stylus sections of the previous build
+    of this context are reused when their lines did not change.
+
+    Parameters:
+    -----------
+    context : BuildContext
+        The context to build.
+
+    Returns:
+    -----------
+    Returns True if darkmode.css was built False otherwise."""
+
+    global debug
 
+    styl_file = "darkmode.styl"
+    css_file = "darkmode.css"
+    manifest_file = "darkmode.manifest.json"
+
+    if context.sprite:
+        with stage("sprite"):
+            buildSprite(context.svg_minifier)
+
+    # reading the file once, the variables are extracted from a tee'd copy of the lines
+    # so only the lines up to the end of the :root block are kept in memory
+    source_lines = readLines(context.in_file)
+    head = list(itertools.islice(source_lines, len(context.var_lines)))
+    lines = itertools.chain(head, source_lines)
+    with stage("extract"):
+        if context.user_style_block is None or head != context.var_lines:
+            var_lines = []
+            lines, tee_lines = itertools.tee(lines)
+            context.user_style_block = extractVariables(recordLines(tee_lines, var_lines))
+            context.var_lines = var_lines
         else:
-            # both files version\timestamp are the same (in other words, unreachable code :P )
-            log("Dark-Telegram.user.styl = Dark-Telegram.user.css")
+            log("UserStyle block did not change.")
+        countLines(len(context.var_lines))
+
+    # checking if we already built these exact inputs
+    key = None
+    if context.cache is not None:
+        with stage("cache"):
+            key = buildKey(context)
+            css = context.cache.get(key)
+            if css is not None:
+                source_lines.close()
+                writeLines(css_file, [css])
+                writeArtifacts(css_file, manifest_file)
+                if context.splitter is not None:
+                    writeSplit(css, context.splitter)
+        if css is not None and context.analyze:
+            with stage("analyze"):
+                analyzeCss(css_file, context)
+        if css is not None:
+            print("  cached " + css_file)
+            print("Compilation done. Please check '" + css_file + "'.")
+            return True
+
+    # construct the stylus lines with the extracted variables
+    with stage("construct"):
+        styl_lines = list(constructStylLines(lines, context.user_style_block))
+        countLines(len(styl_lines))
+
+        # keeping the stylus file for debugging
+        if debug:
+            writeLines(styl_file, styl_lines)
+
+    # compile the stylus source to CSS
+    with stage("compile"):
+        if context.incremental is not None:
+            css = compileIncremental(context.incremental, context.user_style_block, "".join(styl_lines))
+        else:
+            css = compileStyl("".join(styl_lines), context.use_stylus, styl_file, context.parse_cache,
+                              context.stylus_worker)
+        if css is None:
+            print("Couldn't compile styl file.")
+            return False
+        if context.fold and not context.use_stylus:
+            reportFolding("".join(styl_lines), variableNames(context.user_style_block), context.parse_cache)
+
+        # compilation was success
+        css_lines = css.splitlines(True)
+        countLines(len(css_lines))
+
+    # writing the variables safe at runtime as custom properties
+    if context.themer is not None:
+        with stage("themable"):
+            css = themeCss("".join(styl_lines), context.user_style_block, context.themer)
+            if css is not None:
+                css_lines = css.splitlines(True)
+            countLines(len(css_lines))
+
+    # dropping the selectors of markup missing from the DOM snapshots
+    if context.pruner is not None:
+        with stage("prune"):
+            countLines(len(css_lines))
+            css_lines = pruneCss("".join(css_lines), context.pruner).splitlines(True)
+
+    # merging rules and removing overridden declarations
+    if context.optimizer is not None:
+        with stage("optimize"):
+            countLines(len(css_lines))
+            css_lines = optimizeCss("".join(css_lines), context.optimizer).splitlines(True)
+
+    if context.compress:
+        # minifying also removes all comments
+        with stage("compress"):
+            countLines(len(css_lines))
+            css_lines = [minifyCss(css_lines)]
+    elif not debug:
+        # clean all leftover comments
+        with stage("clean"):
+            countLines(len(css_lines))
+            css_lines = list(cleanLeftoverComments(css_lines))
+
+    # shortening the data URIs and writing the repeated ones once
+    with stage("datauri"):
+        css_lines = [inlineDataUris("".join(css_lines), context.compress, svg_minifier=context.svg_minifier)]
+
+    with stage("write"):
+        if key is not None:
+            context.cache.put(key, "".join(css_lines))
+
+        writeLines(css_file, css_lines)
+    print("  compiled " + css_file)
+
+    with stage("artifacts"):
+        writeArtifacts(css_file, manifest_file)
+
+    if context.splitter is not None:
+        with stage("split"):
+            writeSplit("".join(css_lines), context.splitter)
+
+    if context.analyze:
+        with stage("analyze"):
+            analyzeCss(css_file, context)
+    print("Compilation done. Please check '" + css_file + "'.")
+    return True
+
+
+def compile_style(source: str, overrides: dict = None, *, compress: bool = False) -> str:
+    """ Compiles a given user style to CSS in memory, as the CLI compiles Dark-Telegram.user.styl to darkmode.css.
+
+    No file is written, nothing is printed whatever debug is and no state is kept between calls,
+    so it can be called from other tools any number of times. The first call imports the modules
+    compiling the CSS, svgmin hashing its own source once as the version of its minifier.
 
-    log("File sync check done.")
-    return ok_result
+    Parameters:
+    -----------
+    source : str
+        The user style source, the content of Dark-Telegram.user.styl.
+    overrides : dict
+        Variable name -> value to compile with, as the values of a preset (see presets.loadPresets). optional.
+    compress : bool
+        Whether to minify the resulted CSS. default is False.
 
+    Returns:
+    -----------
+    Returns the compiled CSS. Raises stylc.StylusError if the source cannot be compiled, KeyError if
+    an overridden variable does not exist and ValueError if an overridden value does not fit its variable."""
+
+    import cssmin
+    import datauri
+    import presets
+    import svgmin
+    import userstyle
+
+    lines = source.splitlines(True)
+    user_style_block = userStyleBlock(userstyle.parseUserStyle(iter(lines)), verbose=False)
+    if overrides:
+        values = {name: presets.stylusValue(value) for name, value in overrides.items()}
+        user_style_block = overrideVariables(user_style_block, values)
+
+    styl_source = "".join(constructStylLines(iter(lines), user_style_block, False))
+    css_lines = stylc.render(styl_source).splitlines(True)
+    if compress:
+        css = "".join(cssmin.minify(css_lines))
+    else:
+        css = "".join(cleanLeftoverComments(css_lines, False))
+    return datauri.inlineAssets(css, compress, optimize=svgmin.SvgMinifier().minify)[0]
 
-# check if the debug argument was given
-debug = "--debug" in sys.argv or "-d" in sys.argv or "/d" in sys.argv
 
-# check if the compress argument was given
-c = "--compress" in sys.argv or "-c" in sys.argv or "/c" in sys.argv
+def watch(context, useTimestamp=False):
+    """ Rebuilds the given context whenever its user style file or Resources change, until interrupted.
 
-# check if the ignoreversionstring argument was given
-nv = "--noversionstring" in sys.argv or "-nv" in sys.argv or "/nv" in sys.argv
+    Parameters:
+    -----------
+    context : BuildContext
+        The context to rebuild.
+    useTimestamp : bool
+        Whether to use file's timestamp rather than version when syncing files on exit. default is False."""
 
-# check if the sync argument was given
-s = "--sync" in sys.argv or "-s" in sys.argv or "/s" in sys.argv
+    import watcher
 
-# check if the timestamp argument was given
-t = "--timestamp" in sys.argv or "-t" in sys.argv or "/t" in sys.argv
+    paths = [context.in_file]
+    if os.path.isdir("Resources"):
+        paths.append("Resources")
 
-# check if the help argument was given
-h = "--help" in sys.argv or "-h" in sys.argv or "/h" in sys.argv
+    file_watcher = watcher.createWatcher(paths)
+    print("Watching '" + "', '".join(paths) + "' using " + type(file_watcher).__name__ + ". Press Ctrl+C to stop.")
 
-if not nv:
-    generateVersionString(user_styl_file)
-    generateVersionString(user_css_file)
+    try:
+        while True:
+            changed = file_watcher.wait()
+            log("Changed: " + ", ".join(changed))
+            if not os.path.isfile(context.in_file):
+                continue
 
-if s:
-    checkStylCss(t)
+            start = time.perf_counter()
+            try:
+                built = build(context)
+            except Exception as e:
+                # keep watching, the file is probably in the middle of an edit
+                print("Build failed: " + repr(e))
+                built = False
+            if built:
+                print("Rebuilt in " + str(round((time.perf_counter() - start) * 1000)) + "ms.")
 
-elif h:
-    print(help_msg)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
-# check if Dark-Telegram.user.styl and Dark-Telegram.user.css are synced and sync them if they don't
-elif checkStylCss(t):
+    finally:
+        file_watcher.close()
 
-    arg_file = user_styl_file
-    if os.path.isfile(arg_file):
-        if arg_file.endswith('.styl'):
-            # extracting variables from the file to global variables
-            extractVariables(arg_file)
+    # the styl file was probably edited, sync it with the css file
+    checkStylCss(useTimestamp)
 
-            # construct a stylus file with the saved variables
-            styl_file = constructStylFile(arg_file)
-            css_file = styl_file.replace(".styl", ".css")
 
-            # call the shell command to compile to given object
-            styl_cmd = "stylus "
-            if c:
-                styl_cmd += "--compress "
-            if debug:
-                styl_cmd += "--line-numbers "
+def overrideVariables(user_style_block, overrides, check=True) -> Block:
+    """ Creates a copy of the given UserStyle block with some of its variables overridden.
 
-            output = check_output(styl_cmd + styl_file, shell=True).decode()
-            print(output)
+    Parameters:
+    -----------
+    user_style_block : Block
+        The UserStyle block to copy.
+    overrides : dict
+        Variable name -> stylus value. Values of select variables are quoted when they are not already.
+    check : bool
+        Whether to check the values fit their variables. default is True.
 
-            # removing temp styl file as we do not need it anymore
-            if not debug:
-                log("Removing temp styl file...")
-                os.remove(styl_file)
+    Returns:
+    -----------
+    Returns the new Block. Raises KeyError if a variable does not exist in the block and
+    ValueError if a value does not fit its variable (not an option of a select, out of a range...)."""
 
-            # and check if the output contains a 'compiled' sub-string
-            # this way we know the compilation was success
-            if output.find("compiled") >= 0:
-                if os.path.isfile(css_file):
-                    # compilation was success
+    from userstyle import Var
 
-                    if not debug:
-                        # clean all leftover comments
-                        cleanLeftoverComments(css_file)
+    block = copy.deepcopy(user_style_block)
+    variables = {v.var_name: v for v in block.body if isinstance(v, Var)}
+    for name, value in overrides.items():
+        if name not in variables:
+            raise KeyError(name)
+        v = variables[name]
+        error = v.checkValue(value) if check else None
+        if error is not None:
+            raise ValueError(name + ": " + error)
+        if v.type_name == "select" and value[:1] not in ("'", '"'):
+            value = "'" + value + "'"
+        v.value = value
+    return block
 
-                    print("Compilation done. Please check '" + css_file + "'.")
 
-                else:
-                    print("Couldn't find compiled CSS file!")
+def parseShared(in_file, use_stylus=False):
+    """ Parses a given user style once for several variants of its variables.
+
+    Parameters:
+    -----------
+    in_file : str
+        The user style file.
+    use_stylus : bool
+        Whether the body is compiled with stylus, it is then not parsed. default is False.
+
+    Returns:
+    -----------
+    Returns a (user_style_block, body) tuple, body being the parsed stylus statements after the UserStyle block,
+    or their source when use_stylus is True."""
+
+    start = time.perf_counter()
+    lines, var_lines = itertools.tee(readLines(in_file))
+    user_style_block = extractVariables(var_lines)
+    if use_stylus:
+        return user_style_block, "".join(constructStylLines(lines))
+    head_lines = "".join(userStyleLines(user_style_block)).count("\n")
+    body = stylc.parseStatements(stylc.splitSource("".join(constructStylLines(lines)), head_lines + 1))
+    log("Parsed '" + in_file + "' in " + str(round((time.perf_counter() - start) * 1000)) + "ms.")
+    return user_style_block, body
+
+
+def compileHeads(user_style_block, body, heads, compress=False, jobs=None, use_stylus=False, worker_command=None,
+                 outputs=None, svg_minifier=None):
+    """ Compiles the shared body with each of the given UserStyle heads in parallel, by a process pool.
+
+    Parameters:
+    -----------
+    user_style_block : Block
+        The UserStyle block the heads were made from, see parseShared.
+    body : list
+        The parsed stylus statements shared by every head, see parseShared.
+    heads : dict
+        Name -> the stylus lines of the variables, see userStyleLines.
+    compress : bool
+        Whether to minify the resulted CSS. default is False.
+    jobs : int
+        The number of worker processes. default is the number of CPUs.
+    use_stylus : bool
+        Whether each worker process compiles with a stylus worker rather than the built-in compiler,
+        body being the stylus source, see parseShared. default is False.
+    worker_command : list of str
+        The command starting the stylus workers. default is node stylus-worker.js.
+    outputs : dict
+        Name -> the outputs of the head, written by the worker processes, see finishHead. optional.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs of the CSS written to the outputs. default is one without a cache.
+
+    Returns:
+    -----------
+    Yields a (name, css, seconds, error) tuple for each head as it is compiled, see presets.compilePreset.
+    When outputs are given css is the list of their results rather than the CSS, see finishHead."""
+
+    global debug
+
+    import presets
+    # imported here as only presets and targets run in processes, which keeps importing this module fast
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # the processes finish and write the CSS as well, the compression of the artifacts taking longer than compiling
+    finish = None
+    if outputs is not None:
+        finish = functools.partial(finishHead, compress=compress, svg_minifier=svg_minifier, verbose=debug)
+    with ProcessPoolExecutor(jobs, initializer=presets.initWorker,
+                             initargs=(body, compress, debug, "darkmode.styl", use_stylus, worker_command,
+                                       finish)) as executor:
+        futures = [executor.submit(presets.compilePreset, name, head, (outputs or {}).get(name))
+                   for name, head in heads.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def finishCss(css, compress=False, svg_minifier=None) -> str:
+    """ Cleans the leftover comments of a given compiled CSS and shortens its data URIs, as build does. """
+
+    global debug
+
+    css_lines = css.splitlines(True)
+    if not debug and not compress:
+        # clean all leftover comments, minified CSS has none
+        css_lines = cleanLeftoverComments(css_lines)
+    return inlineDataUris("".join(css_lines), compress, False, svg_minifier)
+
+
+def finishHead(css, outputs, compress=False, svg_minifier=None, verbose=False) -> list:
+    """ Finishes a compiled CSS (see finishCss) and writes it and its gzip and xz copies to given outputs,
+    in a process of compileHeads. The manifests are not updated, see artifacts.updateManifest.
+
+    Parameters:
+    -----------
+    css : str
+        The compiled CSS.
+    outputs : list of tuple
+        The (css_file, domain) tuples of the files to write, the CSS is wrapped in the @-moz-document rule
+        of their domain, see wrapDomain. Their manifest is the manifest.json of their directory.
+    compress : bool
+        Whether the CSS is minified. default is False.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs of the CSS. default is one without a cache.
+    verbose : bool
+        Whether to keep the comments of the CSS, as in debug mode. default is False.
+
+    Returns:
+    -----------
+    Returns a list of (css_file, entries, written, error) tuples, see artifacts.compressArtifacts,
+    error holding the message if the artifacts could not be written."""
+
+    global debug
+
+    import artifacts
+
+    # the processes do not share the globals of the parent
+    debug = verbose
+    css = finishCss(css, compress, svg_minifier)
+    results = []
+    for css_file, domain in outputs:
+        writeLines(css_file, [wrapDomain(css, domain, compress)])
+        try:
+            entries, written = artifacts.compressArtifacts(css_file, os.path.join(os.path.dirname(css_file),
+                                                                                   "manifest.json"))
+            results.append((css_file, entries, written, None))
+        except OSError as e:
+            results.append((css_file, {}, [], str(e)))
+    return results
+
+
+def collectHead(results) -> dict:
+    """ Reports the results of finishHead.
+
+    Returns:
+    -----------
+    Returns the manifest entries of the written files."""
+
+    entries = {}
+    for css_file, file_entries, written, error in results:
+        reportArtifacts(css_file, written, error)
+        entries.update(file_entries)
+    return entries
+
+
+def buildPresets(in_file, presets_file, compress=False, jobs=None, svg_minifier=None, use_stylus=False,
+                 worker_command=None) -> bool:
+    """ Compiles each preset of the given presets file to build/darkmode.[preset].css.
+
+    The user style is parsed once, the presets are compiled in parallel by a process pool.
+
+    Parameters:
+    -----------
+    in_file : str
+        The user style file.
+    presets_file : str
+        A JSON or TOML file of presets, see presets.loadPresets.
+    compress : bool
+        Whether to minify the resulted CSS. default is False.
+    jobs : int
+        The number of worker processes. default is the number of CPUs.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs of the CSS. default is one without a cache.
+    use_stylus : bool
+        Whether to compile with stylus, by a stylus worker in each process, see compileHeads. default is False.
+    worker_command : list of str
+        The command starting the stylus workers. default is node stylus-worker.js.
+
+    Returns:
+    -----------
+    Returns True if every preset was compiled False otherwise."""
+
+    import artifacts
+    import presets
+    import svgmin
+
+    try:
+        preset_map = presets.loadPresets(presets_file)
+    except (OSError, ValueError) as e:
+        print("Cannot load presets from '" + presets_file + "': " + str(e))
+        return False
+
+    out_dir = "build"
+    start = time.perf_counter()
+    svg_minifier = svg_minifier or svgmin.SvgMinifier()
+
+    # parsing the file once, every preset shares the stylus lines after the UserStyle block
+    user_style_block, body = parseShared(in_file, use_stylus)
+
+    heads = {}
+    ok = True
+    for name, overrides in preset_map.items():
+        try:
+            heads[name] = "".join(userStyleLines(overrideVariables(user_style_block, overrides)))
+        except KeyError as e:
+            print("Unknown variable " + str(e) + " in preset '" + name + "'.")
+            ok = False
+        except ValueError as e:
+            print("Invalid value of " + str(e) + " in preset '" + name + "'.")
+            ok = False
+
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = {name: [(os.path.join(out_dir, "darkmode." + name + ".css"), "none")] for name in heads}
+    entries = {}
+    cpu_time = 0
+    for name, results, seconds, error in compileHeads(user_style_block, body, heads, compress, jobs, use_stylus,
+                                                      worker_command, outputs, svg_minifier):
+        cpu_time += seconds
+        if results is None:
+            print("  " + name + ": " + error)
+            ok = False
+            continue
+
+        entries.update(collectHead(results))
+        print("  compiled " + outputs[name][0][0] + " in " + str(round(seconds * 1000)) + "ms")
+    if entries:
+        artifacts.updateManifest(os.path.join(out_dir, "manifest.json"), entries)
+
+    wall_time = time.perf_counter() - start
+    print(str(len(heads)) + " presets compiled in " + str(round(wall_time * 1000)) + "ms, " +
+          str(round(cpu_time * 1000)) + "ms of compile time (" + str(round(cpu_time / wall_time, 1)) + "x).")
+    return ok
+
+
+def sourceDomain(in_file) -> str:
+    """ Gets the domain of the @-moz-document rule of a given user style, None if it has none. """
+
+    for line in readLines(in_file):
+        match = domain_re.match(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+def domainSlug(domain) -> str:
+    """ Gets the part of an output file name of a given domain target, e.g. web.telegram.org/k -> web.telegram.org-k. """
+
+    return "-".join(part for part in domain.replace("\\", "/").split("/") if part) or "none"
+
+
+def wrapDomain(css, domain, compress=False) -> str:
+    """ Wraps a given CSS in the @-moz-document rule of a given domain target.
+
+    A target with a path (web.telegram.org/k) becomes a url-prefix() of its https URL and a bare
+    domain becomes a domain(). The target 'none' leaves the CSS unwrapped, for Franz/Ferdi."""
+
+    if domain == "none":
+        return css
+    if "/" in domain:
+        condition = 'url-prefix("https://' + domain.strip("/") + '/")'
+    else:
+        condition = 'domain("' + domain + '")'
+    if compress:
+        return "@-moz-document " + condition + "{" + css + "}"
+    return "@-moz-document " + condition + " {\n" + css + ("" if css.endswith("\n") else "\n") + "}\n"
+
+
+def parseTargets(spec, user_style_block, default_domain):
+    """ Parses a given --targets value, [browsers][:domains] of comma separated values.
+
+    Browsers are values of the browser select variable, '*' or none meaning all of its options.
+    Domains are domains or URL prefixes without the scheme (web.telegram.org/k), none meaning the
+    domain of the user style and 'none' meaning no @-moz-document rule.
+
+    Returns:
+    -----------
+    Returns a (browsers, domains) tuple of lists. Raises ValueError if a browser is not an option."""
+
+    from userstyle import Var
+
+    browsers_part, _, domains_part = spec.partition(":")
+    variable = next((v for v in user_style_block.body if isinstance(v, Var) and v.var_name == browser_variable), None)
+    if variable is None:
+        raise ValueError("the user style has no '" + browser_variable + "' variable")
+    options = [value for _, value in variable.options or []]
+
+    browsers = [b.strip() for b in browsers_part.split(",") if b.strip() and b.strip() != "*"] or options
+    for browser in browsers:
+        if browser not in options:
+            raise ValueError("'" + browser + "' is not one of " + ", ".join(options))
+    domains = [d.strip() for d in domains_part.split(",") if d.strip()] or [default_domain or "none"]
+    return list(dict.fromkeys(browsers)), list(dict.fromkeys(domains))
+
+
+def buildTargets(in_file, spec, compress=False, jobs=None, svg_minifier=None, use_stylus=False,
+                 worker_command=None) -> bool:
+    """ Compiles every browser x domain target of a given --targets value to
+    build/targets/darkmode.[browser].[domain].css, see parseTargets.
+
+    The user style is parsed once and each browser is compiled once, in parallel by a process pool.
+    The domain targets of a browser share its compiled CSS, only their @-moz-document rule differs.
+
+    Parameters:
+    -----------
+    in_file : str
+        The user style file.
+    spec : str
+        The targets, see parseTargets.
+    compress : bool
+        Whether to minify the resulted CSS. default is False.
+    jobs : int
+        The number of worker processes. default is the number of CPUs.
+    svg_minifier : svgmin.SvgMinifier
+        The minifier of the SVGs of the CSS. default is one without a cache.
+    use_stylus : bool
+        Whether to compile with stylus, by a stylus worker in each process, see compileHeads. default is False.
+    worker_command : list of str
+        The command starting the stylus workers. default is node stylus-worker.js.
+
+    Returns:
+    -----------
+    Returns True if every target was compiled False otherwise."""
+
+    import artifacts
+    import svgmin
+
+    out_dir = os.path.join("build", "targets")
+    start = time.perf_counter()
+    svg_minifier = svg_minifier or svgmin.SvgMinifier()
+
+    user_style_block, body = parseShared(in_file, use_stylus)
+    try:
+        browsers, domains = parseTargets(spec, user_style_block, sourceDomain(in_file))
+    except ValueError as e:
+        print("Invalid targets '" + spec + "': " + str(e))
+        return False
+
+    heads = {b: "".join(userStyleLines(overrideVariables(user_style_block, {browser_variable: b}))) for b in browsers}
+
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = {b: [(os.path.join(out_dir, "darkmode." + b + "." + domainSlug(d) + ".css"), d) for d in domains]
+               for b in browsers}
+    entries = {}
+    ok = True
+    cpu_time = 0
+    for browser, results, seconds, error in compileHeads(user_style_block, body, heads, compress, jobs, use_stylus,
+                                                         worker_command, outputs, svg_minifier):
+        cpu_time += seconds
+        if results is None:
+            print("  " + browser + ": " + error)
+            ok = False
+            continue
+
+        entries.update(collectHead(results))
+        for css_file, _ in outputs[browser]:
+            print("  compiled " + css_file)
+        log("  " + browser + " compiled in " + str(round(seconds * 1000)) + "ms")
+    if entries:
+        artifacts.updateManifest(os.path.join(out_dir, "manifest.json"), entries)
+
+    wall_time = time.perf_counter() - start
+    print(str(len(browsers) * len(domains)) + " targets (" + str(len(browsers)) + " browsers x " + str(len(domains)) +
+          " domains) compiled in " + str(round(wall_time * 1000)) + "ms, " + str(round(cpu_time * 1000)) +
+          "ms of compile time (" + str(round(cpu_time / wall_time, 1)) + "x).")
+    return ok
+
+
+def main():
+    """ Runs the command line interface, see help_msg. """
+
+    global debug
+    global stage_profiler
+
+    import buildcache
+    import svgmin
+
+    # check if the debug argument was given
+    debug = "--debug" in sys.argv or "-d" in sys.argv or "/d" in sys.argv
+
+    # check if the compress argument was given
+    c = "--compress" in sys.argv or "-c" in sys.argv or "/c" in sys.argv
+
+    # check if the ignoreversionstring argument was given
+    nv = "--noversionstring" in sys.argv or "-nv" in sys.argv or "/nv" in sys.argv
+
+    # check if the sync argument was given
+    s = "--sync" in sys.argv or "-s" in sys.argv or "/s" in sys.argv
+
+    # check if the timestamp argument was given
+    t = "--timestamp" in sys.argv or "-t" in sys.argv or "/t" in sys.argv
+
+    # check if the help argument was given
+    h = "--help" in sys.argv or "-h" in sys.argv or "/h" in sys.argv
+
+    # check if the stylus argument was given
+    st = "--stylus" in sys.argv or "-st" in sys.argv or "/st" in sys.argv
+
+    # check if the stylus worker or worker command arguments were given
+    wc = getArgValue(("--worker-command", "-wc", "/wc"))
+    sw = wc is not None or "--stylus-worker" in sys.argv or "-sw" in sys.argv or "/sw" in sys.argv
+
+    # check if the watch argument was given
+    w = "--watch" in sys.argv or "-w" in sys.argv or "/w" in sys.argv
+
+    # check if the nocache argument was given
+    nc = "--no-cache" in sys.argv or "-nc" in sys.argv or "/nc" in sys.argv
+
+    # check if the presets argument was given
+    p = getArgValue(("--presets", "-p", "/p"))
+
+    # check if the targets argument was given
+    tg = getArgValue(("--targets", "-tg", "/tg"))
+
+    # check if the jobs argument was given
+    j = getArgValue(("--jobs", "-j", "/j"))
+
+    # check if the sprite argument was given
+    sp = "--sprite" in sys.argv or "-sp" in sys.argv or "/sp" in sys.argv
+
+    # check if the prune argument was given
+    pn = getArgValue(("--prune", "-pn", "/pn"))
+
+    # check if the allow argument was given
+    al = getArgValue(("--allow", "-al", "/al"))
+
+    # check if the optimize or optimize check arguments were given
+    oc = "--optimize-check" in sys.argv or "-oc" in sys.argv or "/oc" in sys.argv
+    op = oc or "--optimize" in sys.argv or "-op" in sys.argv or "/op" in sys.argv
+
+    # check if the split argument was given
+    sl = "--split" in sys.argv or "-sl" in sys.argv or "/sl" in sys.argv
+
+    # check if the split rules argument was given
+    sr = getArgValue(("--split-rules", "-sr", "/sr"))
+
+    # check if the themable argument was given
+    th = "--themable" in sys.argv or "-th" in sys.argv or "/th" in sys.argv
+
+    # check if the analyze argument was given
+    az = "--analyze" in sys.argv or "-az" in sys.argv or "/az" in sys.argv
+
+    # check if the fold argument was given
+    fo = "--fold" in sys.argv or "-fo" in sys.argv or "/fo" in sys.argv
+
+    # check if the depends argument was given
+    dp = getArgValue(("--depends", "-dp", "/dp"))
+
+    # check if the serve argument was given
+    sv = getArgValue(("--serve", "-sv", "/sv"))
+
+    # check if the delta or patch arguments were given, these only handle compiled CSS files
+    dl = getArgValues(("--delta", "-dl", "/dl"), 3)
+    pa = getArgValues(("--patch", "-pa", "/pa"), 3)
+    if dl is not None or pa is not None:
+        ok = writeCssDelta(*dl) if dl is not None else applyCssDelta(*pa)
+        if not ok:
+            sys.exit(1)
+        return
+
+    # check if the profile argument was given
+    pr = "--profile" in sys.argv or "-pr" in sys.argv or "/pr" in sys.argv
+    if pr:
+        import profiler
+        stage_profiler = profiler.Profiler()
+
+    if not nv:
+        with stage("version"):
+            generateVersionString(user_styl_file)
+            generateVersionString(user_css_file)
+
+    # check if Dark-Telegram.user.styl and Dark-Telegram.user.css are synced and sync them if they don't
+    synced = False
+    if s or not h:
+        with stage("sync"):
+            synced = checkStylCss(t)
+
+    if h and not s:
+        print(help_msg)
+
+    elif synced and not s:
+
+        # the build cache is not used in debug mode as we want to see everything
+        cache = None
+        svg_cache = None
+        graph_cache = None
+        if not nc and not debug:
+            cache = buildcache.BuildCache()
+            svg_cache = buildcache.BuildCache(os.path.join(".buildcache", "svg"), suffix=".svg")
+            graph_cache = buildcache.BuildCache(os.path.join(".buildcache", "graph"), 8 * 1024 * 1024, ".pickle")
+        svg_minifier = svgmin.SvgMinifier(svg_cache)
+
+        arg_file = user_styl_file
+        worker_command = None
+        if wc is not None:
+            import shlex
+            worker_command = shlex.split(wc)
+        if os.path.isfile(arg_file):
+            if arg_file.endswith('.styl') and sv is not None:
+                import server
+                server.serve(arg_file, compile_style, int(sv))
+            elif arg_file.endswith('.styl') and dp is not None:
+                printDependents(arg_file, dp)
+            elif arg_file.endswith('.styl') and tg is not None:
+                with stage("targets"):
+                    buildTargets(arg_file, tg, c, int(j) if j else None, svg_minifier, st or sw, worker_command)
+            elif arg_file.endswith('.styl') and p is not None:
+                if sp:
+                    with stage("sprite"):
+                        buildSprite(svg_minifier)
+                with stage("presets"):
+                    buildPresets(arg_file, p, c, int(j) if j else None, svg_minifier, st or sw, worker_command)
+            elif arg_file.endswith('.styl'):
+                pruner = None
+                if pn is not None:
+                    pruner = loadPruner(pn, al)
+                    if pruner is None:
+                        sys.exit(1)
+                splitter = None
+                if sl or sr is not None:
+                    import critical
+                    try:
+                        splitter = critical.CssSplitter(critical.loadRules(sr))
+                    except (OSError, ValueError) as e:
+                        print("Cannot load the split rules: " + str(e))
+                        sys.exit(1)
+                optimizer = None
+                if op:
+                    import cssopt
+                    optimizer = cssopt.CssOptimizer(oc)
+                themer = None
+                if th:
+                    import themable
+                    themer = themable.Themer()
+                stylus_worker = None
+                if sw:
+                    import stylusworker
+                    stylus_worker = stylusworker.StylusWorker(worker_command)
+                context = BuildContext(arg_file, c, st, cache, svg_minifier, sp, pruner, splitter, graph_cache,
+                                       optimizer, az, themer, stylus_worker, fo)
+                try:
+                    built = build(context)
+                    # watch mode runs until interrupted so the profile covers the first build only
+                    writeProfile()
+                    if built and w:
+                        watch(context, t)
+                finally:
+                    if stylus_worker is not None:
+                        stylus_worker.close()
             else:
-                print("Couldn't compile styl file.")
+                print("Not a styl file.")
+                print(help_msg)
         else:
-            print("Not a styl file.")
+            print("Not a valid file " + arg_file)
             print(help_msg)
-    else:
-        print("Not a valid file " + arg_file)
+    elif not s:
+        print("Sync error. Make sure you have at least 'Dark-Telegram.user.styl' or 'Dark-Telegram.user.css' file.")
         print(help_msg)
-else:
-    print("Sync error. Make sure you have at least 'Dark-Telegram.user.styl' or 'Dark-Telegram.user.css' file.")
-    print(help_msg)
+
+    writeProfile()
+
+
+if __name__ == "__main__":
+    main()
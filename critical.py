@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Critical / deferred CSS split for compile.py
+
+Splits a compiled stylesheet into a small critical chunk, holding the
+declarations needed for the first paint to be dark (colours, backgrounds
+and layout widths), and a deferred chunk holding everything else (icons,
+animations, transitions and other extras) to be injected right after it.
+
+Declarations are split by property, with the same selectors and at-rule
+context in both chunks and in their original order. Declarations whose
+values use images (url(), the --dt-img-* data URIs) are deferred whatever
+their property, as are the rules of some selectors. As the deferred chunk
+is loaded last, a deferred declaration would override the later critical
+declarations of the same selector whose property it sets (background sets
+background-color, border-top sets border-color), so these are written to
+both chunks. The split rules can be given as a JSON file overriding
+DEFAULT_RULES. """
+
+
+import re
+import json
+import fnmatch
+
+import cssdelta
+
+
+# the default split rules, patterns use * and ? wildcards
+DEFAULT_RULES = {
+    # properties kept in the critical chunk
+    "critical_properties": [
+        "color", "background", "background-color", "border*color", "outline-color", "caret-color",
+        "fill", "stroke", "box-shadow", "text-shadow", "scrollbar*color", "color-scheme",
+        "width", "min-width", "max-width", "--*",
+    ],
+    # values deferring their declarations whatever their property, as substrings
+    "deferred_values": ["url(", "var(--dt-img-", "gradient("],
+    # selectors whose rules are deferred as a whole
+    "deferred_selectors": ["*:hover*", "*::-webkit-scrollbar*", "*emoji*", "*sticker*"],
+    # at-rules kept in the critical chunk, other at-rules such as @keyframes or @font-face are deferred
+    "critical_at_rules": ["@charset", "@import", "@namespace"],
+}
+
+# the parts of property names naming a side, see sets
+SIDES = {"top", "right", "bottom", "left"}
+LOGICAL_SIDES = {"block", "inline", "start", "end"}
+
+whitespace_re = re.compile(r"\s*")
+
+
+def loadRules(in_file=None) -> dict:
+    """ Loads the split rules of a given JSON file, the keys it does not have keep their default.
+
+    Returns:
+    -----------
+    Returns the rules dict. Raises OSError or ValueError if the file can not be read."""
+
+    rules = {k: list(v) for k, v in DEFAULT_RULES.items()}
+    if in_file is None:
+        return rules
+    with open(in_file, 'r') as read_obj:
+        loaded = json.load(read_obj)
+    if not isinstance(loaded, dict):
+        raise ValueError("the split rules should be a JSON object")
+    for key, value in loaded.items():
+        if key not in DEFAULT_RULES:
+            raise ValueError("unknown split rule '" + key + "'")
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError("the split rule '" + key + "' should be a list of strings")
+        rules[key] = value
+    return rules
+
+
+def sets(prop, other) -> bool:
+    """ Whether a declaration of a given property may set a given other property, e.g. background and
+    border-top set background-color and border-color, background-image and border-bottom do not. """
+
+    if prop == other or cssdelta.family(prop) == "*":
+        return True
+    if prop.startswith("--") or other.startswith("--") or cssdelta.family(prop) != cssdelta.family(other):
+        return False
+    # the parts after the family, a shorthand has none of a kind, logical sides (inline...) may be any side
+    first, second = (set(cssdelta.vendor_re.sub("", p, 1).split("-")[1:]) for p in (prop, other))
+    sides = SIDES | LOGICAL_SIDES
+    first_sides, second_sides = first & sides, second & sides
+    first, second = first - sides, second - sides
+    return (not first_sides or not second_sides or bool(first_sides & second_sides) or
+            bool((first_sides | second_sides) & LOGICAL_SIDES)) and (not first or not second or bool(first & second))
+
+
+class CssSplitter:
+    """
+    Used to split compiled stylesheets into critical and deferred chunks.
+
+    Parameters
+    ----------
+    rules : dict
+        The split rules, see DEFAULT_RULES and loadRules. (default DEFAULT_RULES)
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules or loadRules()
+        self.critical_re = self.pattern("critical_properties")
+        self.selector_re = self.pattern("deferred_selectors")
+        self.at_rule_re = self.pattern("critical_at_rules")
+
+    def pattern(self, name):
+        """ Gets the regex matching any of the patterns of a given rule. """
+
+        return re.compile("|".join(fnmatch.translate(p) for p in self.rules[name]) or "(?!)")
+
+    def isCritical(self, prop, text) -> bool:
+        """ Whether a declaration of a given property and text belongs to the critical chunk. """
+
+        return bool(self.critical_re.match(prop)) and not any(v in text for v in self.rules["deferred_values"])
+
+    def splitRule(self, text, deferred_properties=None):
+        """ Splits the text of a given style rule.
+
+        Parameters:
+        -----------
+        text : str
+            The text of the rule.
+        deferred_properties : dict
+            Selector -> the properties of its deferred declarations before the rule, the ones of the rule are
+            added to it. A critical declaration of a property they may set (see sets) is written to both
+            chunks so the deferred chunk does not override it. optional.
+
+        Returns:
+        -----------
+        Returns a (critical, deferred) tuple of texts, empty when the rule has no declarations of that chunk."""
+
+        deferred_properties = {} if deferred_properties is None else deferred_properties
+        start = len(whitespace_re.match(text).group(0))
+        brace = text.index("{", start)
+        closing = cssdelta.matchBrace(text, brace)
+        selector = cssdelta.normalKey(text[start:brace])
+        selectors = [cssdelta.normalKey(s) for _, s in cssdelta.splitSelectors(text[start:brace])]
+        head, body, end = text[:brace + 1], text[brace + 1:closing], text[closing:]
+        declarations = cssdelta.splitDeclarations(body)
+        if self.selector_re.match(selector):
+            for s in selectors:
+                deferred_properties.setdefault(s, set()).update(prop for prop, _ in declarations if prop is not None)
+            return "", text
+
+        critical = []
+        deferred = []
+        for prop, declaration in declarations:
+            if prop is None:
+                critical.append(declaration)
+                deferred.append(declaration)
+            elif self.isCritical(prop, declaration):
+                critical.append(declaration)
+                if any(sets(p, prop) for s in selectors for p in deferred_properties.get(s, ())):
+                    deferred.append(declaration)
+            else:
+                deferred.append(declaration)
+                for s in selectors:
+                    deferred_properties.setdefault(s, set()).add(prop)
+
+        def chunk(declarations):
+            return head + "".join(declarations) + end if any(d.strip() for d in declarations) else ""
+        return chunk(critical), chunk(deferred)
+
+    def split(self, css):
+        """ Splits a given stylesheet into its critical and deferred chunks. Grouping at-rules (@media...)
+        are kept in the chunks where they have rules.
+
+        Returns:
+        -----------
+        Returns a (critical, deferred) tuple of stylesheets."""
+
+        chunks = ([], [])
+        groups = ([], [])
+        deferred_properties = {}
+        for rule in cssdelta.splitRules(css):
+            if rule.kind == "rule":
+                parts = self.splitRule(rule.text, deferred_properties)
+            elif rule.kind == "at-rule" and self.at_rule_re.match(rule.key.rsplit(" > ", 1)[-1].split(" ", 1)[0]):
+                parts = (rule.text, "")
+            elif rule.kind == "at-rule":
+                parts = ("", rule.text)
+            else:
+                # the opening and closing of grouping at-rules and the text after the last rule
+                parts = (rule.text, rule.text)
+
+            for out, group, text in zip(chunks, groups, parts):
+                if rule.kind == "open":
+                    group.append([len(out), False])
+                    out.append(text)
+                elif rule.kind == "close":
+                    opening, kept = group.pop()
+                    if kept:
+                        out.append(text)
+                        if group:
+                            group[-1][1] = True
+                    else:
+                        del out[opening:]
+                elif text:
+                    out.append(text)
+                    if group:
+                        group[-1][1] = True
+        return "".join(chunks[0]), "".join(chunks[1])
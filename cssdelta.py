@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Rule level deltas for compile.py
+
+Splits compiled stylesheets (plain or minified) into rules keyed by their
+selector within their at-rule context (e.g. '@media (max-width:600px) > .a'),
+and describes a new stylesheet as runs of the rules of an old one plus the
+rules that were added or changed. Applying the delta to the old stylesheet
+rebuilds the new one byte for byte, which is checked by SHA-256 hashes.
+
+The splitting of rules into selectors and declarations and the property
+families are shared by prune, critical and cssopt. """
+
+
+import re
+import json
+import hashlib
+import difflib
+
+
+DELTA_FORMAT = 1
+
+# the at-rules holding rules rather than declarations, their rules get their own keys
+GROUP_AT_RULES = ("@media", "@supports", "@document", "@-moz-document", "@layer", "@container")
+
+# the property name prefixes whose shorthands set other prefixes as well, e.g. font sets line-height
+FAMILY_ALIASES = {
+    "top": "inset", "right": "inset", "bottom": "inset", "left": "inset",
+    "line": "font",
+    "row": "gap", "column": "gap", "columns": "gap",
+    "align": "place", "justify": "place",
+    "all": "*",
+}
+
+whitespace_re = re.compile(r"\s+")
+comment_re = re.compile(r"/\*.*?\*/", re.DOTALL)
+leading_re = re.compile(r"(?:\s|/\*.*?\*/)*", re.DOTALL)
+special_re = re.compile(r"[\"'/();]")
+vendor_re = re.compile(r"(?<![\w-])-(?:webkit|moz|ms|o)-")
+
+
+class Rule:
+    """
+    Used to represent a chunk of a stylesheet. The chunks of a stylesheet add up to its exact text.
+
+    Parameters
+    ----------
+    key : str
+        The selector or at-rule prelude within its context, unique within the stylesheet.
+    text : str
+        The text of the chunk, including the whitespace and comments before it.
+    kind : str
+        'rule' for style rules, 'at-rule' for other rules (@font-face, @import...), 'open' and 'close'
+        for the opening and closing of grouping at-rules and 'text' for the text after the last rule.
+    """
+
+    __slots__ = ("key", "text", "kind", "digest")
+
+    def __init__(self, key, text, kind="rule"):
+        self.key = key
+        self.text = text
+        self.kind = kind
+        self.digest = hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def skipString(css, i) -> int:
+    """ Gets the index after the string starting at a given index. """
+
+    quote = css[i]
+    i += 1
+    while True:
+        end = css.find(quote, i)
+        if end < 0:
+            return len(css) + 1
+        # the quote is escaped by an odd number of backslashes before it
+        backslashes = end - i - len(css[i:end].rstrip("\\"))
+        if backslashes % 2 == 0:
+            return end + 1
+        i = end + 1
+
+
+def skipComment(css, i) -> int:
+    """ Gets the index after the comment starting at a given index. """
+
+    end = css.find("*/", i + 2)
+    return len(css) if end < 0 else end + 2
+
+
+def matchBrace(css, i) -> int:
+    """ Gets the index of the brace closing the one at a given index. """
+
+    depth = 0
+    while i < len(css):
+        c = css[i]
+        if c in "\"'":
+            i = skipString(css, i)
+            continue
+        if c == "/" and css.startswith("/*", i):
+            i = skipComment(css, i)
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(css) - 1
+
+
+def normalKey(prelude) -> str:
+    """ Gets the key of a given selector or at-rule prelude, without comments and redundant whitespace. """
+
+    return whitespace_re.sub(" ", comment_re.sub("", prelude)).strip()
+
+
+def splitSelectors(prelude) -> list:
+    """ Splits a given selector list on its top level commas.
+
+    Returns:
+    -----------
+    Returns a list of (separator, selector) tuples, separator being the comma and whitespace before
+    the selector, empty for the first one."""
+
+    items = []
+    depth = 0
+    start = 0
+    separator = ""
+    i = 0
+    while i < len(prelude):
+        c = prelude[i]
+        if c in "\"'":
+            i = skipString(prelude, i)
+            continue
+        if c == "\\":
+            i += 2
+            continue
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            items.append((separator, prelude[start:i]))
+            end = i + 1
+            while end < len(prelude) and prelude[end].isspace():
+                end += 1
+            separator = prelude[i:end]
+            start = i = end
+            continue
+        i += 1
+    items.append((separator, prelude[start:]))
+    return items
+
+
+def splitDeclarations(body) -> list:
+    """ Splits the body of a rule, between its braces, on its top level semicolons.
+
+    Returns:
+    -----------
+    Returns a list of (property, text) tuples whose texts add up to the body. Each text holds the
+    whitespace before its declaration and its semicolon, the whitespace after the last declaration
+    is a last item of property None."""
+
+    items = []
+    depth = 0
+    start = 0
+    i = 0
+    while True:
+        # jumping to the next character that matters
+        match = special_re.search(body, i)
+        if match is None:
+            break
+        i = match.start()
+        c = body[i]
+        if c in "\"'":
+            i = skipString(body, i)
+            continue
+        if c == "/" and body.startswith("/*", i):
+            i = skipComment(body, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == ";" and depth == 0:
+            items.append(body[start:i + 1])
+            start = i + 1
+        i += 1
+    tail = body[start:]
+    if tail.strip():
+        # the last declaration of minified rules has no semicolon
+        items.append(tail)
+        tail = ""
+
+    declarations = [(normalKey(text).split(":", 1)[0].strip().lower(), text) for text in items]
+    if tail:
+        declarations.append((None, tail))
+    return declarations
+
+
+def family(prop) -> str:
+    """ Gets the family of a given property, the properties of a family may set each other.
+    Custom properties are their own family, 'all' is of family '*' which sets every property. """
+
+    if prop.startswith("--"):
+        return prop
+    base = vendor_re.sub("", prop, 1).split("-", 1)[0]
+    return FAMILY_ALIASES.get(base, base)
+
+
+def splitRules(css) -> list:
+    """ Splits a given stylesheet into rules.
+
+    Rules within grouping at-rules (@media, @supports...) are keyed within them, the opening and
+    closing of these at-rules are rules as well. Other at-rules (@keyframes, @font-face...) are
+    single rules. Repeated keys are numbered, e.g. '.a', '.a #2'.
+
+    Returns:
+    -----------
+    Returns a list of Rule whose texts add up to the given stylesheet."""
+
+    rules = []
+    counts = {}
+    context = []
+    start = 0
+    i = 0
+
+    def add(key, end, kind):
+        nonlocal start
+        key = " > ".join(context + [key])
+        counts[key] = counts.get(key, 0) + 1
+        if counts[key] > 1:
+            key += " #" + str(counts[key])
+        rules.append(Rule(key, css[start:end], kind))
+        start = end
+
+    while i < len(css):
+        c = css[i]
+        if c in "\"'":
+            i = skipString(css, i)
+            continue
+        if c == "/" and css.startswith("/*", i):
+            i = skipComment(css, i)
+            continue
+
+        if c == "{":
+            prelude = normalKey(css[start:i])
+            if prelude.split(" ", 1)[0].split("(", 1)[0].lower() in GROUP_AT_RULES:
+                add(prelude + " {", i + 1, "open")
+                context.append(prelude)
+            else:
+                i = matchBrace(css, i)
+                add(prelude, i + 1, "at-rule" if prelude.startswith("@") else "rule")
+        elif c == "}" and context:
+            add("}", i + 1, "close")
+            context.pop()
+        elif c == ";" and normalKey(css[start:i]).startswith("@"):
+            # statement at-rules such as @import or @charset
+            add(normalKey(css[start:i]), i + 1, "at-rule")
+        i += 1
+
+    if start < len(css):
+        add("", len(css), "text")
+    return rules
+
+
+def textHash(text) -> str:
+    """ Gets the SHA-256 hash of a given text. """
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def makeDelta(old_css, new_css) -> dict:
+    """ Creates the delta turning a given stylesheet into another.
+
+    The delta is a JSON object holding the hashes of both stylesheets, the keys of the removed
+    rules and a list of operations rebuilding the new stylesheet: ["=", index, count] copies count
+    rules of the old stylesheet starting at index and ["+", key, text] adds a rule.
+
+    When the delta would be larger than the new stylesheet, e.g. from a plain stylesheet to a minified one,
+    and than a delta adding the whole new stylesheet as a single rule of an empty key, the latter is returned
+    and marked "full".
+
+    Returns:
+    -----------
+    Returns the delta as a dict."""
+
+    old_rules = splitRules(old_css)
+    new_rules = splitRules(new_css)
+
+    matcher = difflib.SequenceMatcher(None, [r.digest for r in old_rules], [r.digest for r in new_rules], False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2 - i1])
+        else:
+            ops.extend(["+", r.key, r.text] for r in new_rules[j1:j2])
+
+    new_keys = set(r.key for r in new_rules)
+    delta = {
+        "format": DELTA_FORMAT,
+        "from": textHash(old_css),
+        "to": textHash(new_css),
+        "removed": [r.key for r in old_rules if r.key not in new_keys],
+        "ops": ops,
+    }
+    size = len(dumpDelta(delta).encode())
+    if size > len(new_css.encode()):
+        full = dict(delta, ops=[["+", "", new_css]], full=True)
+        if len(dumpDelta(full).encode()) < size:
+            return full
+    return delta
+
+
+def applyDelta(old_css, delta) -> str:
+    """ Applies a given delta to the stylesheet it was made from.
+
+    Returns:
+    -----------
+    Returns the new stylesheet. Raises ValueError if the delta is not of the given stylesheet
+    or does not rebuild the stylesheet it was made to."""
+
+    if delta.get("format") != DELTA_FORMAT:
+        raise ValueError("unsupported delta format " + str(delta.get("format")))
+    if textHash(old_css) != delta["from"]:
+        raise ValueError("the delta was not made from this stylesheet")
+
+    old_rules = splitRules(old_css)
+    parts = []
+    for op in delta["ops"]:
+        if op[0] == "=":
+            parts.extend(r.text for r in old_rules[op[1]:op[1] + op[2]])
+        elif op[0] == "+":
+            parts.append(op[2])
+        else:
+            raise ValueError("unknown delta operation " + repr(op[0]))
+
+    new_css = "".join(parts)
+    if textHash(new_css) != delta["to"]:
+        raise ValueError("the delta did not rebuild the expected stylesheet")
+    return new_css
+
+
+def deltaStats(old_css, delta) -> dict:
+    """ Counts the added, removed, changed and unchanged rules of a given delta of a given stylesheet. """
+
+    old_keys = set(r.key for r in splitRules(old_css))
+    added = changed = unchanged = 0
+    if delta.get("full"):
+        # every rule of the new stylesheet is sent again
+        for op in delta["ops"]:
+            for rule in splitRules(op[2]):
+                if rule.kind in ("rule", "at-rule") and rule.key in old_keys:
+                    changed += 1
+                elif rule.kind in ("rule", "at-rule"):
+                    added += 1
+        return {"added": added, "removed": len(delta["removed"]), "changed": changed, "unchanged": unchanged}
+    for op in delta["ops"]:
+        if op[0] == "=":
+            unchanged += op[2]
+        elif op[1] in old_keys:
+            changed += 1
+        else:
+            added += 1
+    return {"added": added, "removed": len(delta["removed"]), "changed": changed, "unchanged": unchanged}
+
+
+def dumpDelta(delta) -> str:
+    """ Gets the compact JSON text of a given delta. """
+
+    return json.dumps(delta, separators=(",", ":"), ensure_ascii=False)
+
+
+def summary(old_css, new_css, delta, limit=10) -> str:
+    """ Gets a human readable summary of a given delta, listing up to limit rules of each kind. """
+
+    stats = deltaStats(old_css, delta)
+    size = len(dumpDelta(delta).encode())
+    lines = ["{added:,} rules added, {removed:,} removed, {changed:,} changed, {unchanged:,} unchanged.".format(**stats),
+             "delta {:,} bytes, {:.1f}% of the new stylesheet's {:,} bytes.".format(
+                 size, size * 100 / max(len(new_css.encode()), 1), len(new_css.encode()))]
+    if delta.get("full"):
+        lines.append("The rule level delta was larger, the delta replaces the stylesheet as a whole.")
+        return "\n".join(lines)
+
+    old_keys = set(r.key for r in splitRules(old_css))
+    kinds = (("+", [op[1] for op in delta["ops"] if op[0] == "+" and op[1] not in old_keys]),
+             ("~", [op[1] for op in delta["ops"] if op[0] == "+" and op[1] in old_keys]),
+             ("-", delta["removed"]))
+    for sign, keys in kinds:
+        keys = [k for k in keys if k]
+        for key in keys[:limit]:
+            lines.append("  " + sign + " " + (key if len(key) <= 100 else key[:97] + "..."))
+        if len(keys) > limit:
+            lines.append("  " + sign + " ... and " + "{:,}".format(len(keys) - limit) + " more")
+    return "\n".join(lines)
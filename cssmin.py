@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" CSS minifier for compile.py
+
+A small streaming CSS tokenizer and minifier. Strips whitespace and comments
+(keeping the UserStyle comment and /*! comments), shortens hex colours,
+drops the unit of zero lengths, the leading zero of fractions and the last
+semicolon of each block, and normalises !important.
+The output only depends on the input so it is deterministic. """
+
+
+import re
+
+
+token_re = re.compile(r"""
+    (?P<comment>/\*.*?\*/)
+  | (?P<ws>\s+)
+  | (?P<str>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<url>url\(\s*(?:"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|[^)"'\s]*)\s*\))
+  | (?P<num>[+-]?(?:\d*\.\d+|\d+)(?:e[+-]?\d+)?(?:%|[a-zA-Z]+)?)
+  | (?P<hash>\#[\w-]+)
+  | (?P<ident>(?:--|-?[a-zA-Z_])[\w-]*)
+  | (?P<char>.)
+""", re.X | re.S | re.I)
+
+number_re = re.compile(r"^([+-]?)(\d*)(?:\.(\d+))?(e[+-]?\d+)?(%|[a-zA-Z]+)?$", re.I)
+hex_re = re.compile(r"^#[0-9a-fA-F]{3}(?:[0-9a-fA-F]{3})?$")
+
+# units a zero can be written without
+LENGTH_UNITS = ("px", "em", "rem", "ex", "ch", "vw", "vh", "vmin", "vmax", "cm", "mm", "q", "in", "pt", "pc")
+
+# functions whose arguments must keep their units and spacing
+MATH_FUNCTIONS = ("calc", "-webkit-calc", "-moz-calc", "min", "max", "clamp")
+
+# at-rules whose blocks hold rules rather than declarations
+GROUP_AT_RULES = ("media", "supports", "document", "-moz-document", "layer", "container", "keyframes",
+                  "-webkit-keyframes", "-moz-keyframes", "-o-keyframes")
+
+# characters whitespace is never needed around
+NO_SPACE_AFTER = "{};,(:!"
+NO_SPACE_BEFORE = "{};,)!"
+
+
+def tokenize(chunks):
+    """ Splits the given CSS text chunks into (kind, text) tokens.
+
+    Tokens spanning several chunks are joined, so the CSS can be given line by line.
+
+    Parameters:
+    -----------
+    chunks : iterable of str
+        The CSS text. Can be a generator.
+
+    Returns:
+    -----------
+    Yields (kind, text) tuples where kind is comment, ws, str, url, num, hash, ident or char."""
+
+    buf = ""
+    chunks = iter(chunks)
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+        else:
+            buf += chunk
+
+        pos = 0
+        n = len(buf)
+        while pos < n:
+            m = token_re.match(buf, pos)
+            kind = m.lastgroup
+            if not final:
+                # this token may go on in the next chunk (a number may need a few more characters to match)
+                if m.end() + 3 > n:
+                    break
+                if kind == "char" and (buf[pos] in "\"'" or buf.startswith("/*", pos)):
+                    break
+                if kind == "ident" and m.group().lower() == "url" and buf.startswith("(", m.end()):
+                    break
+            yield kind, m.group()
+            pos = m.end()
+        buf = buf[pos:]
+
+
+def isPreserved(comment) -> bool:
+    """ Whether a given comment should be kept in the output. """
+
+    return comment.startswith("/*!") or "==UserStyle==" in comment
+
+
+def minifyNumber(text, keep_unit=False) -> str:
+    """ Shortens a given number token (0.50px -> .5px, 0px -> 0). """
+
+    m = number_re.match(text)
+    if m is None:
+        return text
+    sign, whole, frac, exp, unit = m.groups()
+    whole = whole.lstrip("0")
+    frac = (frac or "").rstrip("0")
+    unit = unit or ""
+    if not whole and not frac and not exp:
+        # a zero, keep the unit unless it's a length
+        if not keep_unit and unit.lower() in LENGTH_UNITS:
+            unit = ""
+        return "0" + unit
+    return sign + (whole or ("" if frac else "0")) + ("." + frac if frac else "") + (exp or "") + unit
+
+
+def minifyColor(text) -> str:
+    """ Shortens a given hex colour (#FFFFFF -> #fff). """
+
+    if not hex_re.match(text):
+        return text
+    text = text.lower()
+    if len(text) == 7 and text[1] == text[2] and text[3] == text[4] and text[5] == text[6]:
+        return "#" + text[1] + text[3] + text[5]
+    return text
+
+
+def mergesWith(last, first) -> bool:
+    """ Whether two tokens would read as one when the character last is written right before the character first. """
+
+    if first == ".":
+        return last.isdigit()
+    return (last.isalnum() or last in "-_\\") and (first.isalnum() or first in "-_\\")
+
+
+def minify(chunks):
+    """ Minifies the given CSS.
+
+    Parameters:
+    -----------
+    chunks : iterable of str
+        The CSS text, for example its lines. Can be a generator.
+
+    Returns:
+    -----------
+    Yields the minified CSS in pieces."""
+
+    blocks = []           # True for each open block holding declarations, False for blocks holding rules
+    prelude = []          # the tokens since the last '{', '}' or ';'
+    prop = None           # the property of the current declaration value, None when not within a value
+    functions = []        # the names of the open functions, None for plain parenthesis
+    last = ""             # the last character written
+    last_kind = None      # the kind of the last token written
+    space = False         # whitespace was skipped since the last written token
+    gap = False           # a comment was removed since the last written token
+    semicolon = False     # a semicolon is waiting to be written
+
+    for kind, text in tokenize(chunks):
+        if kind == "ws":
+            space = True
+            continue
+
+        if kind == "comment" and not isPreserved(text):
+            gap = True
+            continue
+
+        # the last semicolon of a block is not needed
+        if semicolon:
+            semicolon = False
+            if text == ";":
+                continue
+            if text != "}":
+                yield ";"
+                last = ";"
+                space = gap = False
+
+        decls = bool(blocks) and blocks[-1]
+        first = text[0]
+        if kind == "char":
+            if first == "{":
+                group = prelude[:1] == ["@"] and len(prelude) > 1 and prelude[1].lower() in GROUP_AT_RULES
+                blocks.append(not group)
+                prelude = []
+                prop = None
+                functions = []
+            elif first == "}":
+                if blocks:
+                    blocks.pop()
+                prelude = []
+                prop = None
+                functions = []
+            elif first == ";":
+                prelude = []
+                prop = None
+                functions = []
+                semicolon = True
+                space = gap = False
+                continue
+            elif first == ":" and decls and prop is None and not functions:
+                prop = prelude[-1].lower() if prelude else ""
+            elif first == "(":
+                name = None
+                if last_kind == "ident" and not space and not gap:
+                    name = prelude[-1].lower()
+                functions.append(name)
+            elif first == ")":
+                if functions:
+                    functions.pop()
+
+        # normalising values
+        if prop is not None:
+            if kind == "num":
+                keep_unit = prop.startswith("--") or prop.endswith("flex") or \
+                    any(f in MATH_FUNCTIONS for f in functions)
+                text = minifyNumber(text, keep_unit)
+            elif kind == "hash" and not prop.startswith("--"):
+                text = minifyColor(text)
+        if kind == "url":
+            text = "url(" + text[4:-1].strip() + ")"
+
+        if space and last:
+            needed = not (last in NO_SPACE_AFTER or first in NO_SPACE_BEFORE)
+            if needed and first == ":" and (decls or functions):
+                needed = False
+            if needed and last_kind == "comment":
+                needed = False
+            if needed and not decls and prelude[:1] != ["@"] and (last in ">+~" or first in ">+~"):
+                # combinators within selectors
+                needed = False
+            if needed:
+                yield " "
+        elif gap and mergesWith(last, first):
+            yield " "
+        space = gap = False
+
+        yield text
+        last = text[-1]
+        last_kind = kind
+        if first not in "{}":
+            prelude.append(text)
+
+    if semicolon:
+        yield ";"
@@ -0,0 +1,570 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Structural CSS optimiser for compile.py
+
+Rewrites the rules of a compiled stylesheet without changing what applies
+to any element, as opposed to cssmin which only removes whitespace:
+
+- declarations overridden by a later declaration of the same property for
+  the same selector, with the same or a stronger !important state, are
+  removed,
+- adjacent rules of the same selectors are merged,
+- rules of identical declaration blocks are merged into one selector list,
+- a declaration shared by several rules (e.g. the filter of every
+  .user_color_N rule) is moved to a rule of their combined selectors when
+  that makes the stylesheet smaller.
+
+Rules are only moved past rules setting none of the properties they set,
+shorthands counting as their longhands (background and background-color,
+font and line-height...), and selectors with vendor prefixes are never
+combined with others as browsers drop a whole selector list over a single
+selector they do not know. A later declaration whose value uses a vendor
+prefix or a less common function is kept as a fallback rather than
+overriding an earlier one. cascadeDiff compares the cascade of two
+stylesheets to check the result. """
+
+
+import re
+
+import cssdelta
+
+
+# the functions of values every supported browser knows, a later value using another function may need a fallback
+SAFE_FUNCTIONS = (
+    "rgb", "rgba", "hsl", "hsla", "var", "url", "calc", "attr", "counter", "counters", "local", "format",
+    "linear-gradient", "radial-gradient", "repeating-linear-gradient", "repeating-radial-gradient",
+    "translate", "translatex", "translatey", "translatez", "translate3d", "rotate", "rotatex", "rotatey",
+    "rotatez", "rotate3d", "scale", "scalex", "scaley", "scalez", "scale3d", "skew", "skewx", "skewy",
+    "matrix", "matrix3d", "perspective", "blur", "brightness", "contrast", "drop-shadow", "grayscale",
+    "hue-rotate", "invert", "opacity", "saturate", "sepia", "cubic-bezier", "steps", "rect", "inset",
+    "circle", "ellipse", "polygon", "minmax", "repeat",
+)
+
+function_re = re.compile(r"([-\w]+)\(")
+important_re = re.compile(r"!\s*important\s*$", re.IGNORECASE)
+indent_re = re.compile(r"[ \t]*")
+
+
+
+
+def isPlainValue(value) -> bool:
+    """ Whether every browser supporting the property knows a given value, see SAFE_FUNCTIONS. """
+
+    return not cssdelta.vendor_re.search(value) and all(f.lower() in SAFE_FUNCTIONS for f in function_re.findall(value))
+
+
+def isCombinable(selector) -> bool:
+    """ Whether a given selector may share a selector list with other selectors. """
+
+    return ":-" not in selector
+
+
+class Declaration:
+    """
+    Used to represent a declaration of a style rule.
+
+    Parameters
+    ----------
+    text : str
+        The text of the declaration, including the whitespace before it and its semicolon.
+    """
+
+    __slots__ = ("text", "prop", "value", "important", "key", "family")
+
+    def __init__(self, text):
+        self.text = text
+        declaration = cssdelta.normalKey(text).rstrip(";").strip()
+        prop, _, value = declaration.partition(":")
+        prop = prop.strip()
+        self.prop = prop if prop.startswith("--") else prop.lower()
+        self.value = value.strip()
+        self.important = bool(important_re.search(self.value))
+        self.key = self.prop + ":" + self.value
+        self.family = cssdelta.family(self.prop)
+
+    def overrides(self, other, later=True) -> bool:
+        """ Whether this declaration overrides a given declaration for the same selectors, following it or
+        (later False) preceding it. A preceding declaration only overrides when it is !important and the other is not. """
+
+        stronger = self.important >= other.important if later else self.important > other.important
+        return self.prop == other.prop and stronger and (self.value == other.value or isPlainValue(self.value))
+
+
+class StyleRule:
+    """
+    Used to represent a style rule of a stylesheet.
+
+    Parameters
+    ----------
+    text : str
+        The text of the rule, including the whitespace and comments before it, see cssdelta.splitRules.
+    context : tuple of str
+        The preludes of the grouping at-rules (@media...) holding the rule.
+    """
+
+    def __init__(self, text, context=()):
+        self.context = context
+        start = len(cssdelta.leading_re.match(text).group(0))
+        brace = start
+        while text[brace] != "{":
+            if text[brace] in "\"'":
+                brace = cssdelta.skipString(text, brace)
+            elif text.startswith("/*", brace):
+                brace = cssdelta.skipComment(text, brace)
+            else:
+                brace += 1
+        # the rules of cssdelta.splitRules end with their closing brace
+        closing = len(text) - 1 if text.endswith("}") else cssdelta.matchBrace(text, brace)
+
+        self.prefix = text[:start]
+        prelude = text[start:brace]
+        self.brace_space = prelude[len(prelude.rstrip()):]
+        items = cssdelta.splitSelectors(prelude.rstrip())
+        self.selectors = [selector for _, selector in items]
+        self.separator = items[1][0] if len(items) > 1 else None
+        self.end = text[closing:]
+        self.removed = False
+        # the rules to write before this one
+        self.before = []
+
+        body = text[brace + 1:closing]
+        self.declarations = []
+        self.tail = ""
+        for text in self.splitBody(body):
+            if text.strip():
+                self.declarations.append(Declaration(text))
+            else:
+                self.tail = text
+        self.empty = not self.declarations
+
+    @staticmethod
+    def splitBody(body) -> list:
+        """ Splits the body of a rule into the texts of its declarations, the last item being the whitespace after them. """
+
+        return [text for _, text in cssdelta.splitDeclarations(body)]
+
+    @property
+    def selectorKey(self) -> tuple:
+        return tuple(cssdelta.normalKey(s) for s in self.selectors)
+
+    @property
+    def blockKey(self) -> tuple:
+        return tuple(d.key for d in self.declarations)
+
+    @property
+    def families(self) -> set:
+        return set(d.family for d in self.declarations)
+
+    def dropOverridden(self) -> int:
+        """ Removes the declarations overridden by later declarations of this rule.
+
+        Returns:
+        -----------
+        Returns the number of declarations removed."""
+
+        kept = []
+        for i, declaration in enumerate(self.declarations):
+            if not any(d.overrides(declaration) for d in self.declarations[i + 1:]) and \
+                    not any(d.overrides(declaration, False) for d in kept):
+                kept.append(declaration)
+        removed = len(self.declarations) - len(kept)
+        self.declarations = kept
+        return removed
+
+    def toString(self, separator) -> str:
+        """ Gets the text of this rule and of the rules before it, selectors are joined by a given separator,
+        indented as the rule, if the rule had a single selector. """
+
+        text = "".join(rule.toString(separator) for rule in self.before)
+        if self.removed or (not self.declarations and not self.empty):
+            # keeping the comments of removed rules, the whitespace after them is the next rule's
+            return text + (self.prefix[:self.prefix.rfind("*/") + 2] if "/*" in self.prefix else "")
+
+        if self.separator is None and "\n" in separator:
+            # the selectors of a nested rule are indented as the rule
+            separator += indent_re.match(self.prefix.rpartition("\n")[2]).group(0)
+        body = []
+        for i, declaration in enumerate(self.declarations):
+            if i < len(self.declarations) - 1 and not declaration.text.rstrip().endswith(";"):
+                body.append(declaration.text.rstrip() + ";")
+            else:
+                body.append(declaration.text)
+        return text + self.prefix + (self.separator or separator).join(self.selectors) + self.brace_space + "{" + \
+            "".join(body) + self.tail + self.end
+
+
+class CssOptimizer:
+    """
+    Used to optimise the structure of compiled stylesheets, see the module's description.
+
+    Parameters
+    ----------
+    check : bool
+        Whether to compare the cascade of each optimised stylesheet with the original's. (default False)
+    """
+
+    def __init__(self, check=False):
+        self.check = check
+        self.stats = {}
+        self.differences = []
+        # the selector separator of the last stylesheet, ",\n" if it is not minified
+        self.separator = ","
+
+    @property
+    def key(self) -> str:
+        """ The build cache key part of this optimizer. """
+
+        return "optimize check=" + str(self.check)
+
+    def optimize(self, css) -> str:
+        """ Optimises a given stylesheet. The counts of what changed are kept in stats and, when checking,
+        the cascade differences in differences, until the next optimize.
+
+        Returns:
+        -----------
+        Returns the optimised stylesheet, the given one if checking found differences."""
+
+        items = parseItems(css)
+        rules = [item for item in items if isinstance(item, StyleRule)]
+        separator = self.separator = ",\n" if "\n" in css.strip() else ","
+        self.stats = {"rules": len(rules), "declarations": sum(len(r.declarations) for r in rules),
+                      "overridden": 0, "merged": 0, "factored": 0}
+        # the cascade of the original stylesheet, before the rules change
+        state = cascadeState(items) if self.check else None
+
+        for rule in rules:
+            self.stats["overridden"] += rule.dropOverridden()
+        self.mergeAdjacent(items)
+        self.dropOverriddenRules(rules)
+        self.mergeBlocks(rules)
+        self.factorDeclarations(rules)
+        items = [i for item in items for i in (item.before + [item] if isinstance(item, StyleRule) else [item])]
+        for item in items:
+            if isinstance(item, StyleRule):
+                item.before = []
+        self.mergeAdjacent(items)
+
+        optimized = renderItems(items, separator)
+        rules = [item for item in items if isinstance(item, StyleRule) and item.declarations and not item.removed]
+        self.stats["rules_removed"] = self.stats["rules"] - len(rules)
+        self.stats["declarations_removed"] = self.stats["declarations"] - sum(len(r.declarations) for r in rules)
+        self.stats["saved"] = len(css.encode()) - len(optimized.encode())
+
+        self.differences = cascadeDiff(state, cascadeState(parseItems(optimized))) if self.check else []
+        if self.differences:
+            self.stats["rules_removed"] = self.stats["declarations_removed"] = self.stats["saved"] = 0
+            return css
+        return optimized
+
+    def mergeAdjacent(self, items):
+        """ Merges the declarations of rules following a rule of the same selectors and context into it. """
+
+        previous = None
+        for item in items:
+            if not isinstance(item, StyleRule):
+                previous = None
+                continue
+            if item.removed or (not item.declarations and not item.empty):
+                continue
+            if previous is not None and previous.context == item.context and previous.selectorKey == item.selectorKey:
+                previous.declarations.extend(item.declarations)
+                item.removed = True
+                self.stats["merged"] += 1
+                self.stats["overridden"] += previous.dropOverridden()
+            else:
+                previous = item
+
+    def dropOverriddenRules(self, rules):
+        """ Removes the declarations overridden, for each of their selectors, by the declarations of later
+        rules of the same context or by the !important declarations of earlier ones. """
+
+        for later in (True, False):
+            # (context, selector) -> property -> the declarations of the property of the rules seen so far
+            seen = {}
+            for rule in (reversed(rules) if later else rules):
+                if rule.removed:
+                    continue
+                selectors = [seen.setdefault((rule.context, s), {}) for s in rule.selectorKey]
+                kept = []
+                for declaration in rule.declarations:
+                    if all(any(d.overrides(declaration, later) for d in s.get(declaration.prop, ())) for s in selectors):
+                        self.stats["overridden"] += 1
+                    else:
+                        kept.append(declaration)
+                if not kept and rule.declarations:
+                    rule.removed = True
+                rule.declarations = kept
+                for s in selectors:
+                    for declaration in kept:
+                        s.setdefault(declaration.prop, []).append(declaration)
+
+    @staticmethod
+    def familyIndex(rules) -> dict:
+        """ Gets the indexes of the rules setting each family, in order. """
+
+        index = {}
+        for i, rule in enumerate(rules):
+            for f in (() if rule.removed else rule.families):
+                index.setdefault(f, []).append(i)
+        return index
+
+    @staticmethod
+    def conflicts(index, families, start, end, members) -> bool:
+        """ Whether a rule between given indexes, other than the members, sets any of the given families. """
+
+        import bisect
+        if "*" in families:
+            return True
+        for f in list(families) + ["*"]:
+            positions = index.get(f, ())
+            for position in positions[bisect.bisect_right(positions, start):bisect.bisect_left(positions, end)]:
+                if position not in members:
+                    return True
+        return False
+
+    def mergeBlocks(self, rules):
+        """ Merges the selectors of rules of identical declaration blocks into the first of them,
+        as long as no rule between them sets any of their families. """
+
+        index = self.familyIndex(rules)
+        groups = {}
+        for i, rule in enumerate(rules):
+            if rule.declarations and not rule.removed and all(isCombinable(s) for s in rule.selectors):
+                groups.setdefault((rule.context, rule.blockKey), []).append(i)
+
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            member_set = set(members)
+            anchor = members[0]
+            families = rules[anchor].families
+            for i in members[1:]:
+                if self.conflicts(index, families, anchor, i, member_set):
+                    anchor = i
+                    continue
+                addSelectors(rules[anchor], rules[i].selectors)
+                rules[i].removed = True
+                self.stats["merged"] += 1
+
+    def factorDeclarations(self, rules):
+        """ Moves declarations shared by several rules into a rule of their combined selectors written
+        before the first of them, when it saves bytes and no rule between them sets their family. """
+
+        index = self.familyIndex(rules)
+        groups = {}
+        for i, rule in enumerate(rules):
+            if rule.removed or not all(isCombinable(s) for s in rule.selectors):
+                continue
+            counts = {}
+            for declaration in rule.declarations:
+                counts[declaration.family] = counts.get(declaration.family, 0) + 1
+            for declaration in rule.declarations:
+                # a declaration is moved away from the others of its family only if it has none
+                if counts[declaration.family] == 1 and declaration.family != "*":
+                    groups.setdefault((rule.context, declaration.key), []).append(i)
+
+        for (_, key), members in groups.items():
+            if len(members) < 2:
+                continue
+            member_set = set(members)
+            runs = [[members[0]]]
+            families = {cssdelta.family(key.split(":", 1)[0])}
+            for i in members[1:]:
+                if self.conflicts(index, families, runs[-1][0], i, member_set):
+                    runs.append([i])
+                else:
+                    runs[-1].append(i)
+            for run in runs:
+                if len(run) > 1 and factorGain([rules[i] for i in run], key) > 0:
+                    self.factor([rules[i] for i in run], key)
+
+    def factor(self, members, key):
+        """ Moves the declaration of a given key of the given rules into a rule before the first of them. """
+
+        anchor = members[0]
+        declaration = next(d for d in anchor.declarations if d.key == key)
+        shared = StyleRule.__new__(StyleRule)
+        shared.context = anchor.context
+        # the comments before the first rule go before the shared one, the first rule starts a line of its own
+        shared.prefix = anchor.prefix
+        if "*/" in anchor.prefix:
+            anchor.prefix = anchor.prefix[anchor.prefix.rfind("*/") + 2:]
+        if "\n" in self.separator and "\n" not in anchor.prefix:
+            anchor.prefix = "\n" + indent_re.match(shared.prefix.rpartition("\n")[2]).group(0)
+        shared.brace_space = anchor.brace_space
+        shared.selectors = []
+        shared.separator = None
+        shared.end = anchor.end
+        shared.removed = False
+        shared.before = []
+        shared.declarations = [declaration]
+        shared.tail = anchor.tail
+        shared.empty = False
+        for rule in members:
+            addSelectors(shared, rule.selectors)
+            rule.declarations = [d for d in rule.declarations if d.key != key]
+            if not rule.declarations:
+                rule.removed = True
+        anchor.before.append(shared)
+        self.stats["factored"] += len(members)
+
+    def report(self) -> str:
+        """ Gets the counts of the last optimize. """
+
+        lines = ["{rules_removed:,} rules and {declarations_removed:,} declarations removed, "
+                 "{saved:,} bytes saved.".format(**self.stats),
+                 "{overridden:,} overridden declarations removed, {merged:,} rules merged, "
+                 "{factored:,} shared declarations moved.".format(**self.stats)]
+        if self.differences:
+            lines.append("The optimised cascade differs, the stylesheet was kept as it was:")
+            lines.extend(self.differences)
+        return "\n".join(lines) + "\n"
+
+
+def addSelectors(rule, selectors):
+    """ Adds the given selectors to a given rule, skipping the ones it already has. """
+
+    keys = set(rule.selectorKey)
+    for selector in selectors:
+        if cssdelta.normalKey(selector) not in keys:
+            rule.selectors.append(selector.strip())
+            keys.add(cssdelta.normalKey(selector))
+
+
+def factorGain(members, key) -> int:
+    """ Gets the bytes saved by moving the declaration of a given key of the given rules to a rule of
+    their combined selectors, as measured on the minified stylesheet. """
+
+    selectors = [cssdelta.normalKey(s) for rule in members for s in rule.selectors]
+    saved = sum(len(key) + 1 for _ in members)
+    # the rules left without declarations are removed altogether
+    saved += sum(len(",".join(rule.selectorKey)) + 2 for rule in members if len(rule.declarations) == 1)
+    return saved - (len(key) + len(",".join(selectors)) + 2)
+
+
+def parseItems(css) -> list:
+    """ Splits a given stylesheet into StyleRule items for its style rules and the texts of the rest. """
+
+    items = []
+    context = []
+    for rule in cssdelta.splitRules(css):
+        if rule.kind == "rule":
+            items.append(StyleRule(rule.text, tuple(context)))
+            continue
+        if rule.kind == "open":
+            context.append(cssdelta.normalKey(rule.text)[:-1].strip())
+        elif rule.kind == "close":
+            context.pop()
+        items.append(rule)
+    return items
+
+
+def renderItems(items, separator) -> str:
+    """ Gets the stylesheet of given items, without the grouping at-rules (@media...) left empty. """
+
+    parts = []
+    groups = []
+    for item in items:
+        if isinstance(item, StyleRule):
+            text = item.toString(separator)
+            parts.append(text)
+            if cssdelta.normalKey(text) and groups:
+                groups[-1][1] = True
+        elif item.kind == "open":
+            groups.append([len(parts), False])
+            parts.append(item.text)
+        elif item.kind == "close":
+            opening, kept = groups.pop()
+            if kept:
+                parts.append(item.text)
+                if groups:
+                    groups[-1][1] = True
+            else:
+                del parts[opening:]
+        else:
+            parts.append(item.text)
+            if groups:
+                groups[-1][1] = True
+    return "".join(parts)
+
+
+def cascadeState(items):
+    """ Gets the cascade of the given items of a stylesheet, see parseItems and cascadeDiff.
+
+    Returns:
+    -----------
+    Returns a (winners, order, others) tuple: (context, selector, property) -> the (value, important)
+    of its winning declaration, family -> the (position, context, selector, property) of the winning
+    declarations of the family in order, and the texts of the at-rules other than grouping ones."""
+
+    candidates = {}
+    others = []
+    for position, item in enumerate(items):
+        if not isinstance(item, StyleRule):
+            if item.kind == "at-rule":
+                others.append(cssdelta.normalKey(item.text))
+            continue
+        for selector in item.selectorKey:
+            for i, declaration in enumerate(item.declarations):
+                current = candidates.get((item.context, selector, declaration.prop))
+                # later declarations win unless the current one is !important and they are not
+                if current is None or declaration.important >= current[1].important:
+                    candidates[(item.context, selector, declaration.prop)] = ((position, i), declaration)
+
+    winners = {}
+    order = {}
+    for key, (position, declaration) in candidates.items():
+        winners[key] = (declaration.value, declaration.important)
+        order.setdefault(declaration.family, []).append((position, key))
+    for positions in order.values():
+        positions.sort()
+    return winners, order, others
+
+
+def cascadeDiff(old_state, new_state, limit=20) -> list:
+    """ Compares the cascades of two stylesheets, see cascadeState.
+
+    For each selector, property and at-rule context the winning declaration of both stylesheets
+    should be the same, and the winning declarations of each family should keep their order so the
+    same one wins for elements matched by several selectors. The validity of values is not checked,
+    the winners are the ones of a browser knowing every value.
+
+    Returns:
+    -----------
+    Returns a list of up to limit descriptions of the differences, empty if the cascades are the same."""
+
+    old_winners, old_order, old_others = old_state
+    new_winners, new_order, new_others = new_state
+    differences = []
+
+    def describe(key):
+        context, selector, prop = key
+        return " > ".join(list(context) + [selector]) + " { " + prop + " }"
+
+    for key in sorted(set(old_winners) | set(new_winners), key=describe):
+        if old_winners.get(key) != new_winners.get(key):
+            differences.append(describe(key) + ": " + str(old_winners.get(key)) + " -> " + str(new_winners.get(key)))
+
+    for f, old_positions in sorted(old_order.items()):
+        new_positions = {key: position for position, key in new_order.get(f, ())}
+        previous = None
+        for _, key in old_positions:
+            position = new_positions.get(key)
+            if position is None:
+                continue
+            if previous is not None and position < previous[0]:
+                differences.append(describe(key) + " moved before " + describe(previous[1]))
+            else:
+                previous = (position, key)
+
+    if old_others != new_others:
+        differences.append("the at-rules other than grouping ones changed")
+    return differences[:limit]
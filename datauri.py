@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Data URI stage for compile.py
+
+Finds the data URIs of a compiled CSS, optionally optimizes their SVGs,
+re-encodes SVGs as URL-encoded text when that is shorter than base64, and hoists URIs used more than once into CSS custom
+properties on :root so each one is written only once. """
+
+
+import re
+import base64
+import binascii
+from urllib.parse import unquote_to_bytes
+
+
+data_uri_re = re.compile(r"""url\(\s*(?:"(data:[^"]*)"|'(data:[^']*)'|(data:[^)\s"']*))\s*\)""")
+# a comment or a statement at-rule that has to come before the rules, at the start of a stylesheet
+leading_re = re.compile(r"""\s*(?:(/\*.*?\*/)|(@(?:charset|import|namespace)\b(?:[^;"']|"[^"]*"|'[^']*')*;))""",
+                        re.S | re.I)
+
+# characters of an SVG that can not be written as is within a double quoted data URI
+svg_escapes = {
+    "%": "%25",
+    "#": "%23",
+    "<": "%3C",
+    ">": "%3E",
+    "\\": "%5C",
+    "\n": "%0A",
+    "\r": "%0D",
+    "\t": "%09",
+    '"': "%22",
+}
+
+
+class Asset:
+    """
+    Used to represent a unique data URI of a CSS.
+
+    Parameters
+    ----------
+    uri : str
+        The data URI as found in the CSS.
+    encoded : str
+        The shortest equivalent data URI.
+    encoding : str
+        The encoding of the encoded URI (base64 or utf8).
+    svg : bytes
+        The SVG document of the URI, None when it is not an SVG.
+    uses : int
+        The number of times this URI is used.
+    name : str
+        The name of the custom property holding this URI, None when it is not hoisted.
+    """
+
+    def __init__(self, uri, encoded, encoding, svg=None):
+        self.uri = uri
+        self.encoded = encoded
+        self.encoding = encoding
+        self.svg = svg
+        self.uses = 0
+        self.before = 0
+        self.name = None
+
+    @property
+    def mime(self) -> str:
+        return self.uri[5:].split(",", 1)[0].split(";", 1)[0]
+
+    def after(self, compress=False) -> int:
+        """ Gets the bytes this asset takes in the output CSS. """
+
+        token = 'url("' + self.encoded + '")'
+        if self.name is None:
+            return len(token) * self.uses
+        return len(self.definition(compress)) + len("var(--" + self.name + ")") * self.uses
+
+    def definition(self, compress=False) -> str:
+        """ Gets the custom property declaration of this asset. """
+
+        if compress:
+            return "--" + self.name + ':url("' + self.encoded + '");'
+        return "  --" + self.name + ': url("' + self.encoded + '");\n'
+
+
+def encodeSvg(svg) -> str:
+    """ URL-encodes a given SVG document to be used within a double quoted data URI.
+
+    Double quotes are swapped with single quotes when the SVG has no single quotes.
+    Non-ASCII bytes are percent-encoded as is so the document keeps its own charset.
+
+    Parameters:
+    -----------
+    svg : bytes
+        The SVG document.
+
+    Returns:
+    -----------
+    Returns the URL-encoded document as str."""
+
+    if b"'" not in svg:
+        svg = svg.replace(b'"', b"'")
+    result = []
+    for c in svg.decode("latin-1"):
+        if c in svg_escapes:
+            result.append(svg_escapes[c])
+        elif ord(c) > 126 or ord(c) < 32:
+            result.append("%{:02X}".format(ord(c)))
+        else:
+            result.append(c)
+    return "".join(result)
+
+
+def decodeSvg(uri):
+    """ Gets the SVG document of a given data URI.
+
+    Returns:
+    -----------
+    Returns a (header, svg) tuple, header being the data URI header without ';base64' and svg
+    the document as bytes, or None if the URI is not a readable SVG."""
+
+    header, _, data = uri.partition(",")
+    if not header.startswith("data:image/svg+xml"):
+        return None
+
+    # browsers percent-decode the data and skip whitespace before decoding base64
+    data = unquote_to_bytes(data)
+    if not header.endswith(";base64"):
+        return header, data
+    try:
+        return header[:-len(";base64")], base64.b64decode(b"".join(data.split()), validate=True)
+    except binascii.Error:
+        return None
+
+
+def optimalUri(uri, optimize=None):
+    """ Gets the shortest encoding of a given data URI.
+
+    Parameters:
+    -----------
+    uri : str
+        The data URI.
+    optimize : callable
+        Gets an SVG document as bytes and returns an optimized version of it. optional.
+
+    Returns:
+    -----------
+    Returns an (uri, encoding, svg) tuple, svg being the original SVG document as bytes or None if the URI is not an SVG."""
+
+    encoding = "base64" if uri.partition(",")[0].endswith(";base64") else "utf8"
+    decoded = decodeSvg(uri)
+    # the URI is written within double quotes
+    uri = uri.replace('"', "%22")
+    if decoded is None:
+        return uri, encoding, None
+
+    header, svg = decoded
+    data = svg if optimize is None else optimize(svg)
+    candidates = [(uri, encoding), (header + ";base64," + base64.b64encode(data).decode(), "base64")]
+    # swapping quotes is only safe for ASCII compatible charsets
+    if not data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        candidates.append((header + "," + encodeSvg(data), "utf8"))
+    return min(candidates, key=lambda c: len(c[0])) + (svg,)
+
+
+def inlineAssets(css, compress=False, prefix="dt-img-", optimize=None):
+    """ Re-encodes and deduplicates the data URIs of a given CSS.
+
+    Parameters:
+    -----------
+    css : str
+        The compiled CSS.
+    compress : bool
+        Whether the CSS is minified, so the custom properties are written the same way. default is False.
+    prefix : str
+        The prefix of the custom properties names. default is 'dt-img-'.
+    optimize : callable
+        Gets an SVG document as bytes and returns an optimized version of it, e.g. SvgMinifier.minify. optional.
+
+    Returns:
+    -----------
+    Returns a (css, assets) tuple, assets being a list of Asset in order of appearance."""
+
+    assets = {}
+    for m in data_uri_re.finditer(css):
+        uri = m.group(1) or m.group(2) or m.group(3)
+        asset = assets.get(uri)
+        if asset is None:
+            asset = assets[uri] = Asset(uri, *optimalUri(uri, optimize))
+        asset.uses += 1
+        asset.before += len(m.group(0))
+
+    if not assets:
+        return css, []
+
+    # hoisting every asset that takes less space when written once
+    count = 0
+    for asset in assets.values():
+        if asset.uses < 2:
+            continue
+        inline = asset.after(compress)
+        asset.name = prefix + str(count + 1)
+        if asset.after(compress) >= inline:
+            asset.name = None
+        else:
+            count += 1
+
+    def replace(m):
+        asset = assets[m.group(1) or m.group(2) or m.group(3)]
+        if asset.name is not None:
+            return "var(--" + asset.name + ")"
+        return 'url("' + asset.encoded + '")'
+
+    body = data_uri_re.sub(replace, css)
+
+    hoisted = [a for a in assets.values() if a.name is not None]
+    if not hoisted:
+        return body, list(assets.values())
+
+    definitions = "".join(a.definition(compress) for a in hoisted)
+    if compress:
+        root = ":root{" + definitions.rstrip(";") + "}"
+    else:
+        root = ":root {\n" + definitions + "}\n"
+
+    # the custom properties go right after the leading UserStyle comment if there's one
+    # and after the @charset, @import and @namespace statements, which have to come first
+    insert_at = 0
+    pos = 0
+    while True:
+        m = leading_re.match(body, pos)
+        if m is None:
+            break
+        if m.group(2) is not None or pos == 0:
+            insert_at = m.end()
+        pos = m.end()
+    while insert_at < len(body) and body[insert_at] in "\r\n":
+        insert_at += 1
+    return body[:insert_at] + root + body[insert_at:], list(assets.values())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Variable dependency graph and incremental compiles for compile.py
+
+Maps each UserStyle variable to the top level statements of the stylus
+source reading it, directly or through the functions (col(), bgTex(),
+shad()...) and the variables using it. The CSS of each top level statement
+is rendered on its own, so when some variables change only the statements
+depending on them are evaluated again and their CSS is patched into the
+previous output. Statements binding names other statements read in the
+root scope (assignments, functions...) are always evaluated again.
+
+The parsed statements, the graph and the CSS of each statement are kept in
+a build cache between runs, keyed on the source after the variables. """
+
+
+import pickle
+
+import stylc
+import cssdelta
+import buildcache
+
+
+def boundNames(st) -> set:
+    """ Gets the names a given top level statement binds in the root scope. The bodies of
+    conditions and loops run in the root scope, the bodies of rules and functions do not. """
+
+    names = set()
+    if st.kind == "assign":
+        names.add(st.name)
+    elif st.kind == "function":
+        names.add(st.name)
+    elif st.kind == "for":
+        names.update(n for n in (st.val, st.key) if n)
+    if st.kind in ("if", "for"):
+        for key in ("body", "orelse"):
+            for child in getattr(st, key, None) or []:
+                names |= boundNames(child)
+    return names
+
+
+class DependencyGraph:
+    """
+    Used to map variables to the top level statements depending on them.
+
+    Parameters
+    ----------
+    statements : list of stylc.Statement
+        The top level statements of the source.
+    names : iterable of str
+        The variables to map, usually the UserStyle variables.
+    """
+
+    def __init__(self, statements, names):
+        collector = stylc.ConstantFolder(())
+        functions = {}
+        references = []
+        bound = []
+        for st in statements:
+            refs = set()
+            # comments are written as they are, they depend on nothing
+            if st.kind != "comment":
+                collector.collectReferences([st], refs, functions)
+            references.append(refs)
+            bound.append(boundNames(st))
+
+        # name -> the statements and functions reading it
+        readers = {}
+        for i, refs in enumerate(references):
+            for ref in refs:
+                readers.setdefault(ref, set()).add(i)
+        for function, refs in functions.items():
+            for ref in refs:
+                readers.setdefault(ref, set()).add(function)
+
+        # the statements binding names read by other statements are evaluated by every compile,
+        # e.g. a loop whose variable nothing else reads is not
+        self.binding = set(i for i, names in enumerate(bound)
+                           if any(readers.get(name, set()) - {i} for name in names))
+
+        # name -> the names whose values or bodies use it
+        users = {}
+        for i in self.binding:
+            for name in bound[i]:
+                for ref in references[i]:
+                    users.setdefault(ref, set()).add(name)
+        for function, refs in functions.items():
+            for ref in refs:
+                users.setdefault(ref, set()).add(function)
+
+        self.dependents = {}
+        for name in names:
+            reached = {name}
+            pending = [name]
+            while pending:
+                for user in users.get(pending.pop(), ()):
+                    if user not in reached:
+                        reached.add(user)
+                        pending.append(user)
+            self.dependents[name] = [i for i, refs in enumerate(references)
+                                     if i not in self.binding and not refs.isdisjoint(reached)]
+
+    def affected(self, names) -> set:
+        """ Gets the indexes of the statements depending on any of the given variables. """
+
+        result = set()
+        for name in names:
+            result.update(self.dependents.get(name, ()))
+        return result
+
+
+class IncrementalCompiler:
+    """
+    Used to compile a stylus source whose variables change between compiles, evaluating again
+    only the top level statements depending on the changed variables, see DependencyGraph.
+
+    The output is the same as stylc.render's, uncompressed and without line numbers.
+
+    Parameters
+    ----------
+    cache : buildcache.BuildCache
+        The cache to keep the state in between runs. optional.
+    parse_cache : stylc.ParseCache
+        The cache of the sections parsed by a previous compile. optional.
+    """
+
+    def __init__(self, cache=None, parse_cache=None):
+        self.cache = cache
+        self.parse_cache = parse_cache
+        self.renderer = stylc.Renderer()
+        self.state = None
+        # what the last compile did
+        self.incremental = False
+        self.changed = []
+        self.evaluated = 0
+
+    def stateKey(self, head_count, body) -> str:
+        return buildcache.cacheKey("depgraph", stylc.version, buildcache.fileHash(stylc.__file__),
+                                   buildcache.fileHash(__file__), str(head_count), body)
+
+    def loadState(self, key):
+        """ Gets the state of a given key, from memory or from the cache. None if there is none. """
+
+        if self.state is not None and self.state["key"] == key:
+            return self.state
+        if self.cache is None:
+            return None
+        data = self.cache.get(key, True)
+        if data is None:
+            return None
+        try:
+            state = pickle.loads(data)
+        except Exception:
+            return None
+        return state if isinstance(state, dict) and state.get("key") == key else None
+
+    def compile(self, head, body, values) -> str:
+        """ Compiles a given stylus source.
+
+        Parameters:
+        -----------
+        head : str
+            The source of the UserStyle block and its variables, see compile.userStyleLines.
+        body : str
+            The source following the head.
+        values : dict
+            Variable name -> the stylus value of each UserStyle variable of the head.
+
+        Returns:
+        -----------
+        Returns the compiled CSS. Raises stylc.StylusError if the source cannot be compiled."""
+
+        head_statements = stylc.parseStatements(stylc.splitSource(head))
+        key = self.stateKey(len(head_statements), body)
+        state = self.loadState(key)
+
+        if state is not None and sorted(state["values"]) == sorted(values):
+            self.incremental = True
+            self.changed = sorted(n for n in values if state["values"][n] != values[n])
+            statements = head_statements + state["statements"][len(head_statements):]
+            graph = state["graph"]
+            run = set(range(len(head_statements))) | graph.binding | graph.affected(self.changed)
+            chunks = list(state["chunks"])
+            tails = list(state["tails"])
+        else:
+            self.incremental = False
+            self.changed = sorted(values)
+            if self.parse_cache is not None:
+                body_statements = self.parse_cache.parse(body)
+            else:
+                body_statements = stylc.parseStatements(stylc.splitSource(body, head.count("\n") + 1))
+            statements = head_statements + body_statements
+            graph = DependencyGraph(statements, values)
+            run = set(range(len(statements)))
+            chunks = [""] * len(statements)
+            tails = [""] * len(statements)
+
+        evaluator = stylc.Evaluator()
+        evaluator.deferred.append([])
+        for i in sorted(run):
+            chunks[i], tails[i] = self.evaluateStatement(evaluator, statements[i])
+        self.evaluated = len(run)
+
+        self.state = {"key": key, "values": dict(values), "statements": statements, "graph": graph,
+                      "chunks": chunks, "tails": tails}
+        if self.cache is not None:
+            self.cache.put(key, pickle.dumps(self.state, pickle.HIGHEST_PROTOCOL))
+        return "".join(chunks) + "".join(tails)
+
+    def evaluateStatement(self, evaluator, st):
+        """ Evaluates a given top level statement within the root scope of a given evaluator.
+
+        Returns:
+        -----------
+        Returns a (css, tail) tuple, tail being the CSS of the keyframes written at the end of the output."""
+
+        out = []
+        deferred = evaluator.deferred[-1]
+        mark = len(deferred)
+        getattr(evaluator, "visit_" + st.kind)(st, out, evaluator.root)
+        tail = deferred[mark:]
+        del deferred[mark:]
+        return self.renderer.render(out), self.renderer.render(tail)
+
+    @property
+    def statementCount(self) -> int:
+        return len(self.state["statements"]) if self.state is not None else 0
+
+    def rulesOf(self, name) -> list:
+        """ Gets the rules of the last compiled CSS depending on a given variable, keyed as cssdelta keys them.
+
+        Returns:
+        -----------
+        Returns a list of rule keys. Raises KeyError if the variable is not one of the compiled source."""
+
+        if self.state is None:
+            return []
+        rules = []
+        for i in self.state["graph"].dependents[name]:
+            for text in (self.state["chunks"][i], self.state["tails"][i]):
+                rules.extend(r.key for r in cssdelta.splitRules(text) if r.kind in ("rule", "at-rule"))
+        return rules
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Preset support for compile.py
+
+Loads presets (named sets of variable overrides) from JSON or TOML files
+and compiles them in worker processes. The stylus body shared by every
+preset is parsed once and handed to each worker when it starts, so a
+worker only parses the few variable lines of each preset. When compiling
+with stylus, each worker process rather starts a persistent stylus worker
+(see stylusworker) and sends it the source of each preset. """
+
+
+import json
+import time
+
+import stylc
+import cssmin
+import stylusworker
+
+
+def loadPresets(in_file) -> dict:
+    """ Loads presets from a given JSON or TOML file.
+
+    The file maps each preset name to a table of variable name -> value, e.g.
+    { "compact": { "enableCompact": true, "msgb": "5px" } }
+
+    Parameters:
+    -----------
+    in_file : str
+        The presets file. TOML is used for files ending with '.toml', JSON otherwise.
+
+    Returns:
+    -----------
+    Returns a dict of preset name -> dict of variable name -> stylus value as str."""
+
+    if in_file.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML presets require Python 3.11 or later")
+        with open(in_file, "rb") as read_obj:
+            data = tomllib.load(read_obj)
+    else:
+        with open(in_file, "r") as read_obj:
+            data = json.load(read_obj)
+
+    if not isinstance(data, dict):
+        raise ValueError("'" + in_file + "' should map preset names to variables")
+
+    presets = {}
+    for name, values in data.items():
+        if not isinstance(values, dict):
+            raise ValueError("preset '" + name + "' should map variable names to values")
+        presets[name] = {k: stylusValue(v) for k, v in values.items()}
+    return presets
+
+
+def stylusValue(value) -> str:
+    """ Converts a given JSON\\TOML value to a stylus value. Booleans become 1 or 0 as checkboxes do. """
+
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str) and "\n" not in value:
+        return value
+    raise ValueError("unsupported preset value " + repr(value))
+
+
+# the parsed stylus body of the worker process, set by initWorker
+worker_body = None
+worker_options = None
+# the stylus worker of the worker process, set by initWorker when compiling with stylus
+worker_stylus = None
+# the function finishing and writing the compiled CSS in the worker process, set by initWorker
+worker_finish = None
+
+
+def initWorker(body, compress, linenos, filename, use_stylus=False, worker_command=None, finish=None):
+    """ Initializes a worker process with the parsed stylus body shared by every preset.
+    When compress is True the compiled CSS is minified in the worker. When use_stylus is True
+    body is the stylus source after the UserStyle block, compiled by a stylus worker started
+    with the given command. (default node stylus-worker.js) When finish is given, it gets the
+    compiled CSS and the outputs of each preset in the worker, see compilePreset. """
+
+    global worker_body
+    global worker_options
+    global worker_stylus
+    global worker_finish
+
+    worker_body = body
+    worker_options = (compress, linenos, filename)
+    worker_finish = finish
+    # the stylus worker exits once this process does, as its stdin is closed
+    worker_stylus = stylusworker.StylusWorker(worker_command) if use_stylus else None
+
+
+def compilePreset(name, head, outputs=None):
+    """ Compiles a preset in a worker process initialized by initWorker.
+
+    Parameters:
+    -----------
+    name : str
+        The preset name.
+    head : str
+        The UserStyle block and variables of this preset as stylus source.
+    outputs : list
+        The outputs of this preset given to the finish function of initWorker with its CSS. optional.
+
+    Returns:
+    -----------
+    Returns a (name, css, seconds, error) tuple. css is None and error holds the message if the preset could not be compiled.
+    css is the result of the finish function rather than the CSS when initWorker was given one."""
+
+    compress, linenos, filename = worker_options
+    start = time.perf_counter()
+    try:
+        if worker_stylus is not None:
+            css = worker_stylus.compile(head + worker_body, linenos, filename)
+        else:
+            statements = stylc.parseStatements(stylc.splitSource(head)) + worker_body
+            items = stylc.Evaluator().evaluate(statements)
+            css = stylc.Renderer(False, linenos, filename).render(items)
+        if compress:
+            css = "".join(cssmin.minify(css.splitlines(True)))
+    except (stylc.StylusError, stylusworker.WorkerError) as e:
+        return name, None, time.perf_counter() - start, str(e)
+    if worker_finish is not None:
+        css = worker_finish(css, outputs)
+    return name, css, time.perf_counter() - start, None
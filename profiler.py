@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Build profiler for compile.py
+
+Records the wall time, CPU time, peak memory (tracemalloc), bytes read and
+written and line count of each stage of a build, and writes them as a Chrome
+trace-event JSON file (to open in chrome://tracing or Perfetto), a one line
+summary and a table.
+Bytes are taken from /proc/self/io on Linux and are not available elsewhere.
+Memory tracing slows Python code down, so the times are relative only. """
+
+
+import os
+import json
+import time
+import tracemalloc
+import contextlib
+
+
+class Stage:
+    """
+    Used to represent the measures of a profiled stage.
+
+    Parameters
+    ----------
+    name : str
+        The stage name.
+    start : float
+        The wall clock time the stage started at in seconds, relative to the profiler start.
+    wall, cpu : float
+        The wall clock and CPU time the stage took in seconds.
+    peak : int
+        The peak memory allocated during the stage in bytes.
+    read, written : int
+        The bytes the process read and wrote during the stage, None when not available.
+    lines : int
+        The number of lines the stage handled, None when not counted.
+    """
+
+    __slots__ = ("name", "start", "wall", "cpu", "peak", "read", "written", "lines")
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.wall = 0
+        self.cpu = 0
+        self.peak = 0
+        self.read = None
+        self.written = None
+        self.lines = None
+
+
+def ioCounters():
+    """ Gets the (read, written) bytes of this process so far, None if not available. """
+
+    try:
+        with open("/proc/self/io", 'r') as read_obj:
+            counters = dict(line.split(":", 1) for line in read_obj if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class Profiler:
+    """
+    Used to profile the stages of a build. Stages should not be nested.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.current = None
+        self.origin = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Profiles the code run within the returned context as a stage of a given name. """
+
+        record = Stage(name, time.perf_counter() - self.origin)
+        self.current = record
+        io_start = ioCounters()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall = time.perf_counter() - wall_start
+            record.cpu = time.process_time() - cpu_start
+            record.peak = max(tracemalloc.get_traced_memory()[1] - base, 0)
+            io_end = ioCounters()
+            if io_start is not None and io_end is not None:
+                record.read = io_end[0] - io_start[0]
+                record.written = io_end[1] - io_start[1]
+            self.stages.append(record)
+            self.current = None
+
+    def addLines(self, count):
+        """ Adds a given number of lines to the current stage. """
+
+        if self.current is not None:
+            self.current.lines = (self.current.lines or 0) + count
+
+    def stop(self):
+        """ Stops tracing memory allocations. """
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def traceEvents(self) -> dict:
+        """ Gets the recorded stages as a Chrome trace-event JSON object. """
+
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "compile.py"}}]
+        for s in self.stages:
+            args = {"cpu_ms": round(s.cpu * 1000, 3), "peak_bytes": s.peak}
+            for key in ("read", "written", "lines"):
+                if getattr(s, key) is not None:
+                    args[key + ("_bytes" if key != "lines" else "")] = getattr(s, key)
+            events.append({
+                "name": s.name,
+                "cat": "build",
+                "ph": "X",
+                "ts": round(s.start * 1e6, 3),
+                "dur": round(s.wall * 1e6, 3),
+                "pid": pid,
+                "tid": 0,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def writeTrace(self, out_file):
+        """ Writes the recorded stages to a given Chrome trace-event JSON file. """
+
+        out_dir = os.path.dirname(out_file)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(out_file, 'w') as write_obj:
+            json.dump(self.traceEvents(), write_obj, indent=1)
+            write_obj.write("\n")
+
+    def summary(self) -> str:
+        """ Gets a one line summary of the recorded stages: their total time, the peak memory and the slowest stage. """
+
+        if not self.stages:
+            return "No stage was profiled."
+        slowest = max(self.stages, key=lambda s: s.wall)
+        total = sum(s.wall for s in self.stages)
+        return ("Profiled " + str(len(self.stages)) + " stages in " + "{:,.1f}".format(total * 1000) + "ms, peak " +
+                "{:,.1f}".format(max(s.peak for s in self.stages) / 1024) + "KB, slowest " + slowest.name + " " +
+                "{:,.1f}".format(slowest.wall * 1000) + "ms (" + str(round(slowest.wall / total * 100)) + "%).")
+
+    def table(self) -> str:
+        """ Gets a table of the recorded stages, one line per stage and a total line. """
+
+        def size(n):
+            return "-" if n is None else "{:,.1f}".format(n / 1024)
+
+        rows = [("stage", "wall ms", "cpu ms", "peak KB", "read KB", "written KB", "lines")]
+        for s in self.stages:
+            rows.append((s.name, "{:,.1f}".format(s.wall * 1000), "{:,.1f}".format(s.cpu * 1000), size(s.peak),
+                         size(s.read), size(s.written), "-" if s.lines is None else "{:,}".format(s.lines)))
+
+        reads = [s.read for s in self.stages]
+        writes = [s.written for s in self.stages]
+        rows.append(("total",
+                     "{:,.1f}".format(sum(s.wall for s in self.stages) * 1000),
+                     "{:,.1f}".format(sum(s.cpu for s in self.stages) * 1000),
+                     size(max((s.peak for s in self.stages), default=0)),
+                     size(None if None in reads else sum(reads)),
+                     size(None if None in writes else sum(writes)),
+                     ""))
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  " + row[0].ljust(widths[0]) + "".join(
+            "  " + cell.rjust(width) for cell, width in zip(row[1:], widths[1:])) for row in rows)
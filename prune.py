@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Unused selector pruning for compile.py
+
+Indexes the tags, ids and classes of saved HTML snapshots of Telegram Web
+and drops the selectors of a compiled stylesheet which require a tag, id or
+class missing from all of them. Matching is conservative: only what a
+selector requires outside of attribute selectors and functional pseudo
+classes (:not(), :is()...) is checked, so a kept selector may still never
+match but a dropped one never could. Classes listed in ng-class attributes
+count as present as Angular adds them at runtime. An allowlist of patterns
+(.class, #id or tag, with * and ? wildcards) keeps the selectors of other
+dynamically added markup. """
+
+
+import re
+import fnmatch
+import hashlib
+from html.parser import HTMLParser
+
+import cssdelta
+
+
+# tags a page always has, whether the snapshot shows them or not
+IMPLICIT_TAGS = ("html", "head", "body")
+
+ident = r"-?(?:[_a-zA-Z\u00a0-\uffff]|\\.)(?:[-\w\u00a0-\uffff]|\\.)*"
+class_re = re.compile(r"\.(" + ident + ")")
+id_re = re.compile(r"#(" + ident + ")")
+tag_re = re.compile(r"(?:^|[\s>+~])(" + ident + ")")
+word_re = re.compile(r"[-\w]+")
+escape_re = re.compile(r"\\(.)")
+
+
+class SnapshotParser(HTMLParser):
+    """ Used to collect the tags, ids and classes of an HTML document into a DomIndex. """
+
+    def __init__(self, index):
+        super().__init__(convert_charrefs=True)
+        self.index = index
+
+    def handle_starttag(self, tag, attrs):
+        self.index.tags.add(tag.lower())
+        for name, value in attrs:
+            if value is None:
+                continue
+            if name == "id":
+                self.index.ids.add(value.strip())
+            elif name == "class":
+                self.index.classes.update(value.split())
+            elif name == "ng-class":
+                # e.g. ng-class="{im_message_selected: selected}", any word may be a class
+                self.index.classes.update(word_re.findall(value))
+
+    handle_startendtag = handle_starttag
+
+
+class DomIndex:
+    """
+    Used to hold the tags, ids and classes present in HTML snapshots.
+    """
+
+    def __init__(self):
+        self.tags = set(IMPLICIT_TAGS)
+        self.ids = set()
+        self.classes = set()
+        self.hasher = hashlib.sha256()
+
+    def addHtml(self, html):
+        """ Adds the tags, ids and classes of a given HTML document. """
+
+        parser = SnapshotParser(self)
+        parser.feed(html)
+        parser.close()
+        self.hasher.update(html.encode())
+
+    def addFiles(self, files):
+        """ Adds the tags, ids and classes of the given HTML files. """
+
+        for in_file in files:
+            with open(in_file, 'r', encoding="utf-8", errors="replace") as read_obj:
+                self.addHtml(read_obj.read())
+
+    @property
+    def digest(self) -> str:
+        """ The hash of the indexed documents. """
+
+        return self.hasher.hexdigest()
+
+
+def loadAllowlist(in_file) -> list:
+    """ Loads the patterns of a given allowlist file, one per line. Empty lines and lines starting with '//' are skipped. """
+
+    with open(in_file, 'r') as read_obj:
+        return [line.strip() for line in read_obj if line.strip() and not line.strip().startswith("//")]
+
+
+def stripNested(selector) -> str:
+    """ Removes the strings, attribute selectors and functional pseudo class arguments of a given selector. """
+
+    out = []
+    depth = 0
+    i = 0
+    while i < len(selector):
+        c = selector[i]
+        if c == "\\" and depth == 0:
+            out.append(selector[i:i + 2])
+            i += 2
+            continue
+        if c in "\"'":
+            i = cssdelta.skipString(selector, i)
+            continue
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def requirements(selector):
+    """ Gets the (tags, ids, classes) a given selector requires, see stripNested. """
+
+    stripped = stripNested(selector)
+    unescape = lambda names: set(escape_re.sub(r"\1", n) for n in names)
+    tags = set(t.lower() for t in tag_re.findall(stripped))
+    return tags, unescape(id_re.findall(stripped)), unescape(class_re.findall(stripped))
+
+
+
+
+def allowPattern(allowlist, kind):
+    """ Gets the regex matching the names of the patterns of a given kind ('.', '#' or '' for tags) of an allowlist. """
+
+    patterns = [p[len(kind):] for p in allowlist if p[:1] == kind or (not kind and p[:1] not in ".#")]
+    return re.compile("|".join(fnmatch.translate(p.lower() if not kind else p) for p in patterns) or "(?!)")
+
+
+class Pruner:
+    """
+    Used to drop the selectors of compiled stylesheets which can not match the markup of a DomIndex.
+
+    Parameters
+    ----------
+    index : DomIndex
+        The tags, ids and classes present.
+    allowlist : list of str
+        The patterns of the tags (div), ids (#id) and classes (.class) to consider present,
+        with * and ? wildcards. optional.
+    """
+
+    def __init__(self, index, allowlist=()):
+        self.index = index
+        self.allowlist = list(allowlist)
+        self.allow = {kind: allowPattern(self.allowlist, kind) for kind in (".", "#", "")}
+        self.removed = []
+        self.saved = 0
+
+    @property
+    def key(self) -> str:
+        """ The build cache key part of this pruner. """
+
+        return "prune " + self.index.digest + " " + "\n".join(self.allowlist)
+
+    def present(self, kind, names, present) -> bool:
+        """ Whether all the given names of a kind are present or allowed. """
+
+        return all(name in present or self.allow[kind].match(name) for name in names)
+
+    def canMatch(self, selector) -> bool:
+        """ Whether a given selector may match the indexed markup. """
+
+        tags, ids, classes = requirements(selector)
+        return self.present("", tags, self.index.tags) and self.present("#", ids, self.index.ids) and \
+            self.present(".", classes, self.index.classes)
+
+    def pruneRule(self, rule) -> str:
+        """ Gets the text of a given style rule without its selectors that can not match, empty if none can. """
+
+        text = rule.text
+        start = len(cssdelta.leading_re.match(text).group(0))
+        brace = start
+        while text[brace] != "{":
+            if text[brace] in "\"'":
+                brace = cssdelta.skipString(text, brace)
+            elif text.startswith("/*", brace):
+                brace = cssdelta.skipComment(text, brace)
+            else:
+                brace += 1
+        prelude = text[start:brace]
+        trailing = prelude[len(prelude.rstrip()):]
+
+        selectors = cssdelta.splitSelectors(prelude.rstrip())
+        kept = []
+        for separator, selector in selectors:
+            if self.canMatch(selector):
+                kept.append((separator, selector))
+            else:
+                self.removed.append(" ".join(selector.split()))
+        if len(kept) == len(selectors):
+            return text
+        if not kept:
+            return ""
+        # the first kept selector loses the comma before it
+        kept[0] = ("", kept[0][1])
+        return text[:start] + "".join(s + selector for s, selector in kept) + trailing + text[brace:]
+
+    def prune(self, css) -> str:
+        """ Drops the selectors of a given stylesheet that can not match, and the rules and
+        grouping at-rules (@media...) left empty. The dropped selectors are kept in removed
+        and the bytes saved in saved, until the next prune.
+
+        Returns:
+        -----------
+        Returns the pruned stylesheet."""
+
+        self.removed = []
+        parts = []
+        groups = []
+        for rule in cssdelta.splitRules(css):
+            if rule.kind == "open":
+                # the opening of a grouping at-rule, (index of the opening, whether a rule was kept)
+                groups.append([len(parts), False])
+                parts.append(rule.text)
+            elif rule.kind == "close":
+                opening, kept = groups.pop()
+                if kept:
+                    parts.append(rule.text)
+                    if groups:
+                        groups[-1][1] = True
+                else:
+                    del parts[opening:]
+            elif rule.kind != "rule":
+                # at-rules such as @font-face or @keyframes and the text after the last rule
+                parts.append(rule.text)
+                if groups:
+                    groups[-1][1] = True
+            else:
+                text = self.pruneRule(rule)
+                parts.append(text)
+                if text and groups:
+                    groups[-1][1] = True
+
+        pruned = "".join(parts)
+        self.saved = len(css.encode()) - len(pruned.encode())
+        return pruned
+
+    def report(self) -> str:
+        """ Gets the list of the dropped selectors and the bytes saved. """
+
+        lines = ["{:,} selectors removed, {:,} bytes saved.".format(len(self.removed), self.saved)]
+        lines.extend(self.removed)
+        return "\n".join(lines) + "\n"
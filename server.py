@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Theme server for compile.py
+
+Serves the user style compiled with the @var values given as query
+parameters, e.g. /darkmode.css?enableCompact=1&msgb=5px&compress=1
+
+Each compiled theme is kept in a size bounded LRU cache keyed on its
+normalised overrides (values in canonical form, defaults dropped, sorted),
+along with its gzip compressed body and a strong ETag, so repeated requests
+are answered with 304s or a precompressed body without compiling anything.
+Concurrent requests for a theme being compiled wait for that compile
+rather than starting their own. """
+
+
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+import userstyle
+
+
+# the query parameter choosing a minified theme, not a variable
+COMPRESS_PARAM = "compress"
+
+TRUE_VALUES = ("1", "true", "on", "yes")
+FALSE_VALUES = ("0", "false", "off", "no", "")
+
+
+class Theme:
+    """
+    Used to represent a compiled theme.
+
+    Parameters
+    ----------
+    css : bytes
+        The compiled CSS.
+    gz : bytes
+        The gzip compressed CSS.
+    etag : str
+        The strong ETag of the CSS, quoted. The gzip body has the same ETag suffixed by '-gz'.
+    """
+
+    __slots__ = ("css", "gz", "etag")
+
+    def __init__(self, css):
+        self.css = css.encode()
+        # no timestamp in the header so the same CSS always compresses to the same bytes
+        self.gz = gzip.compress(self.css, 9, mtime=0)
+        self.etag = '"' + hashlib.sha256(self.css).hexdigest()[:32] + '"'
+
+    @property
+    def size(self) -> int:
+        return len(self.css) + len(self.gz)
+
+    def etagOf(self, gzipped) -> str:
+        return self.etag[:-1] + '-gz"' if gzipped else self.etag
+
+
+class Pending:
+    """ Used to hand the result of a compile to the requests waiting for it. """
+
+    __slots__ = ("done", "theme", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.theme = None
+        self.error = None
+
+
+class ThemeCache:
+    """
+    Used to store compiled themes by key, evicting the least recently used ones once
+    the themes take more than max_size bytes. Safe to use from several threads.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximal total size of the themes in bytes, CSS and gzip bodies. (default 32 MB)
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.themes = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compile_css):
+        """ Gets the theme of a given key, compiling it if it is not cached.
+
+        Parameters:
+        -----------
+        key : hashable
+            The key of the theme.
+        compile_css : callable
+            Gets the CSS of the theme. Called once for concurrent requests of the same key.
+
+        Returns:
+        -----------
+        Returns a (theme, status) tuple, status being 'hit', 'miss' or 'shared' when the theme
+        was compiled by a concurrent request. Raises whatever compile_css raised."""
+
+        with self.lock:
+            theme = self.themes.get(key)
+            if theme is not None:
+                self.themes.move_to_end(key)
+                self.hits += 1
+                return theme, "hit"
+            pending = self.pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.pending[key] = Pending()
+                self.misses += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.theme, "shared"
+
+        try:
+            pending.theme = Theme(compile_css())
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+                if pending.theme is not None:
+                    self.put(key, pending.theme)
+            pending.done.set()
+        return pending.theme, "miss"
+
+    def put(self, key, theme):
+        """ Adds a theme, the lock should be held. Themes bigger than the cache are not kept. """
+
+        if theme.size > self.max_size:
+            return
+        old = self.themes.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self.themes[key] = theme
+        self.size += theme.size
+        while self.size > self.max_size:
+            _, evicted = self.themes.popitem(last=False)
+            self.size -= evicted.size
+
+
+class Source:
+    """
+    Used to hold a user style file and its variables, read again when the file changes.
+
+    Parameters
+    ----------
+    in_file : str
+        The user style file.
+    """
+
+    def __init__(self, in_file):
+        self.in_file = in_file
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.text = None
+        self.digest = None
+        self.variables = {}
+
+    def current(self):
+        """ Gets the (text, digest, variables) of the file as it is now. """
+
+        mtime = os.stat(self.in_file).st_mtime_ns
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.in_file, 'r') as read_obj:
+                    self.text = read_obj.read()
+                self.digest = hashlib.sha256(self.text.encode()).hexdigest()
+                style = userstyle.parseUserStyle(iter(self.text.splitlines(True)))
+                self.variables = {v.var_name: v for v in style.vars if v is not None}
+                self.mtime = mtime
+            return self.text, self.digest, self.variables
+
+
+def normalValue(v, value) -> str:
+    """ Gets the canonical form of a given value of a variable, as a stylus value.
+
+    Checkboxes become 0 or 1, numbers lose redundant digits and get the unit of the variable
+    and select options lose their quotes. Returns the value stripped when it can not be normalised."""
+
+    value = value.strip()
+    if v.type_name == "checkbox":
+        if value.lower() in TRUE_VALUES:
+            return "1"
+        if value.lower() in FALSE_VALUES:
+            return "0"
+    elif v.type_name in userstyle.RANGE_TYPES:
+        text = value[:-len(v.unit)] if v.unit and value.endswith(v.unit) else value
+        number = userstyle.parseNumber(text)
+        if number is not None:
+            if isinstance(number, float) and number.is_integer():
+                number = int(number)
+            return str(number) + (v.unit or "")
+    elif v.type_name == "select":
+        return userstyle.unquote(value)
+    return value
+
+
+def themeKey(query, variables):
+    """ Normalises the overrides of a given query string.
+
+    Parameters:
+    -----------
+    query : str
+        The query string, variable name -> value and optionally compress=1.
+    variables : dict
+        Variable name -> userstyle.Var of the user style.
+
+    Returns:
+    -----------
+    Returns a (overrides, compress) tuple, overrides being a sorted tuple of (name, value) pairs
+    without the values equal to the defaults. Raises KeyError for unknown variables."""
+
+    compress = False
+    overrides = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name == COMPRESS_PARAM:
+            compress = value.strip().lower() in TRUE_VALUES
+            continue
+        v = variables.get(name)
+        if v is None:
+            raise KeyError(name)
+        value = normalValue(v, value)
+        if value == normalValue(v, v.value):
+            overrides.pop(name, None)
+        else:
+            overrides[name] = value
+    return tuple(sorted(overrides.items())), compress
+
+
+def acceptsGzip(header) -> bool:
+    """ Whether a given Accept-Encoding header accepts gzip. """
+
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
+class ThemeHandler(BaseHTTPRequestHandler):
+    """ Used to answer the requests of a theme server, see serve. """
+
+    server_version = "DarkTelegramThemeServer/1.0"
+
+    def do_GET(self):
+        self.respond(True)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def respond(self, with_body):
+        url = urlsplit(self.path)
+        if url.path not in ("/", "/darkmode.css"):
+            self.sendText(404, "Not found. Request /darkmode.css?[variable=value&...]", with_body)
+            return
+
+        source = self.server.source
+        text, digest, variables = source.current()
+        try:
+            overrides, compress = themeKey(url.query, variables)
+        except KeyError as e:
+            self.sendText(400, "Unknown variable " + str(e), with_body)
+            return
+
+        def compileCss():
+            return self.server.compile_style(text, dict(overrides), compress=compress)
+
+        try:
+            theme, status = self.server.cache.get((digest, overrides, compress), compileCss)
+        except (KeyError, ValueError) as e:
+            self.sendText(400, "Invalid value of " + str(e), with_body)
+            return
+        except Exception as e:
+            self.sendText(500, "Could not compile the theme: " + str(e), with_body)
+            return
+
+        gzipped = acceptsGzip(self.headers.get("Accept-Encoding"))
+        etag = theme.etagOf(gzipped)
+        matches = [t.strip() for t in (self.headers.get("If-None-Match") or "").split(",")]
+        if etag in matches or "*" in matches:
+            self.send_response(304)
+            self.sendCacheHeaders(etag, status)
+            self.end_headers()
+            return
+
+        body = theme.gz if gzipped else theme.css
+        self.send_response(200)
+        self.send_header("Content-Type", "text/css; charset=utf-8")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.sendCacheHeaders(etag, status)
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def sendCacheHeaders(self, etag, status):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("X-Theme-Cache", status)
+
+    def sendText(self, code, text, with_body):
+        body = (text + "\n").encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+
+class ThemeServer(ThreadingHTTPServer):
+    """
+    Used to serve the themes of a user style, see ThemeHandler.
+
+    Parameters
+    ----------
+    address : (host, port) tuple
+        The address to listen on.
+    in_file : str
+        The user style file.
+    compile_style : callable
+        compile_style(source, overrides, compress=...) -> str, e.g. compile.compile_style.
+    cache : ThemeCache
+        The cache of the compiled themes. (default one of 32 MB)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, in_file, compile_style, cache=None):
+        super().__init__(address, ThemeHandler)
+        self.source = Source(in_file)
+        self.compile_style = compile_style
+        self.cache = cache or ThemeCache()
+
+
+def serve(in_file, compile_style, port=8080, host="127.0.0.1"):
+    """ Serves the themes of a given user style until interrupted.
+
+    Parameters:
+    -----------
+    in_file : str
+        The user style file, read again whenever it changes.
+    compile_style : callable
+        compile_style(source, overrides, compress=...) -> str, e.g. compile.compile_style.
+    port : int
+        The port to listen on. default is 8080.
+    host : str
+        The address to listen on. default is 127.0.0.1, local requests only."""
+
+    with ThemeServer((host, port), in_file, compile_style) as server:
+        print("Serving '" + in_file + "' on http://" + host + ":" + str(server.server_address[1]) +
+              "/darkmode.css. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        cache = server.cache
+        print("Stopped serving. " + str(cache.hits) + " cache hits, " + str(cache.misses) + " compiles, " +
+              str(len(cache.themes)) + " themes cached.")
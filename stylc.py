@@ -0,0 +1,2231 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Stylus compiler for Dark-Telegram.user.styl
+
+A small pure-Python compiler for the subset of Stylus used by
+Dark-Telegram.user.styl (mixins, variables, if\\else, for loops, hashes,
+interpolation, colour arithmetic, @media and @keyframes) so compile.py
+can build darkmode.css in-process without Node or the stylus npm package. """
+
+
+import math
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+
+version = "1.0.0"
+
+
+class StylusError(Exception):
+    """ Raised when the given source uses something this compiler does not support. """
+
+
+class CoercionError(StylusError):
+    """ Raised when two values cannot be coerced for an operation. """
+
+
+def roundHalfUp(n) -> int:
+    """ Rounds a number the same way JavaScript's toFixed(0) does. """
+
+    return int(Decimal(n).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def formatNumber(n, compress=False) -> str:
+    """ Formats a number the same way stylus prints units. """
+
+    is_float = n != int(n)
+    if compress and is_float and -1 < n < 1:
+        s = repr(float(n))
+        return s.replace("0.", ".", 1)
+    if is_float:
+        n = float("%.15f" % n)
+        s = repr(n)
+        if "e" in s:
+            s = format(Decimal(s), "f")
+        return s
+    return str(int(n))
+
+
+class Node:
+    """ Base class of every evaluated stylus value. """
+
+    def toBool(self) -> bool:
+        return True
+
+    def hash(self):
+        return str(self)
+
+    def operate(self, op, right):
+        return operateNode(self, op, right)
+
+    @property
+    def first(self):
+        return self
+
+    def nodes(self) -> list:
+        return [self]
+
+
+class Null(Node):
+    def toBool(self):
+        return False
+
+    def hash(self):
+        return None
+
+    def __str__(self):
+        return "null"
+
+
+class Boolean(Node):
+    def __init__(self, val):
+        self.val = bool(val)
+
+    def toBool(self):
+        return self.val
+
+    def hash(self):
+        return self.val
+
+    def __str__(self):
+        return "true" if self.val else "false"
+
+
+null = Null()
+true = Boolean(True)
+false = Boolean(False)
+
+
+# unit conversion factors, taken from stylus
+FACTOR_TABLE = {
+    "mm": ("length", .001),
+    "cm": ("length", .01),
+    "in": ("length", .0254),
+    "pt": ("length", .0254 / 72),
+    "ms": ("time", .001),
+    "s": ("time", 1),
+    "Hz": ("frequency", 1),
+    "kHz": ("frequency", 1000),
+}
+
+
+class Unit(Node):
+    """ A number with an optional unit type (px, %, s, deg...). """
+
+    def __init__(self, val, type=None):
+        self.val = val
+        self.type = type or None
+
+    def toBool(self):
+        return bool(self.type or self.val)
+
+    def hash(self):
+        return self.val
+
+    def coerce(self, other):
+        if isinstance(other, Unit):
+            fa = FACTOR_TABLE.get(self.type)
+            fb = FACTOR_TABLE.get(other.type)
+            if fa and fb and fa[0] == fb[0]:
+                return Unit(other.val * (fb[1] / fa[1]), self.type)
+            return Unit(other.val, self.type)
+        if isinstance(other, String):
+            if other.val == "%":
+                return Unit(0, "%")
+            try:
+                return Unit(float(other.val))
+            except ValueError:
+                pass
+        if isinstance(other, Boolean):
+            return Unit(1 if other.val else 0)
+        raise CoercionError("cannot coerce " + str(other) + " to unit")
+
+    def operate(self, op, right):
+        if isinstance(right.first, (Color, HSLA)):
+            return right.first.operate(op, self)
+        if op in ("+", "-", "*", "/", "%"):
+            right = right.first
+            utype = self.type or getattr(right, "type", None)
+            if self.type != "%" and op in ("+", "-") and getattr(right, "type", None) == "%":
+                right = Unit(self.val * (right.val / 100), "%")
+            else:
+                right = self.coerce(right)
+            if op == "+":
+                return Unit(self.val + right.val, utype)
+            if op == "-":
+                return Unit(self.val - right.val, utype)
+            if op == "*":
+                return Unit(self.val * right.val, utype)
+            if op == "/":
+                return Unit(self.val / right.val, utype)
+            return Unit(self.val % right.val, utype)
+        return operateNode(self, op, right)
+
+    def __str__(self):
+        return formatNumber(self.val) + (self.type or "")
+
+
+class String(Node):
+    """ A quoted string. Keeps the quote it was written with. """
+
+    def __init__(self, val, quote="'"):
+        self.val = val
+        self.quote = quote
+
+    def toBool(self):
+        return len(self.val) > 0
+
+    def hash(self):
+        return self.val
+
+    def operate(self, op, right):
+        if op == "+":
+            return String(self.val + plainString(right), self.quote)
+        return operateNode(self, op, right)
+
+    def __str__(self):
+        return self.quote + self.val + self.quote
+
+
+class Ident(Node):
+    """ An undefined identifier, printed as is (none, absolute, ease-in...). """
+
+    def __init__(self, name):
+        self.name = name
+
+    def hash(self):
+        return self.name
+
+    def __str__(self):
+        return self.name
+
+
+class Literal(Node):
+    """ Raw CSS text (!important, calc(), the result of s()...). """
+
+    def __init__(self, val):
+        self.val = val
+
+    def hash(self):
+        return self.val
+
+    def __str__(self):
+        return self.val
+
+
+class Url(Node):
+    """ A url() value. Quoted urls are printed with double quotes. """
+
+    def __init__(self, val, quoted):
+        self.val = val
+        self.quoted = quoted
+
+    def hash(self):
+        return self.val
+
+    def __str__(self):
+        if self.quoted:
+            return 'url("' + self.val + '")'
+        return "url(" + self.val + ")"
+
+
+class Call(Node):
+    """ A call to a function unknown to stylus, printed as a plain CSS function. """
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class Expr(Node):
+    """ A space (or comma when is_list) separated list of values. """
+
+    def __init__(self, nodes=None, is_list=False):
+        self.items = nodes if nodes is not None else []
+        self.is_list = is_list
+
+    @property
+    def first(self):
+        return self.items[0].first if self.items else null
+
+    def nodes(self):
+        return self.items
+
+    def toBool(self):
+        if len(self.items) > 1:
+            return True
+        return self.first.toBool()
+
+    def hash(self):
+        if len(self.items) == 1:
+            return self.items[0].hash()
+        return " ".join(str(n.hash()) for n in self.items)
+
+    def operate(self, op, right):
+        return self.first.operate(op, right)
+
+
+class Hash(Node):
+    """ An ordered {key: value} object. """
+
+    def __init__(self, vals):
+        self.vals = vals
+
+
+class Function(Node):
+    """ A user defined mixin\\function and the scope it was defined in. """
+
+    def __init__(self, name, params, body, scope):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.scope = scope
+
+
+def plainString(node) -> str:
+    """ Gets the unquoted text of a given value. """
+
+    node = node.first
+    if isinstance(node, String):
+        return node.val
+    if isinstance(node, Ident):
+        return node.name
+    if isinstance(node, Literal):
+        return node.val
+    if isinstance(node, Unit):
+        return str(node)
+    return str(node)
+
+
+def jsCompare(a, b, op) -> bool:
+    """ Compares two hashes roughly the way JavaScript does. """
+
+    if isinstance(a, bool):
+        a = int(a)
+    if isinstance(b, bool):
+        b = int(b)
+    if op == "==":
+        return a == b
+    if op == "!=":
+        return a != b
+    if isinstance(a, str) != isinstance(b, str):
+        try:
+            a, b = float(a), float(b)
+        except (TypeError, ValueError):
+            return False
+    if a is None or b is None:
+        return False
+    if op == ">":
+        return a > b
+    if op == "<":
+        return a < b
+    if op == ">=":
+        return a >= b
+    return a <= b
+
+
+def operateNode(left, op, right):
+    """ The default comparison\\logic operations shared by every value. """
+
+    if op in ("==", "!=", ">", "<", ">=", "<="):
+        return Boolean(jsCompare(left.hash(), right.hash(), op))
+    if op == "||":
+        return left if left.toBool() else right
+    if op == "&&":
+        return right if left.toBool() else left
+    if op == "in":
+        return Boolean(any(jsCompare(left.hash(), n.hash(), "==") for n in right.nodes()))
+    raise CoercionError("cannot perform " + str(left) + " " + op + " " + str(right))
+
+
+def clampChannel(n):
+    return max(0, min(roundHalfUp(n), 255))
+
+
+def clampAlpha(n):
+    return max(0, min(n, 1))
+
+
+def clampPercentage(n):
+    return max(0, min(n, 100))
+
+
+def clampDegrees(n):
+    n = math.fmod(n, 360)
+    return n if n >= 0 else 360 + n
+
+
+class Color(Node):
+    """ An RGBA colour. Channels are clamped and rounded like stylus does. """
+
+    def __init__(self, r, g, b, a=1):
+        self.r = clampChannel(r)
+        self.g = clampChannel(g)
+        self.b = clampChannel(b)
+        self.a = clampAlpha(a)
+
+    @property
+    def rgba(self):
+        return self
+
+    @property
+    def hsla(self):
+        r, g, b = self.r / 255, self.g / 255, self.b / 255
+        mn, mx = min(r, g, b), max(r, g, b)
+        l = (mx + mn) / 2
+        d = mx - mn
+        if mx == mn:
+            h = 0
+        elif mx == r:
+            h = 60 * (g - b) / d
+        elif mx == g:
+            h = 60 * (b - r) / d + 120
+        else:
+            h = 60 * (r - g) / d + 240
+        if mx == mn:
+            s = 0
+        elif l < .5:
+            s = d / (2 * l)
+        else:
+            s = d / (2 - 2 * l)
+        return HSLA(math.fmod(h, 360), s * 100, l * 100, self.a)
+
+    def hash(self):
+        return str(self)
+
+    def add(self, r, g, b, a):
+        return Color(self.r + r, self.g + g, self.b + b, self.a + a)
+
+    def sub(self, r, g, b, a):
+        return Color(self.r - r, self.g - g, self.b - b, self.a if a == 1 else self.a - a)
+
+    def operate(self, op, right):
+        if op != "in":
+            right = right.first
+        if op in ("+", "-") and isinstance(right, Unit):
+            n = right.val if op == "+" else -right.val
+            if right.type == "%":
+                return adjustColor(self, "l", Unit(n, "%"))
+            if right.type == "deg":
+                hsla = self.hsla
+                return HSLA(hsla.h + n, hsla.s, hsla.l, hsla.a).rgba
+            return self.add(n, n, n, 0)
+        if op in ("+", "-") and isinstance(right, (Color, HSLA)):
+            right = right.rgba
+            if op == "+":
+                return self.add(right.r, right.g, right.b, right.a)
+            return self.sub(right.r, right.g, right.b, right.a)
+        if op == "*" and isinstance(right, Unit):
+            return Color(self.r * right.val, self.g * right.val, self.b * right.val, self.a)
+        if op == "/" and isinstance(right, Unit):
+            return Color(self.r / right.val, self.g / right.val, self.b / right.val, self.a)
+        return operateNode(self, op, right)
+
+    def __str__(self):
+        if self.a == 1:
+            h = "%02x%02x%02x" % (self.r, self.g, self.b)
+            if h[0] == h[1] and h[2] == h[3] and h[4] == h[5]:
+                return "#" + h[0] + h[2] + h[4]
+            return "#" + h
+        a = formatNumber(float(Decimal(self.a).quantize(Decimal("0.001"), rounding=ROUND_HALF_UP)))
+        return "rgba(%d,%d,%d,%s)" % (self.r, self.g, self.b, a)
+
+
+class HSLA(Node):
+    """ An HSLA colour. Operations are done on its RGBA form. """
+
+    def __init__(self, h, s, l, a=1):
+        self.h = clampDegrees(h)
+        self.s = clampPercentage(s)
+        self.l = clampPercentage(l)
+        self.a = clampAlpha(a)
+
+    @property
+    def hsla(self):
+        return self
+
+    @property
+    def rgba(self):
+        h, s, l = self.h / 360, self.s / 100, self.l / 100
+        m2 = l * (s + 1) if l <= .5 else l + s - l * s
+        m1 = l * 2 - m2
+
+        def hue(h):
+            if h < 0:
+                h += 1
+            if h > 1:
+                h -= 1
+            if h * 6 < 1:
+                return m1 + (m2 - m1) * h * 6
+            if h * 2 < 1:
+                return m2
+            if h * 3 < 2:
+                return m1 + (m2 - m1) * (2 / 3 - h) * 6
+            return m1
+
+        return Color(hue(h + 1 / 3) * 255, hue(h) * 255, hue(h - 1 / 3) * 255, self.a)
+
+    def hash(self):
+        return str(self.rgba)
+
+    def operate(self, op, right):
+        if op in ("==", "!=", "<=", ">=", "<", ">", "||", "&&"):
+            return self.rgba.operate(op, right)
+        result = self.rgba.operate(op, right)
+        return result.hsla if isinstance(result, Color) else result
+
+    def __str__(self):
+        return str(self.rgba)
+
+
+def adjustColor(color, prop, amount):
+    """ Adjusts the given hsl component of a color by a given amount. """
+
+    hsla = color.hsla
+    vals = {"h": hsla.h, "s": hsla.s, "l": hsla.l}
+    n = amount.val
+    if amount.type == "%":
+        if prop == "l" and n > 0:
+            n = (100 - vals[prop]) * n / 100
+        else:
+            n = vals[prop] * (n / 100)
+    vals[prop] += n
+    return HSLA(vals["h"], vals["s"], vals["l"], hsla.a).rgba
+
+
+def parseHexColor(text):
+    """ Parses a #rgb, #rgba, #rrggbb or #rrggbbaa string. Returns None when not a color. """
+
+    h = text[1:]
+    if len(h) in (3, 4):
+        h = "".join(c * 2 for c in h)
+    if len(h) == 6:
+        h += "ff"
+    if len(h) != 8:
+        return None
+    try:
+        r, g, b, a = (int(h[i:i + 2], 16) for i in range(0, 8, 2))
+    except ValueError:
+        return None
+    return Color(r, g, b, a / 255)
+
+
+# css color names stylus resolves to rgba values
+COLOR_NAMES = {
+    "aqua": "#0ff", "black": "#000", "blue": "#00f", "fuchsia": "#f0f",
+    "gray": "#808080", "green": "#008000", "grey": "#808080", "lime": "#0f0",
+    "maroon": "#800000", "navy": "#000080", "olive": "#808000", "orange": "#ffa500",
+    "purple": "#800080", "red": "#f00", "silver": "#c0c0c0", "teal": "#008080",
+    "white": "#fff", "yellow": "#ff0",
+}
+
+
+class Statement:
+    """
+    Used to represent a parsed statement of a stylus source.
+
+    Parameters
+    ----------
+    kind : str
+        The statement kind (group, prop, assign, expr, return, if, for, media, keyframes, function, atrule, comment).
+    lineno : int
+        The line this statement starts at.
+    """
+
+    def __init__(self, kind, lineno=0, **fields):
+        self.kind = kind
+        self.lineno = lineno
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return "<" + self.kind + " @" + str(self.lineno) + ">"
+
+
+interpolation_re = re.compile(r"\{[^{}\s;:'\"]+\}")
+else_follows_re = re.compile(r"\s*else\b")
+section_token_re = re.compile(r"""['"{}]|//|/\*|(?<![\w-])url\(""", re.I)
+
+
+def splitSource(source, lineno=1):
+    """ Splits a given stylus source into nested statements and blocks.
+
+    The source is assumed to start at the given line number.
+
+    Returns
+    -----------
+    Returns a list of ('stmt', text, lineno), ('comment', text, lineno)
+    and ('block', header, children, lineno) tuples. """
+
+    root = []
+    stack = [root]
+    buf = []
+    buf_line = lineno
+    line = lineno
+    depth = 0
+    i = 0
+    n = len(source)
+
+    def flush():
+        text = "".join(buf).strip()
+        buf.clear()
+        if text:
+            stack[-1].append(("stmt", text, buf_line))
+
+    while i < n:
+        c = source[i]
+        if not buf or not "".join(buf).strip():
+            if not c.isspace():
+                buf_line = line
+
+        if c in "'\"":
+            j = source.find(c, i + 1)
+            if j < 0 or source.find("\n", i + 1, j) >= 0:
+                raise StylusError("unterminated string at line " + str(line))
+            buf.append(source[i:j + 1])
+            i = j + 1
+
+        elif source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            if j < 0:
+                raise StylusError("unterminated comment at line " + str(line))
+            text = source[i:j + 2]
+            if len(stack) == 1 and not "".join(buf).strip():
+                stack[-1].append(("comment", text, line))
+            line += text.count("\n")
+            i = j + 2
+
+        elif c in "\n;" and depth == 0:
+            flush()
+            if c == "\n":
+                line += 1
+            i += 1
+
+        elif c == "\n":
+            buf.append(" ")
+            line += 1
+            i += 1
+
+        elif source[i:i + 4].lower() == "url(" and (i == 0 or not (source[i - 1].isalnum() or source[i - 1] in "-_")):
+            j = matchingParen(source, i + 3)
+            buf.append(source[i:j + 1])
+            line += source.count("\n", i, j)
+            i = j + 1
+
+        elif c in "([":
+            depth += 1
+            buf.append(c)
+            i += 1
+
+        elif c in ")]":
+            depth = max(depth - 1, 0)
+            buf.append(c)
+            i += 1
+
+        elif c == "{":
+            m = interpolation_re.match(source, i)
+            if m:
+                buf.append(m.group(0))
+                i = m.end()
+            elif "".join(buf).rstrip().endswith("="):
+                j = matchingBrace(source, i)
+                buf.append(source[i:j + 1])
+                line += source.count("\n", i, j)
+                i = j + 1
+            else:
+                header = "".join(buf).strip()
+                buf.clear()
+                block = ("block", header, [], buf_line if header else line)
+                stack[-1].append(block)
+                stack.append(block[2])
+                i += 1
+
+        elif c == "}":
+            flush()
+            if len(stack) == 1:
+                raise StylusError("unexpected '}' at line " + str(line))
+            stack.pop()
+            i += 1
+
+        else:
+            buf.append(c)
+            i += 1
+
+    flush()
+    if len(stack) > 1:
+        raise StylusError("missing '}' at the end of the file")
+    return root
+
+
+def splitSections(source) -> list:
+    """ Splits a given stylus source into top level sections that can be parsed on their own.
+
+    A section ends at the end of a line closing a top level block, unless it is followed by an else.
+
+    Returns
+    -----------
+    Returns a list of (text, lineno) tuples. """
+
+    sections = []
+    start = 0
+    start_line = 1
+    depth = 0
+    i = 0
+    n = len(source)
+
+    while True:
+        m = section_token_re.search(source, i)
+        if m is None:
+            break
+        token = m.group(0)
+        i = m.start()
+
+        if token in ("'", '"'):
+            j = source.find(token, i + 1)
+            if j < 0 or source.find("\n", i + 1, j) >= 0:
+                j = i
+            i = j + 1
+
+        elif token == "//":
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+
+        elif token == "/*":
+            j = source.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+
+        elif token == "{":
+            m = interpolation_re.match(source, i)
+            if m:
+                i = m.end()
+            else:
+                depth += 1
+                i += 1
+
+        elif token == "}":
+            depth -= 1
+            i += 1
+            if depth == 0 and not else_follows_re.match(source, i):
+                end = source.find("\n", i)
+                end = n if end < 0 else end + 1
+                sections.append((source[start:end], start_line))
+                start_line += source.count("\n", start, end)
+                start = i = end
+
+        else:
+            try:
+                i = matchingParen(source, i + 3) + 1
+            except StylusError:
+                i = n
+
+    if source[start:].strip():
+        sections.append((source[start:], start_line))
+    return sections
+
+
+def matchingParen(source, i) -> int:
+    """ Finds the index of the parenthesis closing the one at the given index. """
+
+    depth = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c in "'\"":
+            j = source.find(c, i + 1)
+            i = n if j < 0 else j
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise StylusError("missing ')'")
+
+
+def matchingBrace(source, i) -> int:
+    """ Finds the index of the curly brace closing the one at the given index. """
+
+    depth = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c in "'\"":
+            j = source.find(c, i + 1)
+            i = n if j < 0 else j
+        elif source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise StylusError("missing '}'")
+
+
+HTML_TAGS = set((
+    "a abbr address article aside audio b blockquote body br button canvas caption "
+    "code col dd details dialog div dl dt em fieldset figcaption figure footer form "
+    "h1 h2 h3 h4 h5 h6 header hr html i iframe img input label legend li main menu "
+    "nav ol optgroup option p picture pre q s section select small span strong sub "
+    "summary sup svg table tbody td textarea tfoot th thead tr u ul video"
+).split())
+
+assign_re = re.compile(r"^([\w$-]+)\s*(\?=|\+=|-=|\*=|/=|=)(?!=)\s*(.*)$", re.S)
+call_re = re.compile(r"^-*[_a-zA-Z$][\w$-]*\(")
+tag_re = re.compile(r"^([a-zA-Z][\w-]*)(.*)$", re.S)
+if_re = re.compile(r"^(if|unless)\b\s*(.*)$", re.S)
+else_re = re.compile(r"^else\b\s*(.*)$", re.S)
+for_re = re.compile(r"^for\s+([\w$-]+)(?:\s*,\s*([\w$-]+))?\s+in\s+(.*)$", re.S)
+function_re = re.compile(r"^([-\w$]+)\s*\((.*)\)$", re.S)
+property_re = re.compile(r"^(-*[\w$-]+|\{[^}]*\}[\w-]*)\s*(?::\s*|\s+|$)(.*)$", re.S)
+
+
+def isSelectorLine(text) -> bool:
+    """ Guesses whether a given line is a part of a selector (rather than a property). """
+
+    if text.endswith(","):
+        return True
+    if text[0] in ".#&:[*>~+/{":
+        return True
+    m = tag_re.match(text)
+    if m is None or m.group(1).lower() not in HTML_TAGS:
+        return False
+    rest = m.group(2)
+    if rest == "" or rest[0] in ".#[>,":
+        return True
+    if rest[0] == ":":
+        return len(rest) > 1 and rest[1] != " "
+    after = rest.lstrip()
+    if after and after[0] in ".#[:>~+*&":
+        return True
+    m = tag_re.match(after)
+    return m is not None and m.group(1).lower() in HTML_TAGS and len(m.group(1)) > 1
+
+
+def parseStatements(items, keyframes=False) -> list:
+    """ Parses the output of splitSource into a list of Statements. """
+
+    result = []
+    pending = []
+    for item in items:
+        kind, text, lineno = item[0], item[1], item[-1]
+
+        if kind == "comment":
+            if not pending:
+                result.append(Statement("comment", lineno, text=text))
+
+        elif kind == "stmt":
+            if not keyframes and not assign_re.match(text) and not call_re.match(text) and isSelectorLine(text):
+                pending.append((text, lineno))
+                continue
+            for p_text, p_line in pending:
+                result.append(parseStatement(p_text, p_line))
+            pending = []
+            result.append(parseStatement(text, lineno))
+
+        else:
+            children = item[2]
+            if pending:
+                lines = [p[0] for p in pending]
+                if text:
+                    lines.append(text)
+                result.append(Statement("group", pending[0][1], selectors=lines,
+                                        body=parseStatements(children)))
+                pending = []
+            elif keyframes:
+                result.append(Statement("group", lineno, selectors=[text], body=parseStatements(children)))
+            else:
+                stmt = parseBlockHeader(text, children, lineno)
+                if stmt.kind == "else":
+                    last = result[-1] if result else None
+                    while last is not None and last.kind == "if" and last.orelse is not None:
+                        last = last.orelse[0] if len(last.orelse) == 1 and last.orelse[0].kind == "if" else None
+                    if last is None or last.kind != "if":
+                        raise StylusError("else without if at line " + str(lineno))
+                    last.orelse = [stmt.cond] if stmt.cond is not None else stmt.body
+                else:
+                    result.append(stmt)
+
+    for p_text, p_line in pending:
+        result.append(parseStatement(p_text, p_line))
+    return result
+
+
+def parseBlockHeader(header, children, lineno) -> Statement:
+    """ Parses a block header with its children into a Statement. """
+
+    m = if_re.match(header)
+    if m:
+        return Statement("if", lineno, cond=parseExpression(m.group(2)), negate=m.group(1) == "unless",
+                         body=parseStatements(children), orelse=None)
+
+    m = else_re.match(header)
+    if m:
+        cond = None
+        if m.group(1):
+            cond = parseBlockHeader(m.group(1), children, lineno)
+            if cond.kind != "if":
+                raise StylusError("invalid else at line " + str(lineno))
+        return Statement("else", lineno, cond=cond, body=None if cond else parseStatements(children))
+
+    m = for_re.match(header)
+    if m:
+        return Statement("for", lineno, val=m.group(1), key=m.group(2), expr=parseExpression(m.group(3)),
+                         body=parseStatements(children))
+
+    if header.startswith("@media"):
+        return Statement("media", lineno, query=header[6:].strip(), body=parseStatements(children))
+
+    m = re.match(r"^@(-\w+-)?keyframes\s+(.*)$", header, re.S)
+    if m:
+        return Statement("keyframes", lineno, name=m.group(2).strip(), body=parseStatements(children, True))
+
+    if header.startswith("@"):
+        return Statement("atrule", lineno, header=header, body=parseStatements(children))
+
+    m = function_re.match(header)
+    if m and not isSelectorLine(header):
+        return Statement("function", lineno, name=m.group(1), params=parseParams(m.group(2)),
+                         body=parseStatements(children))
+
+    return Statement("group", lineno, selectors=[header], body=parseStatements(children))
+
+
+def shiftLines(statements, delta):
+    """ Moves the given statements (and their children) by delta lines. """
+
+    for stmt in statements:
+        stmt.lineno += delta
+        for key in ("body", "orelse"):
+            children = getattr(stmt, key, None)
+            if isinstance(children, list):
+                shiftLines(children, delta)
+
+
+class ParseCache:
+    """
+    Used to reuse the parsed statements of unchanged top level sections between compiles.
+
+    Only the sections of the latest parsed source are kept so memory stays bounded.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, source) -> list:
+        """ Parses a given stylus source into a list of Statements, reusing unchanged sections. """
+
+        sections = {}
+        statements = []
+        self.hits = self.misses = 0
+        for text, lineno in splitSections(source):
+            entry = sections.get(text) or self.sections.get(text)
+            if entry is None or text in sections:
+                # a new section or a repeated one that needs its own statements
+                entry = [parseStatements(splitSource(text, lineno)), lineno]
+                self.misses += 1
+            else:
+                if entry[1] != lineno:
+                    shiftLines(entry[0], lineno - entry[1])
+                    entry[1] = lineno
+                self.hits += 1
+            sections[text] = entry
+            statements.extend(entry[0])
+        self.sections = sections
+        return statements
+
+
+def parseParams(text) -> list:
+    """ Parses the parameters of a function definition into (name, default) tuples. """
+
+    params = []
+    for part in splitTopLevel(text, ","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            name, default = part.split("=", 1)
+            params.append((name.strip(), parseExpression(default)))
+        else:
+            params.append((part, None))
+    return params
+
+
+def splitTopLevel(text, sep) -> list:
+    """ Splits a given text by a separator ignoring separators within strings, parenthesis and brackets. """
+
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(text):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def parseStatement(text, lineno) -> Statement:
+    """ Parses a single line statement (assignment, call, return or property). """
+
+    m = assign_re.match(text)
+    if m:
+        return Statement("assign", lineno, name=m.group(1), op=m.group(2), expr=parseExpression(m.group(3)))
+
+    if text == "return" or text.startswith("return "):
+        return Statement("return", lineno, expr=parseExpression(text[6:]) if text[6:].strip() else None)
+
+    if call_re.match(text) or text.startswith("("):
+        return Statement("expr", lineno, expr=parseExpression(text))
+
+    m = property_re.match(text)
+    if m is None:
+        raise StylusError("cannot parse '" + text + "' at line " + str(lineno))
+    return Statement("prop", lineno, name=m.group(1), expr=parseExpression(m.group(2), True))
+
+
+token_re = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<important>!\s*important\b)
+  | (?P<num>-?(?:\d+\.\d+|\d+|\.\d+)(?:%|[a-zA-Z]+)?)
+  | (?P<color>\#[0-9a-fA-F]+(?![\w-]))
+  | (?P<str>'[^']*'|"[^"]*")
+  | (?P<ident>-*[_a-zA-Z$][\w$-]*)
+  | (?P<op>==|!=|>=|<=|&&|\|\||[-+*/%!?:<>=,(){}\[\]~.])
+""", re.X)
+
+num_re = re.compile(r"^(-?(?:\d+\.\d+|\d+|\.\d+))(%|[a-zA-Z]+)?$")
+unit_cast_re = re.compile(r"^(%|[a-zA-Z]+)$")
+
+
+class Token:
+    def __init__(self, type, val, space):
+        self.type = type
+        self.val = val
+        self.space = space
+
+    def __repr__(self):
+        return self.type + ":" + self.val
+
+
+def tokenize(text) -> list:
+    """ Splits a given expression text into Tokens. """
+
+    tokens = []
+    i = 0
+    n = len(text)
+    space = False
+    while i < n:
+        low = text[i:i + 5].lower()
+        if low[:4] == "url(" or low == "calc(":
+            start = i + (4 if low[:4] == "url(" else 5)
+            j = matchingParen(text, start - 1)
+            tokens.append(Token("url" if low[:4] == "url(" else "calc", text[start:j].strip(), space))
+            space = False
+            i = j + 1
+            continue
+        m = token_re.match(text, i)
+        if m is None:
+            raise StylusError("unexpected '" + text[i] + "' in '" + text + "'")
+        kind = m.lastgroup
+        if kind == "ws":
+            space = True
+        else:
+            tokens.append(Token(kind, m.group(0), space))
+            space = False
+        i = m.end()
+    return tokens
+
+
+OPERATOR_WORDS = {"and": "&&", "or": "||", "is": "==", "isnt": "!="}
+KEYWORDS = ("and", "or", "is", "isnt", "not", "in")
+
+
+class ExpressionParser:
+    """
+    Used to parse an expression into a tuple tree.
+
+    Parameters
+    ----------
+    text : str
+        The expression to parse.
+    in_property : bool
+        Whether the expression is a property value where a '/' is kept as is.
+    """
+
+    def __init__(self, text, in_property=False):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.in_property = in_property
+        self.parens = 0
+        self.text = text
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def next(self):
+        t = self.peek()
+        self.pos += 1
+        return t
+
+    def isOp(self, *ops, offset=0) -> bool:
+        t = self.peek(offset)
+        return t is not None and t.type == "op" and t.val in ops
+
+    def isWord(self, *words, offset=0) -> bool:
+        t = self.peek(offset)
+        return t is not None and t.type == "ident" and t.val in words
+
+    def expect(self, op):
+        if not self.isOp(op):
+            raise StylusError("expected '" + op + "' in '" + self.text + "'")
+        return self.next()
+
+    def parse(self):
+        node = self.parseList()
+        if self.peek() is not None:
+            raise StylusError("unexpected '" + self.peek().val + "' in '" + self.text + "'")
+        return node
+
+    def parseList(self):
+        nodes = [self.parseExpression()]
+        while self.isOp(","):
+            self.next()
+            if self.peek() is None:
+                break
+            nodes.append(self.parseExpression())
+        if len(nodes) == 1:
+            return nodes[0]
+        return ("list", nodes)
+
+    def parseExpression(self):
+        nodes = []
+        while True:
+            node = self.parseNegation()
+            if node is None:
+                break
+            nodes.append(node)
+        return ("expr", nodes)
+
+    def parseNegation(self):
+        if self.isWord("not"):
+            self.next()
+            return ("unary", "!", self.parseNegation())
+        return self.parseTernary()
+
+    def parseTernary(self):
+        cond = self.parseLogical()
+        if cond is not None and self.isOp("?"):
+            self.next()
+            a = self.parseExpression()
+            self.expect(":")
+            b = self.parseExpression()
+            return ("ternary", cond, a, b)
+        return cond
+
+    def parseBinary(self, ops, words, operand):
+        left = operand()
+        while left is not None:
+            if self.isOp(*ops):
+                op = self.next().val
+            elif self.isWord(*words):
+                op = self.next().val
+                if op == "is" and self.isWord("not"):
+                    self.next()
+                    op = "!="
+                op = OPERATOR_WORDS.get(op, op)
+            else:
+                break
+            right = operand()
+            if right is None:
+                raise StylusError("missing right operand in '" + self.text + "'")
+            left = ("binop", op, left, right)
+        return left
+
+    def parseLogical(self):
+        return self.parseBinary(("&&", "||"), ("and", "or"), self.parseEquality)
+
+    def parseEquality(self):
+        return self.parseBinary(("==", "!="), ("is", "isnt"), self.parseIn)
+
+    def parseIn(self):
+        return self.parseBinary((), ("in",), self.parseRelational)
+
+    def parseRelational(self):
+        return self.parseBinary((">=", "<=", ">", "<"), (), self.parseAdditive)
+
+    def parseAdditive(self):
+        return self.parseBinary(("+", "-"), (), self.parseMultiplicative)
+
+    def parseMultiplicative(self):
+        left = self.parseUnary()
+        while left is not None and self.isOp("*", "/", "%"):
+            if self.isOp("/") and self.in_property and self.parens == 0:
+                break
+            op = self.next().val
+            left = ("binop", op, left, self.parseUnary())
+        return left
+
+    def parseUnary(self):
+        if self.isOp("!", "-", "+", "~") and self.peek(1) is not None and not self.isOp(")", ",", ":", offset=1):
+            op = self.next().val
+            return ("unary", op, self.parseUnary())
+        return self.parsePrimary()
+
+    def parsePrimary(self):
+        t = self.peek()
+        if t is None:
+            return None
+
+        if t.type == "num":
+            self.next()
+            m = num_re.match(t.val)
+            val = float(m.group(1))
+            return ("unit", int(val) if val == int(val) and "." not in m.group(1) else val, m.group(2))
+
+        if t.type == "color":
+            self.next()
+            return ("color", t.val)
+
+        if t.type == "str":
+            self.next()
+            return ("string", t.val[1:-1], t.val[0])
+
+        if t.type == "important":
+            self.next()
+            return ("literal", "!important")
+
+        if t.type == "url":
+            self.next()
+            val = t.val
+            quoted = len(val) > 1 and val[0] in "'\"" and val[-1] == val[0]
+            return ("url", val[1:-1] if quoted else val, quoted)
+
+        if t.type == "calc":
+            self.next()
+            return ("literal", "calc(" + t.val + ")")
+
+        if t.type == "ident":
+            if t.val in KEYWORDS:
+                return None
+            self.next()
+            if self.isOp("(") and not self.peek().space:
+                return self.parseCall(t.val)
+            if t.val == "true":
+                return ("bool", True)
+            if t.val == "false":
+                return ("bool", False)
+            if t.val == "null":
+                return ("null",)
+            return ("ident", t.val)
+
+        if self.isOp("("):
+            self.next()
+            self.parens += 1
+            node = self.parseList()
+            self.parens -= 1
+            self.expect(")")
+            u = self.peek()
+            if u is not None and not u.space and (u.type == "ident" and unit_cast_re.match(u.val) or
+                                                  u.type == "op" and u.val == "%"):
+                self.next()
+                return ("cast", node, u.val)
+            return ("paren", node)
+
+        if self.isOp("{"):
+            return self.parseHash()
+
+        if self.isOp("/") and self.in_property and self.parens == 0:
+            self.next()
+            return ("literal", "/")
+
+        return None
+
+    def parseCall(self, name):
+        self.expect("(")
+        self.parens += 1
+        args = []
+        while not self.isOp(")"):
+            arg_name = None
+            if self.peek() is not None and self.peek().type == "ident" and self.isOp("=", offset=1):
+                arg_name = self.next().val
+                self.next()
+            args.append((arg_name, self.parseExpression()))
+            if not self.isOp(","):
+                break
+            self.next()
+        self.parens -= 1
+        self.expect(")")
+        return ("call", name, args)
+
+    def parseHash(self):
+        self.expect("{")
+        self.parens += 1
+        pairs = []
+        while not self.isOp("}"):
+            t = self.next()
+            if t is None:
+                raise StylusError("missing '}' in '" + self.text + "'")
+            key = t.val[1:-1] if t.type == "str" else t.val
+            self.expect(":")
+            pairs.append((key, self.parseExpression()))
+            if not self.isOp(","):
+                break
+            self.next()
+        self.parens -= 1
+        self.expect("}")
+        return ("hash", pairs)
+
+
+def parseExpression(text, in_property=False):
+    """ Parses a given expression text into a tuple tree. """
+
+    return ExpressionParser(text, in_property).parse()
+
+
+class Scope:
+    """ A variables scope, looking up missing names in its parent. """
+
+    def __init__(self, parent=None):
+        self.vars = {}
+        self.parent = parent
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.vars:
+                return scope.vars[name]
+            scope = scope.parent
+        return None
+
+    def set(self, name, value):
+        self.vars[name] = value
+
+
+class Return(Exception):
+    """ Used to unwind a function body on a return statement. """
+
+    def __init__(self, value):
+        self.value = value
+
+
+def unwrap(value):
+    """ Removes redundant single item expression wrappers. """
+
+    while isinstance(value, Expr) and len(value.items) == 1 and isinstance(value.items[0], Expr):
+        value = value.items[0]
+    return value
+
+
+def assertUnit(value, name):
+    value = value.first
+    if not isinstance(value, Unit):
+        raise StylusError("expected a unit for " + name + ", got " + str(value))
+    return value
+
+
+def assertColor(value, name):
+    value = value.first
+    if not isinstance(value, (Color, HSLA)):
+        raise StylusError("expected a color for " + name + ", got " + str(value))
+    return value
+
+
+class Evaluator:
+    """
+    Used to evaluate parsed statements into a tree of CSS nodes.
+
+    Parameters
+    ----------
+    compress : bool
+        Whether values compiled within the source (by s()) should be compressed. (default False)
+    """
+
+    def __init__(self, compress=False):
+        self.compress = compress
+        self.calling = []
+        self.deferred = []
+        self.root = Scope()
+
+    def evaluate(self, statements) -> list:
+        """ Evaluates the given root statements. Returns the CSS nodes of the root block. """
+
+        out = []
+        self.runBlock(statements, out, self.root)
+        return out
+
+    def runBlock(self, statements, out, scope):
+        """ Evaluates the statements of a new CSS block, appending keyframes at its end. """
+
+        self.deferred.append([])
+        try:
+            return self.run(statements, out, scope)
+        finally:
+            out.extend(self.deferred.pop())
+
+    def run(self, statements, out, scope):
+        """ Evaluates the given statements into out. Returns the value of the last one. """
+
+        value = null
+        for st in statements:
+            value = getattr(self, "visit_" + st.kind)(st, out, scope)
+        return value
+
+    def visit_comment(self, st, out, scope):
+        out.append(Statement("comment", st.lineno, text=st.text))
+        return null
+
+    def visit_assign(self, st, out, scope):
+        value = self.eval(st.expr, scope)
+        if st.op == "?=":
+            if scope.lookup(st.name) is not None:
+                return null
+        elif st.op != "=":
+            current = scope.lookup(st.name)
+            if current is None:
+                raise StylusError("undefined variable " + st.name + " at line " + str(st.lineno))
+            value = Expr([self.operate(st.op[0], current, value)])
+        scope.set(st.name, value)
+        return value
+
+    def visit_return(self, st, out, scope):
+        raise Return(self.eval(st.expr, scope) if st.expr is not None else null)
+
+    def visit_function(self, st, out, scope):
+        scope.set(st.name, Function(st.name, st.params, st.body, scope))
+        return null
+
+    def visit_prop(self, st, out, scope):
+        name = self.interpolate(st.name, scope)
+        fn = scope.lookup(name)
+        if isinstance(fn, Function) and name not in self.calling:
+            node = st.expr
+            if node[0] == "list":
+                args, is_list = node[1], True
+            else:
+                args, is_list = [("expr", [n]) for n in node[1]], False
+            return self.invoke(fn, [(None, self.eval(a, scope)) for a in args], out, is_list)
+        out.append(Statement("decl", st.lineno, name=name, value=self.eval(st.expr, scope)))
+        return null
+
+    def visit_expr(self, st, out, scope):
+        return self.mixinExpression(st.expr, out, scope)
+
+    def mixinExpression(self, node, out, scope):
+        """ Evaluates an expression statement, calling user functions within it as mixins. """
+
+        if node[0] == "expr" and len(node[1]) == 1:
+            node = node[1][0]
+        if node[0] == "paren":
+            return self.mixinExpression(node[1], out, scope)
+        if node[0] == "ternary":
+            branch = node[2] if self.eval(node[1], scope).toBool() else node[3]
+            return self.mixinExpression(branch, out, scope)
+        if node[0] == "call":
+            fn = scope.lookup(node[1])
+            if isinstance(fn, Function):
+                return self.invoke(fn, self.evalArgs(node[2], scope), out)
+        return self.eval(node, scope)
+
+    def visit_if(self, st, out, scope):
+        passed = self.eval(st.cond, scope).toBool()
+        if st.negate:
+            passed = not passed
+        body = st.body if passed else st.orelse
+        if not body:
+            return null
+        if any(s.kind == "media" for s in body):
+            scope = Scope(scope)
+        return self.run(body, out, scope)
+
+    def visit_for(self, st, out, scope):
+        expr = unwrap(self.eval(st.expr, scope))
+        value = null
+        if isinstance(expr.first, Hash) and len(expr.nodes()) == 1:
+            pairs = [(String(k), v) for k, v in expr.first.vals.items()]
+        else:
+            pairs = [(n, Unit(i)) for i, n in enumerate(expr.nodes())]
+        for val, key in pairs:
+            scope.set(st.val, val)
+            if st.key:
+                scope.set(st.key, key)
+            value = self.run(st.body, out, scope)
+        return value
+
+    def visit_group(self, st, out, scope):
+        selectors = []
+        for line in st.selectors:
+            for sel in splitTopLevel(self.interpolate(line, scope), ","):
+                sel = sel.strip()
+                if not sel:
+                    continue
+                if sel.startswith("/"):
+                    selectors.append((sel[1:].strip(), False))
+                else:
+                    selectors.append((sel, True))
+        group = Statement("rule", st.lineno, selectors=selectors, items=[])
+        out.append(group)
+        self.runBlock(st.body, group.items, Scope(scope))
+        return null
+
+    def visit_media(self, st, out, scope):
+        media = Statement("media", st.lineno, query=self.evalMediaQuery(st.query, scope), items=[])
+        out.append(media)
+        self.runBlock(st.body, media.items, Scope(scope))
+        return null
+
+    def visit_atrule(self, st, out, scope):
+        rule = Statement("atrule", st.lineno, header=self.interpolate(st.header, scope), items=[])
+        out.append(rule)
+        self.runBlock(st.body, rule.items, Scope(scope))
+        return null
+
+    def visit_keyframes(self, st, out, scope):
+        name = self.interpolate(st.name, scope)
+        value = scope.lookup(name)
+        if value is not None:
+            name = plainString(value)
+        frames = []
+        for frame in st.body:
+            if frame.kind != "group":
+                continue
+            items = []
+            self.runBlock(frame.body, items, Scope(scope))
+            frames.append((", ".join(self.interpolate(s, scope) for s in frame.selectors), items))
+        for prefix in ("moz", "webkit", "o", "official"):
+            self.deferred[-1].append(Statement("keyframes", st.lineno, prefix=prefix, name=name, frames=frames))
+        return null
+
+    def evalMediaQuery(self, query, scope) -> str:
+        """ Evaluates the features values of a media query, e.g. (max-width compactBreak). """
+
+        def feature(m):
+            value = self.eval(parseExpression(m.group(2)), scope)
+            return "(" + m.group(1) + ": " + renderValue(value, self.compress) + ")"
+
+        query = self.interpolate(query, scope)
+        return re.sub(r"\(\s*([\w-]+)\s*:?\s*([^)]+?)\s*\)", feature, query)
+
+    def interpolate(self, text, scope) -> str:
+        """ Replaces {expr} parts of a given text with their evaluated values. """
+
+        if "{" not in text:
+            return text
+
+        def replace(m):
+            value = self.eval(parseExpression(m.group(0)[1:-1]), scope)
+            return interpolationString(value, self.compress)
+
+        return interpolation_re.sub(replace, text)
+
+    def invoke(self, fn, args, out, is_list=False):
+        """ Calls a given user function with evaluated (name, value) arguments. """
+
+        fscope = Scope(fn.scope)
+        positional = [v for n, v in args if n is None]
+        named = dict((n, v) for n, v in args if n is not None)
+        arguments = list(positional)
+        index = 0
+        for name, default in fn.params:
+            if name in named:
+                value = named[name]
+                arguments.append(value)
+            elif index < len(positional):
+                value = positional[index]
+                index += 1
+            elif default is not None:
+                value = self.eval(default, fscope)
+                arguments.append(value)
+            else:
+                value = null
+            fscope.set(name, value)
+        fscope.set("arguments", Expr(arguments, is_list))
+
+        self.calling.append(fn.name)
+        try:
+            return self.run(fn.body, out, fscope)
+        except Return as r:
+            return r.value
+        finally:
+            self.calling.pop()
+
+    def evalArgs(self, args, scope) -> list:
+        return [(name, self.eval(node, scope)) for name, node in args]
+
+    def operate(self, op, left, right):
+        try:
+            return left.operate(op, right)
+        except CoercionError:
+            if op == "==":
+                return false
+            if op == "!=":
+                return true
+            raise
+
+    def eval(self, node, scope):
+        """ Evaluates a given expression tree into a value. """
+
+        kind = node[0]
+        if kind == "expr":
+            return Expr([self.eval(n, scope) for n in node[1]])
+        if kind == "list":
+            return Expr([self.eval(n, scope) for n in node[1]], True)
+        if kind == "unit":
+            return Unit(node[1], node[2])
+        if kind == "color":
+            return parseHexColor(node[1]) or Literal(node[1])
+        if kind == "string":
+            return String(node[1], node[2])
+        if kind == "literal":
+            return Literal(node[1])
+        if kind == "url":
+            return Url(node[1], node[2])
+        if kind == "bool":
+            return true if node[1] else false
+        if kind == "null":
+            return null
+        if kind == "ident":
+            value = scope.lookup(node[1])
+            if value is None or isinstance(value, Function):
+                if node[1].lower() in COLOR_NAMES:
+                    return parseHexColor(COLOR_NAMES[node[1].lower()])
+                return Ident(node[1])
+            return value
+        if kind == "paren":
+            return self.eval(node[1], scope)
+        if kind == "cast":
+            value = unwrap(self.eval(node[1], scope)).first
+            if isinstance(value, Unit):
+                return Unit(value.val, node[2])
+            return value
+        if kind == "unary":
+            value = self.eval(node[2], scope)
+            if node[1] == "!":
+                return Boolean(not value.toBool())
+            value = assertUnit(value, "unary " + node[1])
+            return Unit(-value.val if node[1] == "-" else value.val, value.type)
+        if kind == "binop":
+            op = node[1]
+            left = self.eval(node[2], scope)
+            if op == "||":
+                return left if left.toBool() else self.eval(node[3], scope)
+            if op == "&&":
+                return self.eval(node[3], scope) if left.toBool() else left
+            return self.operate(op, left, self.eval(node[3], scope))
+        if kind == "ternary":
+            return self.eval(node[2] if self.eval(node[1], scope).toBool() else node[3], scope)
+        if kind == "hash":
+            return Hash(dict((k, self.eval(v, scope)) for k, v in node[1]))
+        if kind == "call":
+            fn = scope.lookup(node[1])
+            args = self.evalArgs(node[2], scope)
+            if isinstance(fn, Function):
+                return self.invoke(fn, args, [])
+            bif = BUILTINS.get(node[1])
+            if bif is not None:
+                return bif(self, *[v for n, v in args])
+            return Call(node[1], [v for n, v in args])
+        raise StylusError("cannot evaluate " + kind)
+
+
+
+def bifRgba(ev, color, green=None, blue=None, alpha=None):
+    if green is None:
+        return assertColor(color, "color").rgba
+    if blue is None:
+        color = assertColor(color, "color").rgba
+        alpha = assertUnit(green, "alpha")
+        a = alpha.val / 100 if alpha.type == "%" else alpha.val
+        return Color(color.r, color.g, color.b, a)
+    channels = []
+    for c in (color, green, blue):
+        c = assertUnit(c, "channel")
+        channels.append(round(c.val * 2.55) if c.type == "%" else c.val)
+    a = 1 if alpha is None else assertUnit(alpha, "alpha").val
+    return Color(channels[0], channels[1], channels[2], a)
+
+
+def bifRgb(ev, color, green=None, blue=None):
+    if green is None:
+        color = assertColor(color, "color").rgba
+        return Color(color.r, color.g, color.b, 1)
+    return bifRgba(ev, color, green, blue)
+
+
+def bifHsla(ev, hue, saturation=None, lightness=None, alpha=None):
+    if saturation is None:
+        return assertColor(hue, "color").hsla
+    if lightness is None:
+        hsla = assertColor(hue, "color").hsla
+        return HSLA(hsla.h, hsla.s, hsla.l, assertUnit(saturation, "alpha").val)
+    a = 1 if alpha is None else assertUnit(alpha, "alpha").val
+    return HSLA(assertUnit(hue, "hue").val, assertUnit(saturation, "saturation").val,
+                assertUnit(lightness, "lightness").val, a)
+
+
+def bifComponent(prop, unit_type):
+    def component(ev, color, value=None):
+        hsla = assertColor(color, "color").hsla
+        if value is None:
+            return Unit(getattr(hsla, prop), unit_type)
+        vals = {"h": hsla.h, "s": hsla.s, "l": hsla.l}
+        vals[prop] = assertUnit(value, prop).val
+        return HSLA(vals["h"], vals["s"], vals["l"], hsla.a)
+    return component
+
+
+def bifAlpha(ev, color, value=None):
+    color = assertColor(color, "color").rgba
+    if value is None:
+        return Unit(color.a)
+    return Color(color.r, color.g, color.b, assertUnit(value, "alpha").val)
+
+
+def bifLighten(ev, color, amount):
+    return adjustColor(assertColor(color, "color"), "l", assertUnit(amount, "amount"))
+
+
+def bifDarken(ev, color, amount):
+    amount = assertUnit(amount, "amount")
+    return adjustColor(assertColor(color, "color"), "l", Unit(-amount.val, amount.type))
+
+
+def bifUnit(ev, value, type=None):
+    value = assertUnit(value, "unit")
+    if type is None:
+        return String(value.type or "")
+    return Unit(value.val, plainString(type) or None)
+
+
+def bifMin(ev, a, b):
+    return a if ev.operate("<", a.first, b.first).toBool() else b
+
+
+def bifMax(ev, a, b):
+    return a if ev.operate(">", a.first, b.first).toBool() else b
+
+
+def bifMath(fn):
+    def apply(ev, value):
+        value = assertUnit(value, "n")
+        return Unit(fn(value.val), value.type)
+    return apply
+
+
+def bifS(ev, fmt, *args):
+    args = list(args)
+
+    def replace(m):
+        arg = args.pop(0) if args else null
+        if m.group(1) == "s":
+            return renderValue(arg, ev.compress)
+        return formatNumber(assertUnit(arg, "%d").val)
+
+    return Literal(re.sub(r"%(s|d)", replace, plainString(fmt)))
+
+
+def bifUnquote(ev, value):
+    return Literal(plainString(value))
+
+
+def bifLength(ev, value=None):
+    if value is None:
+        return Unit(0)
+    return Unit(len(unwrap(value).nodes()))
+
+
+BUILTINS = {
+    "rgba": bifRgba,
+    "rgb": bifRgb,
+    "hsla": bifHsla,
+    "hsl": bifHsla,
+    "hue": bifComponent("h", "deg"),
+    "saturation": bifComponent("s", "%"),
+    "lightness": bifComponent("l", "%"),
+    "alpha": bifAlpha,
+    "lighten": bifLighten,
+    "darken": bifDarken,
+    "unit": bifUnit,
+    "min": bifMin,
+    "max": bifMax,
+    "abs": bifMath(abs),
+    "ceil": bifMath(math.ceil),
+    "floor": bifMath(math.floor),
+    "round": bifMath(roundHalfUp),
+    "s": bifS,
+    "unquote": bifUnquote,
+    "length": bifLength,
+}
+
+
+# units stylus keeps when compressing a zero value
+KEEP_ZERO_UNITS = ("%", "s", "ms", "deg", "fr")
+
+
+def renderValue(value, compress=False) -> str:
+    """ Generates the CSS text of a given evaluated value. """
+
+    if isinstance(value, Expr):
+        parts = [renderValue(n, compress) for n in value.items]
+        if value.is_list:
+            return ("," if compress else ", ").join(parts)
+        result = ""
+        for i, part in enumerate(parts):
+            result += part
+            if i < len(parts) - 1 and part != "/" and parts[i + 1] != "/":
+                result += " "
+        return result
+    if isinstance(value, Unit):
+        if compress and value.val == 0 and value.type not in KEEP_ZERO_UNITS:
+            return "0"
+        return formatNumber(value.val, compress) + (value.type or "")
+    if isinstance(value, Call):
+        args = [renderValue(a, compress) for a in value.args]
+        return value.name + "(" + ("," if compress else ", ").join(args) + ")"
+    if isinstance(value, Function):
+        return value.name
+    if isinstance(value, Hash):
+        raise StylusError("cannot print an object as a CSS value")
+    return str(value)
+
+
+def interpolationString(value, compress=False) -> str:
+    """ Generates the text of a value interpolated within a selector or a name. """
+
+    value = unwrap(value)
+    if isinstance(value, Expr):
+        return " ".join(interpolationString(n, compress) for n in value.items)
+    if isinstance(value, (String, Literal)):
+        return value.val
+    return renderValue(value, compress)
+
+
+def compileSelectors(levels) -> list:
+    """ Generates the final selectors of a rule from the selectors of each nesting level.
+
+    Parameters:
+    -----------
+    levels : list of list
+        Selectors of each nesting level (outermost first) as (selector, inherits) tuples.
+
+    Returns:
+    -----------
+    Returns a list of unique selectors in the order stylus generates them."""
+
+    selectors = []
+    buf = []
+
+    def parse(selector):
+        result = selector
+        for child in buf:
+            if "&" in child:
+                result = child.replace("&", result)
+            else:
+                result = result + " " + child
+        return result.strip()
+
+    def compile(i):
+        for selector, inherits in levels[i]:
+            if i > 0 and inherits:
+                buf.insert(0, selector)
+                compile(i - 1)
+                buf.pop(0)
+            else:
+                s = parse(selector)
+                if s:
+                    selectors.append(s)
+
+    compile(len(levels) - 1)
+    return list(dict.fromkeys(selectors))
+
+
+class Renderer:
+    """
+    Used to generate CSS text from evaluated CSS nodes.
+
+    Parameters
+    ----------
+    compress : bool
+        Whether to generate a compressed output. (default False)
+    linenos : bool
+        Whether to include the source line of each rule as a comment. (default False)
+    filename : str
+        The name of the source file used by linenos. (default 'stdin')
+    """
+
+    def __init__(self, compress=False, linenos=False, filename="stdin"):
+        self.compress = compress
+        self.linenos = linenos
+        self.filename = filename
+
+    def render(self, items) -> str:
+        buf = []
+        self.renderBlock(items, [], "", buf)
+        return "".join(buf)
+
+    def renderDecls(self, decls, indent, buf):
+        if self.compress:
+            buf.append(";".join(d.name + ":" + renderValue(d.value, True) for d in decls))
+        else:
+            for d in decls:
+                buf.append(indent + d.name + ": " + renderValue(d.value) + ";\n")
+
+    def renderRule(self, selectors, decls, lineno, indent, buf):
+        if self.linenos and not self.compress:
+            buf.append(indent + "/* line " + str(lineno) + " : " + self.filename + " */\n")
+        if self.compress:
+            buf.append(",".join(selectors) + "{")
+            self.renderDecls(decls, "", buf)
+            buf.append("}")
+        else:
+            buf.append(",\n".join(indent + s for s in selectors) + " {\n")
+            self.renderDecls(decls, indent + "  ", buf)
+            buf.append(indent + "}\n")
+
+    def renderBlock(self, items, levels, indent, buf, lineno=0):
+        decls = [i for i in items if i.kind == "decl"]
+        if decls and levels:
+            self.renderRule(compileSelectors(levels), decls, lineno, indent, buf)
+
+        for item in items:
+            if item.kind == "rule":
+                self.renderBlock(item.items, levels + [item.selectors], indent, buf, item.lineno)
+
+            elif item.kind in ("media", "atrule"):
+                header = "@media " + item.query if item.kind == "media" else item.header
+                buf.append(indent + header + ("{" if self.compress else " {\n"))
+                self.renderBlock(item.items, levels, indent if self.compress else indent + "  ", buf, lineno)
+                buf.append("}" if self.compress else indent + "}\n")
+
+            elif item.kind == "keyframes":
+                prefix = "@keyframes " if item.prefix == "official" else "@-" + item.prefix + "-keyframes "
+                buf.append(indent + prefix + item.name + ("{" if self.compress else " {\n"))
+                for selector, frame in item.frames:
+                    self.renderRule([selector], [d for d in frame if d.kind == "decl"], item.lineno,
+                                    "" if self.compress else indent + "  ", buf)
+                buf.append("}" if self.compress else indent + "}\n")
+
+            elif item.kind == "comment" and not self.compress:
+                buf.append(indent + item.text + "\n")
+
+
+word_re = re.compile(r"[\w-]+")
+
+
+def copyStatement(st, **fields) -> Statement:
+    """ Creates a shallow copy of a given statement with some of its fields replaced. """
+
+    new = Statement.__new__(Statement)
+    new.__dict__.update(st.__dict__)
+    new.__dict__.update(fields)
+    return new
+
+
+class ConstantFolder:
+    """
+    Used to drop the branches of parsed statements that can not run with the values of some variables.
+
+    A variable is folded when it is assigned once at the top level and is never bound anywhere else
+    (assigned, used as a function name, a parameter or a loop variable). The conditions made of such
+    variables, literals and builtin calls are evaluated ahead, the dead branches are dropped and the
+    mixins left uncalled are removed. The statements given are not modified so they can be cached.
+    The CSS is the same as without folding, as the dropped statements write nothing: folding only
+    saves evaluating them, the counts are of the statements not evaluated.
+
+    Parameters
+    ----------
+    names : iterable of str
+        The names of the variables that may be folded, e.g. the UserStyle variables.
+    """
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.branches = 0
+        self.statements = 0
+        self.rules = 0
+        self.mixins = 0
+
+    def fold(self, statements) -> list:
+        """ Folds the given root statements. Returns the folded statements. """
+
+        self.branches = self.statements = self.rules = self.mixins = 0
+        self.bound = {"arguments": 2}
+        self.collectBindings(statements)
+
+        evaluator = Evaluator()
+        scope = Scope()
+        constants = set()
+        result = []
+        for st in statements:
+            result.extend(self.foldStatement(st, evaluator, scope, constants))
+            # the variable can be folded by the statements following its assignment
+            if st.kind == "assign" and st.op == "=" and st.name in self.names and \
+                    self.bound.get(st.name) == 1 and self.isConstant(st.expr, constants):
+                try:
+                    scope.set(st.name, evaluator.eval(st.expr, scope))
+                    constants.add(st.name)
+                except Exception:
+                    pass
+        return self.dropMixins(result)
+
+    def collectBindings(self, statements):
+        """ Counts the bindings of each name within the given statements. """
+
+        for st in statements:
+            names = []
+            if st.kind == "assign":
+                names.append(st.name)
+            elif st.kind == "function":
+                names.append(st.name)
+                names.extend(name for name, _ in st.params)
+            elif st.kind == "for":
+                names.extend(n for n in (st.val, st.key) if n)
+            for name in names:
+                self.bound[name] = self.bound.get(name, 0) + 1
+            for key in ("body", "orelse"):
+                children = getattr(st, key, None)
+                if isinstance(children, list):
+                    self.collectBindings(children)
+
+    def isConstant(self, node, constants) -> bool:
+        """ Whether a given expression tree only depends on the given constants, literals and builtins. """
+
+        kind = node[0]
+        if kind in ("expr", "list"):
+            return all(self.isConstant(n, constants) for n in node[1])
+        if kind in ("paren", "cast"):
+            return self.isConstant(node[1], constants)
+        if kind == "unary":
+            return self.isConstant(node[2], constants)
+        if kind == "binop":
+            return self.isConstant(node[2], constants) and self.isConstant(node[3], constants)
+        if kind == "ternary":
+            return all(self.isConstant(n, constants) for n in node[1:])
+        if kind == "hash":
+            return all(self.isConstant(v, constants) for _, v in node[1])
+        if kind == "ident":
+            # names which are never bound evaluate to themselves
+            return node[1] in constants or node[1] not in self.bound
+        if kind == "call":
+            return node[1] not in self.bound and all(self.isConstant(v, constants) for _, v in node[2])
+        return kind in ("unit", "color", "string", "literal", "url", "bool", "null")
+
+    def countDropped(self, statements):
+        """ Adds the given dropped statements to the counts. """
+
+        for st in statements or []:
+            self.statements += 1
+            if st.kind == "group":
+                self.rules += 1
+            for key in ("body", "orelse"):
+                children = getattr(st, key, None)
+                if isinstance(children, list):
+                    self.countDropped(children)
+
+    def foldList(self, statements, evaluator, scope, constants, function=False) -> list:
+        """ Folds a given list of statements. """
+
+        result = []
+        folded = []
+        for st in statements:
+            folded = self.foldStatement(st, evaluator, scope, constants)
+            result.extend(folded)
+        # a function returns the value of its last statement, which is null for a dropped branch
+        if function and statements and not folded:
+            result.append(Statement("expr", statements[-1].lineno, expr=("null",)))
+        return result
+
+    def foldStatement(self, st, evaluator, scope, constants) -> list:
+        """ Folds a given statement. Returns the statements replacing it. """
+
+        if st.kind == "if":
+            passed = None
+            if self.isConstant(st.cond, constants):
+                try:
+                    passed = evaluator.eval(st.cond, scope).toBool() != st.negate
+                except Exception:
+                    passed = None
+
+            if passed is None:
+                return [copyStatement(st, body=self.foldList(st.body, evaluator, scope, constants),
+                                      orelse=self.foldList(st.orelse, evaluator, scope, constants)
+                                      if st.orelse is not None else None)]
+
+            self.branches += 1
+            taken = st.body if passed else st.orelse
+            self.countDropped(st.orelse if passed else st.body)
+            if not taken:
+                return []
+            body = self.foldList(taken, evaluator, scope, constants)
+            # a branch holding @media runs within its own scope
+            if any(s.kind == "media" for s in taken):
+                return [copyStatement(st, cond=("bool", True), negate=False, body=body, orelse=None)]
+            return body
+
+        if isinstance(getattr(st, "body", None), list):
+            return [copyStatement(st, body=self.foldList(st.body, evaluator, scope, constants,
+                                                         st.kind == "function"))]
+        return [st]
+
+    def collectNames(self, node, references):
+        """ Collects the identifiers and called names of a given expression tree. """
+
+        kind = node[0]
+        if kind in ("expr", "list"):
+            children = node[1]
+        elif kind in ("paren", "cast"):
+            children = [node[1]]
+        elif kind == "unary":
+            children = [node[2]]
+        elif kind == "binop":
+            children = [node[2], node[3]]
+        elif kind == "ternary":
+            children = node[1:]
+        elif kind == "hash":
+            children = [v for _, v in node[1]]
+        elif kind in ("ident", "call"):
+            references.add(node[1])
+            children = [v for _, v in node[2]] if kind == "call" else []
+        else:
+            children = []
+        for child in children:
+            self.collectNames(child, references)
+
+    def collectReferences(self, statements, references, functions):
+        """ Collects the names the given statements may call. The names called by a function
+        body are collected into functions[name] rather than references. """
+
+        for st in statements:
+            if st.kind == "function":
+                called = functions.setdefault(st.name, set())
+                for _, default in st.params:
+                    if default is not None:
+                        self.collectNames(default, called)
+                self.collectReferences(st.body, called, functions)
+                continue
+            for key, value in st.__dict__.items():
+                if key in ("body", "orelse") and isinstance(value, list):
+                    self.collectReferences(value, references, functions)
+                elif isinstance(value, tuple):
+                    self.collectNames(value, references)
+                elif isinstance(value, str) and key != "kind":
+                    # names, selectors and queries may call functions through interpolation
+                    references.update(word_re.findall(value))
+                elif key == "selectors":
+                    for selector in value:
+                        references.update(word_re.findall(selector))
+
+    def dropMixins(self, statements) -> list:
+        """ Removes the functions no statement calls anymore. """
+
+        references = set()
+        functions = {}
+        self.collectReferences(statements, references, functions)
+
+        # the functions called by the called functions are called as well
+        pending = [name for name in functions if name in references]
+        while pending:
+            for name in functions[pending.pop()]:
+                if name in functions and name not in references:
+                    pending.append(name)
+                references.add(name)
+
+        dropped = set(functions) - references
+        if not dropped:
+            return statements
+        return self.removeFunctions(statements, dropped)
+
+    def removeFunctions(self, statements, names) -> list:
+        result = []
+        for st in statements:
+            if st.kind == "function" and st.name in names:
+                self.mixins += 1
+                self.countDropped(st.body)
+                continue
+            fields = {}
+            for key in ("body", "orelse"):
+                children = getattr(st, key, None)
+                if isinstance(children, list):
+                    fields[key] = self.removeFunctions(children, names)
+            result.append(copyStatement(st, **fields) if fields else st)
+        return result
+
+
+def render(source, compress=False, linenos=False, filename="stdin", cache=None, folder=None) -> str:
+    """ Compiles a given stylus source to CSS.
+
+    Parameters:
+    -----------
+    source : str
+        The stylus source to compile.
+    compress : bool
+        Whether to compress the resulted CSS. (default False)
+    linenos : bool
+        Whether to include the source line of each rule as a comment. (default False)
+    filename : str
+        The name of the source file used by linenos. (default 'stdin')
+    cache : ParseCache
+        A cache to reuse the parsed sections of a previous compile from. optional.
+    folder : ConstantFolder
+        Used to drop the branches that can not run before evaluating. optional.
+
+    Returns:
+    -----------
+    Returns the compiled CSS as str. Raises StylusError if the source cannot be compiled."""
+
+    if cache is not None:
+        statements = cache.parse(source)
+    else:
+        statements = parseStatements(splitSource(source))
+    if folder is not None:
+        statements = folder.fold(statements)
+    items = Evaluator(compress).evaluate(statements)
+    return Renderer(compress, linenos, filename).render(items)
+
+
+def compileFile(in_file, out_file=None, compress=False, linenos=False) -> str:
+    """ Compiles a given stylus file to a CSS file next to it (or to out_file when given).
+
+    Returns:
+    -----------
+    Returns the path of the compiled CSS file."""
+
+    if out_file is None:
+        out_file = in_file[:-5] + ".css" if in_file.endswith(".styl") else in_file + ".css"
+
+    with open(in_file, "r") as read_obj:
+        css = render(read_obj.read(), compress, linenos, in_file)
+
+    with open(out_file, "w") as write_obj:
+        write_obj.write(css)
+
+    return out_file
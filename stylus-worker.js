@@ -0,0 +1,71 @@
+#!/usr/bin/env node
+/*
+ * author      Roy Barina
+ * credits     Idan Haim Shalom
+ * license     MIT
+ * version     1.0.0
+ * maintainer  Roy Barina
+ * contact     https://github.com/Barina
+ *
+ * Persistent stylus worker for compile.py --stylus-worker, see stylusworker.py
+ *
+ * Reads framed requests from stdin and writes framed responses to stdout until stdin ends.
+ * A frame is the byte length of a UTF-8 JSON message, a newline and the message:
+ *
+ *   request  {"id": 1, "source": "...", "filename": "darkmode.styl", "linenos": false, "compress": false}
+ *   response {"id": 1, "css": "..."} or {"id": 1, "error": "..."}
+ */
+
+'use strict';
+
+function loadStylus() {
+    try {
+        return require('stylus');
+    } catch (e) {
+        // the stylus binary is usually installed globally, which require does not search
+        const root = require('child_process').execSync('npm root -g').toString().trim();
+        return require(require('path').join(root, 'stylus'));
+    }
+}
+
+const stylus = loadStylus();
+let buffer = Buffer.alloc(0);
+
+function send(message) {
+    const data = Buffer.from(JSON.stringify(message), 'utf8');
+    process.stdout.write(Buffer.concat([Buffer.from(data.length + '\n', 'ascii'), data]));
+}
+
+function handle(request) {
+    try {
+        stylus(request.source)
+            .set('filename', request.filename || 'darkmode.styl')
+            .set('linenos', !!request.linenos)
+            .set('compress', !!request.compress)
+            .render((err, css) => send(err ? { id: request.id, error: String(err.message || err) } : { id: request.id, css: css }));
+    } catch (err) {
+        send({ id: request.id, error: String(err.message || err) });
+    }
+}
+
+function drain() {
+    for (;;) {
+        const newline = buffer.indexOf(10);
+        if (newline < 0) {
+            return;
+        }
+        const length = parseInt(buffer.toString('ascii', 0, newline), 10);
+        if (buffer.length < newline + 1 + length) {
+            return;
+        }
+        const request = JSON.parse(buffer.toString('utf8', newline + 1, newline + 1 + length));
+        buffer = buffer.subarray(newline + 1 + length);
+        handle(request);
+    }
+}
+
+process.stdin.on('data', (chunk) => {
+    buffer = Buffer.concat([buffer, chunk]);
+    drain();
+});
+// node exits once stdin ended and the responses were written
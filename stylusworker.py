@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Persistent stylus worker for compile.py
+
+Compiles stylus sources with a single long-lived worker process rather than
+running the stylus binary for each compile, so Node and the stylus module
+are loaded once for every build of a watch session or a batch.
+
+The sources are sent in memory over the worker's stdin and the CSS comes
+back over its stdout. Both ways a frame is the byte length of a UTF-8 JSON
+message, a newline and the message:
+
+    request  {"id": 1, "source": "...", "filename": "darkmode.styl", "linenos": false, "compress": false}
+    response {"id": 1, "css": "..."} or {"id": 1, "error": "..."}
+
+Requests are numbered so several can be in flight, the responses may come
+back in any order. When the worker exits, the requests in flight are sent
+again to a new worker, up to a number of restarts.
+
+The default worker is stylus-worker.js, any program speaking the protocol
+can stand in for it, e.g. benchmarks/standin_worker.py. """
+
+
+import os
+import json
+import threading
+import subprocess
+from concurrent.futures import Future
+
+
+worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stylus-worker.js")
+
+
+class WorkerError(Exception):
+    """ Raised when the worker cannot compile a source or cannot be started. """
+
+
+def readFrame(stream):
+    """ Reads a message frame from a given binary stream.
+
+    Returns:
+    -----------
+    Returns the message, None at the end of the stream. Raises ValueError if the frame is malformed."""
+
+    header = stream.readline()
+    if not header:
+        return None
+    length = int(header)
+    data = stream.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data.decode())
+
+
+def writeFrame(stream, message):
+    """ Writes a message frame to a given binary stream, see readFrame. """
+
+    data = json.dumps(message).encode()
+    stream.write(str(len(data)).encode() + b"\n" + data)
+    stream.flush()
+
+
+class StylusWorker:
+    """
+    Used to compile stylus sources with a long-lived worker process.
+
+    Parameters
+    ----------
+    command : list of str
+        The command starting the worker. (default node stylus-worker.js)
+    max_restarts : int
+        The number of times a request is sent again to a new worker after the one compiling it exited. (default 2)
+    """
+
+    def __init__(self, command=None, max_restarts=2):
+        self.command = command or ["node", worker_script]
+        self.max_restarts = max_restarts
+        # guards the state below, never held while writing to the worker so the reader is never blocked
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.process = None
+        # request id -> [future, message, attempts]
+        self.pending = {}
+        self.next_id = 1
+        self.closed = False
+        # the number of worker processes started
+        self.started = 0
+
+    def start(self):
+        """ Starts a new worker process, the lock must be held.
+
+        Returns:
+        -----------
+        Returns the process. Raises WorkerError if it cannot be started."""
+
+        try:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise WorkerError("cannot start the stylus worker '" + " ".join(self.command) + "': " + str(e))
+        self.process = process
+        self.started += 1
+        threading.Thread(target=self.read, args=(process,), daemon=True).start()
+        return process
+
+    def send(self, process, messages):
+        """ Writes given messages to a given worker process. A worker that exited is left to its reader. """
+
+        with self.write_lock:
+            try:
+                for message in messages:
+                    writeFrame(process.stdin, message)
+            except (OSError, ValueError):
+                pass
+
+    def submit(self, source, linenos=False, filename="darkmode.styl", compress=False) -> Future:
+        """ Sends a given stylus source to the worker without waiting for its CSS.
+
+        Returns:
+        -----------
+        Returns a Future of the compiled CSS, raising WorkerError if it could not be compiled.
+        Raises WorkerError if the worker cannot be started."""
+
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise WorkerError("the stylus worker is closed")
+            process = self.process or self.start()
+            message = {"id": self.next_id, "source": source, "filename": filename, "linenos": linenos,
+                       "compress": compress}
+            self.pending[self.next_id] = [future, message, 0]
+            self.next_id += 1
+        self.send(process, [message])
+        return future
+
+    def compile(self, source, linenos=False, filename="darkmode.styl", compress=False, timeout=None) -> str:
+        """ Compiles a given stylus source, see submit.
+
+        Returns:
+        -----------
+        Returns the compiled CSS. Raises WorkerError if it could not be compiled."""
+
+        return self.submit(source, linenos, filename, compress).result(timeout)
+
+    def read(self, process):
+        """ Resolves the requests of the responses of a given worker process until it exits. """
+
+        try:
+            while True:
+                message = readFrame(process.stdout)
+                if message is None:
+                    break
+                with self.lock:
+                    entry = self.pending.pop(message.get("id"), None)
+                if entry is None:
+                    continue
+                if "error" in message:
+                    entry[0].set_exception(WorkerError(message["error"]))
+                else:
+                    entry[0].set_result(message.get("css", ""))
+        except (OSError, ValueError):
+            # a worker writing anything else is as good as dead
+            process.kill()
+        self.exited(process, process.wait())
+
+    def exited(self, process, code):
+        """ Sends the requests in flight to a new worker when a given worker process exited. """
+
+        failed = []
+        resend = []
+        with self.lock:
+            if process is not self.process:
+                return
+            self.process = None
+            for request_id, entry in list(self.pending.items()):
+                entry[2] += 1
+                if self.closed or entry[2] > self.max_restarts:
+                    failed.append(self.pending.pop(request_id)[0])
+                else:
+                    resend.append(entry[1])
+            new_process = None
+            if resend:
+                try:
+                    new_process = self.start()
+                except WorkerError as e:
+                    failed.extend(self.pending.pop(m["id"])[0] for m in resend)
+                    resend = []
+                    code = str(code) + ", " + str(e)
+
+        for future in failed:
+            future.set_exception(WorkerError("the stylus worker exited with code " + str(code)))
+        if resend:
+            self.send(new_process, resend)
+
+    def close(self, timeout=5):
+        """ Stops the worker, the requests still in flight fail. """
+
+        with self.lock:
+            self.closed = True
+            process = self.process
+        if process is None:
+            return
+        with self.write_lock:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
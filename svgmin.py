@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" SVG minifier for compile.py
+
+Minifies the SVG icons of Resources/ and of the compiled CSS: drops the
+editor metadata (Inkscape, Sodipodi, RDF), comments and unused ids, rounds
+numbers to a given precision, compacts path data and collapses groups.
+Also combines icons into a single sprite. """
+
+
+import re
+import xml.etree.ElementTree as ET
+
+import buildcache
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+# the version of the minified SVGs, computed once as every SvgMinifier shares it
+VERSION = buildcache.fileHash(__file__)
+
+# namespaces of editor data the image does not need
+EDITOR_NAMESPACES = (
+    "http://www.inkscape.org/namespaces/inkscape",
+    "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "http://creativecommons.org/ns#",
+    "http://purl.org/dc/elements/1.1/",
+)
+
+# elements whose text is rendered or parsed, their whitespace is kept
+TEXT_ELEMENTS = ("text", "tspan", "textPath", "style", "script", "title", "desc")
+
+# attributes holding a list of numbers
+NUMBER_ATTRIBUTES = ("x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "fx", "fy",
+                     "width", "height", "offset", "opacity", "fill-opacity", "stroke-opacity",
+                     "stroke-width", "stroke-miterlimit", "stroke-dashoffset", "stroke-dasharray",
+                     "points", "transform", "gradientTransform", "patternTransform")
+
+# elements a group's attributes can be moved onto
+SHAPE_ELEMENTS = ("path", "rect", "circle", "ellipse", "line", "polyline", "polygon", "text", "use", "image")
+
+# attributes that can not be moved from a group to its child
+UNMOVABLE_ATTRIBUTES = ("id", "class", "clip-path", "mask", "filter")
+
+# attributes of the root <svg> that only size the document
+SIZE_ATTRIBUTES = ("x", "y", "width", "height", "viewBox", "preserveAspectRatio", "version", "id")
+
+number_re = re.compile(r"(?<![\w#.])[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+path_token_re = re.compile(r"[MmZzLlHhVvCcSsQqTtAa]|[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+reference_re = re.compile(r"url\(\s*['\"]?#([^)'\"\s]+)|^#(.+)$")
+# the id selectors of <style> text, hex colours match as well which only keeps a few more ids
+selector_id_re = re.compile(r"#(-?[A-Za-z_][\w-]*)")
+
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+
+def localName(tag) -> str:
+    """ Gets the name of a given tag or attribute without its namespace. """
+
+    return tag.rsplit("}", 1)[-1]
+
+
+def isEditorData(tag) -> bool:
+    """ Whether a given tag or attribute belongs to an editor namespace. """
+
+    return tag.startswith("{") and tag[1:].split("}", 1)[0] in EDITOR_NAMESPACES
+
+
+def formatNumber(value, precision) -> str:
+    """ Formats a given number with at most precision decimals and no needless zeros (0.50 -> .5). """
+
+    text = ("{:." + str(precision) + "f}").format(value).rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        return "0"
+    if text.startswith("0."):
+        return text[1:]
+    if text.startswith("-0."):
+        return "-" + text[2:]
+    return text
+
+
+def roundNumbers(text, precision) -> str:
+    """ Rounds the numbers of a given attribute value to precision decimals. """
+
+    def replace(m):
+        number = m.group()
+        if "." not in number and "e" not in number.lower():
+            return number
+        return formatNumber(float(number), precision)
+
+    return number_re.sub(replace, text)
+
+
+def minifyPath(d, precision) -> str:
+    """ Compacts the given path data, rounding its numbers to precision decimals.
+
+    Parameters:
+    -----------
+    d : str
+        The path data.
+    precision : int
+        The number of decimals to keep.
+
+    Returns:
+    -----------
+    Returns the compacted path data as str."""
+
+    result = []
+    last = ""
+    for token in path_token_re.findall(d):
+        if token.isalpha():
+            result.append(token)
+            last = token
+            continue
+        number = formatNumber(float(token), precision)
+        # numbers only need a separator when they would read as one
+        if last and not last.isalpha() and not number.startswith("-") and \
+                not (number.startswith(".") and "." in last and "e" not in last):
+            result.append(" ")
+        result.append(number)
+        last = number
+    return "".join(result)
+
+
+def minifyStyle(style, precision) -> str:
+    """ Drops the editor properties and the whitespace of a given style attribute and rounds its numbers. """
+
+    declarations = []
+    for declaration in style.split(";"):
+        prop, _, value = declaration.partition(":")
+        prop = prop.strip()
+        if not prop or prop.startswith("-inkscape"):
+            continue
+        declarations.append(prop + ":" + roundNumbers(value.strip(), precision))
+    return ";".join(declarations)
+
+
+def referencedIds(root) -> set:
+    """ Gets the ids referenced by url(#id) or href="#id" within a given element tree,
+    and by the #id selectors of its <style> elements. """
+
+    ids = set()
+    for element in root.iter():
+        for value in list(element.attrib.values()) + [element.text or ""]:
+            if "#" not in value:
+                continue
+            for m in reference_re.finditer(value):
+                ids.add(m.group(1) or m.group(2))
+        if isinstance(element.tag, str) and localName(element.tag) == "style" and element.text:
+            ids.update(selector_id_re.findall(element.text))
+    return ids
+
+
+def styleProperties(style) -> set:
+    """ Gets the property names of a given style attribute. """
+
+    return set(d.partition(":")[0].strip() for d in style.split(";") if d.strip())
+
+
+def cleanElement(element, precision, ids):
+    """ Minifies the attributes and children of a given element recursively. """
+
+    for name in list(element.attrib):
+        value = element.attrib[name]
+        local = localName(name)
+        if isEditorData(name) or (local == "id" and value not in ids) or \
+                (element.tag == "{" + SVG_NS + "}svg" and name == "version"):
+            del element.attrib[name]
+        elif local == "d":
+            element.attrib[name] = minifyPath(value, precision)
+        elif local == "style":
+            element.attrib[name] = minifyStyle(value, precision)
+            if not element.attrib[name]:
+                del element.attrib[name]
+        elif local in NUMBER_ATTRIBUTES:
+            element.attrib[name] = roundNumbers(value, precision)
+
+    keep_text = localName(element.tag) in TEXT_ELEMENTS
+    if not keep_text and element.text is not None and not element.text.strip():
+        element.text = None
+
+    for child in list(element):
+        if not isinstance(child.tag, str) or isEditorData(child.tag) or localName(child.tag) == "metadata":
+            element.remove(child)
+            continue
+        if not keep_text and child.tail is not None and not child.tail.strip():
+            child.tail = None
+        cleanElement(child, precision, ids)
+
+        # empty containers draw nothing
+        if localName(child.tag) in ("g", "defs") and len(child) == 0 and not child.text:
+            element.remove(child)
+
+
+def collapseGroups(element):
+    """ Unwraps the groups of a given element that have no attributes and merges the attributes of
+    groups holding a single element into that element. """
+
+    for child in list(element):
+        collapseGroups(child)
+        if child.tag != "{" + SVG_NS + "}g" or child.text or child.tail:
+            continue
+
+        if len(child) == 1 and child.attrib and child[0].tag in ["{" + SVG_NS + "}" + t for t in SHAPE_ELEMENTS]:
+            inner = child[0]
+            movable = not any(a in child.attrib or a in inner.attrib for a in UNMOVABLE_ATTRIBUTES)
+            shared = set(child.attrib) & set(inner.attrib) - {"transform"}
+            # the group's style would outrank the element's own presentation attributes
+            shared |= styleProperties(child.attrib.get("style", "")) & set(localName(a) for a in inner.attrib)
+            if movable and not shared and not inner.tail:
+                # the group's transform is applied after the element's own
+                if "transform" in child.attrib and "transform" in inner.attrib:
+                    inner.attrib["transform"] = child.attrib["transform"] + " " + inner.attrib["transform"]
+                    del child.attrib["transform"]
+                inner.attrib.update(child.attrib)
+                child.attrib.clear()
+
+        if not child.attrib:
+            index = list(element).index(child)
+            element.remove(child)
+            for offset, grandchild in enumerate(list(child)):
+                element.insert(index + offset, grandchild)
+
+
+def toBytes(root) -> bytes:
+    """ Serializes a given element tree to UTF-8 bytes without the space ElementTree puts before '/>'. """
+
+    # '>' is escaped within text and attribute values so ' />' can only end a tag
+    return ET.tostring(root, encoding="unicode", short_empty_elements=True).replace(" />", "/>").encode("utf-8")
+
+
+def minifySvg(data, precision=3) -> bytes:
+    """ Minifies a given SVG document.
+
+    Parameters:
+    -----------
+    data : bytes
+        The SVG document.
+    precision : int
+        The number of decimals to round numbers to. default is 3.
+
+    Returns:
+    -----------
+    Returns the minified document as UTF-8 bytes, or data itself if it could not be parsed."""
+
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return data
+    if root.tag != "{" + SVG_NS + "}svg":
+        return data
+
+    cleanElement(root, precision, referencedIds(root))
+    collapseGroups(root)
+    minified = toBytes(root)
+    return minified if len(minified) < len(data) else data
+
+
+def prefixIds(root, prefix):
+    """ Prefixes the ids of a given element tree and the references to them, so trees can be combined. """
+
+    ids = {}
+    for element in root.iter():
+        if "id" in element.attrib:
+            ids[element.attrib["id"]] = prefix + element.attrib["id"]
+            element.attrib["id"] = ids[element.attrib["id"]]
+    if not ids:
+        return
+
+    def replace(m):
+        if m.group(1) is not None:
+            return m.group(0).replace("#" + m.group(1), "#" + ids.get(m.group(1), m.group(1)))
+        return "#" + ids.get(m.group(2), m.group(2))
+
+    for element in root.iter():
+        for name, value in element.attrib.items():
+            if "#" in value:
+                element.attrib[name] = reference_re.sub(replace, value)
+        if element.text and "#" in element.text:
+            element.text = reference_re.sub(replace, element.text)
+
+
+def spriteSvg(icons) -> bytes:
+    """ Combines the given SVG icons into a single sprite.
+
+    The icons are stacked vertically. CSS can show an icon with url(sprite.svg#name), which
+    targets a <view> of it, and HTML can <use> it by its symbol, href="sprite.svg#symbol-name".
+
+    Parameters:
+    -----------
+    icons : dict
+        Icon name -> SVG document as bytes, usually minified.
+
+    Returns:
+    -----------
+    Returns the sprite document as UTF-8 bytes."""
+
+    sprite = ET.Element("{" + SVG_NS + "}svg")
+    defs = ET.SubElement(sprite, "{" + SVG_NS + "}defs")
+    y = 0.0
+    width = 0.0
+    for name, data in icons.items():
+        try:
+            icon = ET.fromstring(data)
+        except ET.ParseError:
+            continue
+        view_box = icon.get("viewBox")
+        if view_box:
+            box = [float(n) for n in number_re.findall(view_box)]
+        else:
+            box = [0.0, 0.0] + [float((number_re.match(icon.get(a, "")) or number_re.match("0")).group())
+                                for a in ("width", "height")]
+        if len(box) != 4 or box[2] <= 0 or box[3] <= 0:
+            continue
+        prefixIds(icon, name + "-")
+
+        # the symbol keeps the presentation attributes of the icon's root
+        symbol = ET.SubElement(defs, "{" + SVG_NS + "}symbol",
+                               {k: v for k, v in icon.attrib.items() if k not in SIZE_ATTRIBUTES})
+        symbol.set("id", "symbol-" + name)
+        symbol.set("viewBox", " ".join(formatNumber(n, 3) for n in box))
+        symbol.extend(list(icon))
+
+        w = formatNumber(box[2], 3)
+        h = formatNumber(box[3], 3)
+        ET.SubElement(sprite, "{" + SVG_NS + "}view", id=name, viewBox="0 " + formatNumber(y, 3) + " " + w + " " + h)
+        ET.SubElement(sprite, "{" + SVG_NS + "}use", {"{" + XLINK_NS + "}href": "#symbol-" + name,
+                                                      "y": formatNumber(y, 3), "width": w, "height": h})
+        y += box[3]
+        width = max(width, box[2])
+
+    sprite.set("viewBox", "0 0 " + formatNumber(width, 3) + " " + formatNumber(y, 3))
+    return toBytes(sprite)
+
+
+class SvgMinifier:
+    """
+    Used to minify SVGs once per content.
+
+    The results are kept in memory and in an optional build cache keyed by the SVG content,
+    the precision and the version of this module, so an unchanged SVG is never minified twice.
+
+    Parameters
+    ----------
+    cache : buildcache.BuildCache
+        The cache to store the minified SVGs in. optional.
+    precision : int
+        The number of decimals to round numbers to. (default 3)
+    """
+
+    def __init__(self, cache=None, precision=3):
+        self.cache = cache
+        self.precision = precision
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        self.version = VERSION
+
+    def minify(self, data) -> bytes:
+        """ Minifies a given SVG document, see minifySvg. """
+
+        key = buildcache.cacheKey(data, "precision=" + str(self.precision), self.version)
+        result = self.results.get(key)
+        if result is None and self.cache is not None:
+            result = self.cache.get(key, binary=True)
+        if result is None:
+            result = minifySvg(data, self.precision)
+            self.misses += 1
+            if self.cache is not None:
+                self.cache.put(key, result)
+        else:
+            self.hits += 1
+        self.results[key] = result
+        return result
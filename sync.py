@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" File sync engine for compile.py
+
+Keeps twin files (Dark-Telegram.user.styl and Dark-Telegram.user.css) in sync.
+Files with the same content hash are left alone, otherwise the one with the
+greater semantic version (or the later modification time) replaces the other.
+Files of the same order are never copied.
+Every write goes through an atomic replace and a single line can be patched
+without rewriting a file that did not change. """
+
+
+import os
+import re
+import shutil
+import tempfile
+
+import buildcache
+
+
+semver_re = re.compile(r"^v?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$")
+
+
+def setTempMode(tmp_file, out_file):
+    """ Gives a temp file the mode of the file it is going to replace, or the default mode
+    of new files if there is none, as temp files are only readable by their owner. """
+
+    if os.path.isfile(out_file):
+        shutil.copymode(out_file, tmp_file)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_file, 0o666 & ~umask)
+
+
+def replaceFile(out_file, write, binary=False, newline=None):
+    """ Writes a file atomically.
+
+    The content is written to a uniquely named temp file next to the target which then
+    replaces the target, so readers never see a partially written file and concurrent
+    builds never clobber each other's temp files.
+
+    Parameters:
+    -----------
+    out_file : str
+        The file to write to.
+    write : callable
+        Gets the open temp file and writes the content to it.
+    binary : bool
+        Whether the temp file is opened in binary mode. default is False.
+    newline : str
+        The newline argument of the temp file in text mode, '' to write the text as is. default is None."""
+
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    fd, tmp_file = tempfile.mkstemp(prefix="." + os.path.basename(out_file) + ".", suffix=".tmp", dir=out_dir)
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w', newline=None if binary else newline) as write_obj:
+            write(write_obj)
+        setTempMode(tmp_file, out_file)
+        os.replace(tmp_file, out_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def sameContent(file1, file2) -> bool:
+    """ Whether two given files have the same content. Files of different sizes are not hashed at all. """
+
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return False
+    return buildcache.fileHash(file1) == buildcache.fileHash(file2)
+
+
+def versionKey(version):
+    """ Gets the sort key of a given semantic version string, e.g. 'v1.10.0-beta.2+build'.
+
+    Missing trailing numbers count as zeros, a pre-release is lower than its release and
+    build metadata is ignored, as semver orders them.
+
+    Returns:
+    -----------
+    Returns a tuple to compare versions by or None if the string is not a version."""
+
+    m = semver_re.match(str(version).strip())
+    if m is None:
+        return None
+
+    numbers = [int(n) for n in m.group(1).split(".")]
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers.pop()
+
+    if m.group(2) is None:
+        # a release is greater than any of its pre-releases
+        return tuple(numbers), (1,)
+    # numeric identifiers are lower than alphanumeric ones
+    identifiers = tuple((0, int(i), "") if i.isdigit() else (1, 0, i) for i in m.group(2).split("."))
+    return tuple(numbers), (0,) + identifiers
+
+
+def compareVersions(v1, v2) -> int:
+    """ Compare two given versions and return which is bigger.
+
+    The versions are semantic version strings or numbers, e.g. modification times.
+    A version that can not be parsed is lower than any version that can.
+
+    Returns 1 when version1 is bigger than version2, -1 when version2 is bigger and 0 when they are equals. """
+
+    if isinstance(v1, (int, float)) and isinstance(v2, (int, float)):
+        k1, k2 = v1, v2
+    else:
+        k1, k2 = versionKey(v1), versionKey(v2)
+        if k1 is None or k2 is None:
+            return (k1 is not None) - (k2 is not None)
+
+    if k1 > k2:
+        return 1
+    if k2 > k1:
+        return -1
+    return 0
+
+
+def patchLine(in_file, marker, make_line) -> bool:
+    """ Replaces the first line of a given file containing a marker.
+
+    Only the lines up to the marker are read when the line does not change, the file is
+    rewritten through an atomic replace otherwise.
+
+    Parameters:
+    -----------
+    in_file : str
+        The file to patch.
+    marker : str
+        The text of the line to replace.
+    make_line : callable
+        Gets the list of lines before the marked line and the marked line, and returns the new line.
+
+    Returns:
+    -----------
+    Returns True if the file was patched False if the line did not change or was not found."""
+
+    head = []
+    with open(in_file, 'r', newline='') as read_obj:
+        for line in read_obj:
+            if marker not in line:
+                head.append(line)
+                continue
+
+            new_line = make_line(head, line)
+            if new_line == line:
+                return False
+
+            def write(write_obj):
+                write_obj.writelines(head)
+                write_obj.write(new_line)
+                shutil.copyfileobj(read_obj, write_obj)
+
+            replaceFile(in_file, write, newline='')
+            return True
+    return False
+
+
+def syncFiles(file1, file2, order1, order2) -> int:
+    """ Syncs two given twin files, the one of the greater order replacing the other.
+
+    Parameters:
+    -----------
+    file1, file2 : str
+        The twin files. Either one may be missing.
+    order1, order2 : str or number
+        The versions or modification times of the files, see compareVersions.
+        Used only when both files exist and have different content.
+
+    Returns:
+    -----------
+    Returns 1 when file1 was copied to file2, -1 when file2 was copied to file1 and 0 when
+    nothing was copied because the files have the same content, the same order or both are missing."""
+
+    exists1 = os.path.isfile(file1)
+    exists2 = os.path.isfile(file2)
+    if exists1 and exists2:
+        if sameContent(file1, file2):
+            return 0
+        direction = compareVersions(order1, order2)
+    else:
+        direction = exists1 - exists2
+
+    if direction > 0:
+        copyFile(file1, file2)
+    elif direction < 0:
+        copyFile(file2, file1)
+    return direction
+
+
+def copyFile(in_file, out_file):
+    """ Copies a file atomically. """
+
+    with open(in_file, 'rb') as read_obj:
+        replaceFile(out_file, lambda write_obj: shutil.copyfileobj(read_obj, write_obj), True)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" Runtime themable CSS for compile.py
+
+Turns the UserStyle variables whose values are written to the CSS as they
+are (colours, lengths, percentages...) into CSS custom properties of a
+:root block, --dt-[variable], so a single compiled file can be rethemed by
+overriding them, e.g. by Franz/Ferdi custom CSS, without compiling again.
+
+A variable is safe at runtime when stylus only copies its value. This is
+found by compiling with each candidate set to two sentinel values, a dark
+and a light colour or a large and a small length: the variable is safe if
+both outputs are the same once its sentinels are replaced by var(), and
+the sentinel is only written within declaration values (not in selectors,
+at-rule preludes such as @media, strings or url()). Variables whose values
+stylus computes with (lighten(), rgba(), arithmetic, conditions...) and the
+checkboxes and selects controlling the branches are resolved at compile
+time as they are now.
+
+The compiles are incremental, only the statements depending on the changed
+variable are evaluated again, see depgraph.IncrementalCompiler. """
+
+
+import re
+import bisect
+
+import stylc
+import depgraph
+
+
+# the prefix of the custom properties, the data URIs use --dt-img-*
+PROPERTY_PREFIX = "--dt-"
+
+# the units of the values that can be custom properties, lengths, percentages, times and angles
+UNITS = ("px", "em", "rem", "%", "vw", "vh", "vmin", "vmax", "ch", "ex", "pt", "cm", "mm", "in",
+         "s", "ms", "deg", "turn")
+
+color_re = re.compile(r"^#(?:[0-9a-fA-F]{3,4}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$")
+dimension_re = re.compile(r"^-?(?:\d+\.?\d*|\.\d+)(" + "|".join(re.escape(u) for u in UNITS) + r")$")
+literal_re = re.compile(r"""/\*.*?\*/|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|url\([^)]*\)""", re.S)
+property_re = re.compile(re.escape(PROPERTY_PREFIX) + r"([\w-]+)\s*:\s*([^;}]*)")
+delimiter_re = re.compile(r"[{};]")
+token_re = re.compile(r"[\w.#%-]")
+
+
+def candidateUnit(v):
+    """ Gets the kind of a given variable if its value could be a custom property.
+
+    Returns:
+    -----------
+    Returns '#' for colours, the unit for dimensions and None for the other variables."""
+
+    value = (v.value or "").strip()
+    if v.type_name == "color" and color_re.match(value):
+        return "#"
+    if v.type_name in ("text", "range", "number"):
+        match = dimension_re.match(value)
+        if match:
+            return match.group(1)
+    return None
+
+
+def sentinels(index, unit):
+    """ Gets the two sentinel values of the candidate of a given index and kind, unlikely to be written by anything else.
+
+    Returns:
+    -----------
+    Returns a (first, second) tuple, a dark and a light colour or a large and a small dimension."""
+
+    if unit == "#":
+        # the pairs are not doubled so the colours can not be shortened (#0d001b, not #001)
+        return "#0d%02x1b" % index, "#f2%02xe5" % index
+    return str(90001 + 17 * index) + unit, str(index + 1) + ".7431" + unit
+
+
+def tokenPositions(css, value) -> list:
+    """ Gets the indexes of a given value in a given CSS, as a whole token (10px but not 110px or 10px-a). """
+
+    positions = []
+    i = css.find(value)
+    while i >= 0:
+        end = i + len(value)
+        if (i == 0 or not token_re.match(css[i - 1])) and (end == len(css) or not token_re.match(css[end])):
+            positions.append(i)
+        i = css.find(value, end)
+    return positions
+
+
+def replaceTokens(css, value, replacement) -> str:
+    """ Replaces a given value of a given CSS, as a whole token, see tokenPositions. """
+
+    parts = []
+    start = 0
+    for i in tokenPositions(css, value):
+        parts.append(css[start:i])
+        parts.append(replacement)
+        start = i + len(value)
+    parts.append(css[start:])
+    return "".join(parts)
+
+
+def literalSpans(css) -> list:
+    """ Gets the (start, end) spans of the comments, strings and url() of a given CSS, in order. """
+
+    return [m.span() for m in literal_re.finditer(css)]
+
+
+def inDeclarationValue(css, i, spans) -> bool:
+    """ Whether a given index of a given CSS is within a declaration value, outside of its comments, strings and url(). """
+
+    k = bisect.bisect_right(spans, (i, len(css))) - 1
+    if k >= 0 and spans[k][0] <= i < spans[k][1]:
+        return False
+    # the text since the start of the statement holds its colon, the statement is not followed by a block
+    start = max(css.rfind("{", 0, i), css.rfind(";", 0, i), css.rfind("}", 0, i)) + 1
+    if ":" not in css[start:i]:
+        return False
+    match = delimiter_re.search(css, i)
+    return match is None or match.group(0) != "{"
+
+
+class Themer:
+    """
+    Used to compile user styles whose variables safe at runtime are CSS custom properties.
+
+    Parameters
+    ----------
+    parse_cache : stylc.ParseCache
+        The cache of the sections parsed by a previous compile. optional.
+    """
+
+    def __init__(self, parse_cache=None):
+        self.compiler = depgraph.IncrementalCompiler(parse_cache=parse_cache)
+        # what the last theme did
+        self.themed = {}
+        self.rejected = {}
+        self.compiles = 0
+        self.matched = True
+
+    def compile(self, head_of, body, values) -> str:
+        self.compiles += 1
+        return self.compiler.compile(head_of(values), body, values)
+
+    def theme(self, variables, body, head_of):
+        """ Compiles a given stylus source with its variables safe at runtime as CSS custom properties.
+
+        Parameters:
+        -----------
+        variables : list of userstyle.Var
+            The UserStyle variables of the source, with their default values.
+        body : str
+            The source following the UserStyle block.
+        head_of : callable
+            Gets the source of the UserStyle block with given variable name -> stylus value dict,
+            see compile.userStyleLines. The values are not checked to fit their variables.
+
+        Returns:
+        -----------
+        Returns the themable CSS, starting with the :root block of the custom properties, or None if filling
+        in their default values does not give the CSS compiled with them. Raises stylc.StylusError if the
+        source cannot be compiled."""
+
+        self.themed = {}
+        self.rejected = {}
+        self.compiles = 0
+        defaults = {v.var_name: v.value for v in variables}
+        default_css = self.compile(head_of, body, defaults)
+
+        candidates = {}
+        for v in variables:
+            unit = candidateUnit(v)
+            if unit is None:
+                continue
+            first, second = sentinels(len(candidates), unit)
+            if first in default_css or second in default_css:
+                self.rejected[v.var_name] = "its sentinel values are used by the CSS"
+                continue
+            candidates[v.var_name] = (first, second)
+
+        values = dict(defaults)
+        values.update((name, pair[0]) for name, pair in candidates.items())
+        css = self.compile(head_of, body, values)
+        spans = literalSpans(css)
+
+        safe = []
+        for name, (first, second) in candidates.items():
+            placeholder = "var(" + PROPERTY_PREFIX + name + ")"
+            found = tokenPositions(css, first)
+            if not found:
+                self.rejected[name] = "its value is not written as it is"
+                continue
+            if not all(inDeclarationValue(css, i, spans) for i in found):
+                self.rejected[name] = "used by a selector, an at-rule prelude, a string or url()"
+                continue
+            changed = self.compile(head_of, body, dict(values, **{name: second}))
+            if replaceTokens(css, first, placeholder) != replaceTokens(changed, second, placeholder):
+                self.rejected[name] = "stylus computes with its value"
+                continue
+            safe.append(name)
+
+        if not safe:
+            self.matched = True
+            return default_css
+
+        # the custom properties hold the default values as stylus writes them
+        root = stylc.render(head_of(defaults) + ":root {\n" +
+                            "".join("  " + PROPERTY_PREFIX + n + ": " + n + "\n" for n in safe) + "}\n")
+        root = root[root.index(":root"):]
+        self.themed = dict(property_re.findall(root))
+
+        values = dict(defaults)
+        values.update((name, candidates[name][0]) for name in safe)
+        themed_css = self.compile(head_of, body, values)
+        for name in safe:
+            themed_css = replaceTokens(themed_css, candidates[name][0], "var(" + PROPERTY_PREFIX + name + ")")
+
+        self.matched = self.fill(themed_css) == default_css
+        if not self.matched:
+            return None
+        return root + themed_css
+
+    def fill(self, css) -> str:
+        """ Replaces the custom properties of the last theme used by a given CSS with their default values. """
+
+        return re.sub(r"var\(" + re.escape(PROPERTY_PREFIX) + r"([\w-]+)\)",
+                      lambda m: self.themed.get(m.group(1), m.group(0)), css)
+
+    def report(self) -> str:
+        """ Gets the report of the variables the last theme turned into custom properties and of the ones it did not. """
+
+        lines = ["Custom properties (" + str(len(self.themed)) + "):"]
+        lines.extend("  " + PROPERTY_PREFIX + name + ": " + value for name, value in self.themed.items())
+        lines.append("")
+        lines.append("Resolved at compile time (" + str(len(self.rejected)) + " candidates):")
+        lines.extend("  " + name + " - " + reason for name, reason in self.rejected.items())
+        if not self.matched:
+            lines.append("")
+            lines.append("The themable CSS with the default values differs from the compiled CSS.")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" UserStyle metadata parser
+
+Parses the ==UserStyle== comment of a user style and the :root block after it
+into typed variables (type, label, default, range bounds and select options)
+in a single pass over the lines, and exports them as JSON so tooling can list
+and validate the options without compiling anything.
+
+Usage:
+    python userstyle.py [user style file] [JSON file]
+Prints the JSON when no JSON file is given. """
+
+
+import re
+import sys
+import json
+
+
+var_re = re.compile(r"""@var\s+(\S+)\s+(\S+)\s+(?:'([^']*)'|"([^"]*)")\s*(.*)$""")
+meta_re = re.compile(r"(@\S+)\s*(.*)$")
+option_re = re.compile(r"""(?:'([^']*)'|"([^"]*)")\s*:\s*('[^']*'|"[^"]*"|[^,\s}]+)""")
+list_item_re = re.compile(r"""'([^']*)'|"([^"]*)"|([^,\s\]]+)""")
+root_var_re = re.compile(r"(?:--)?([\w-]+)\s+(.+?)\s*;?$")
+number_re = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)")
+
+# the types whose value is a [default, min, max, step, unit] list
+RANGE_TYPES = ("range", "number")
+
+
+class Var:
+    """
+    Used to represent a line of a variable
+
+    Parameters
+    ----------
+    type_name : str
+        The name of the variable type. optional.
+    var_name : str
+        Variable name.
+    comment : str
+        This variable comment. optional
+    value : str
+        This variable value as stylus source.
+    label : str
+        The label of a UserStyle variable. optional.
+    min, max, step : int or float
+        The bounds of a range or number variable. optional.
+    unit : str
+        The unit of a range or number variable. optional.
+    options : list of (label, value) tuples
+        The options of a select variable, values without quotes. optional.
+    """
+
+    __slots__ = ("type_name", "var_name", "comment", "value", "label", "min", "max", "step", "unit", "options")
+
+    def __init__(self, type_name=None, var_name=None, value=None, label=None):
+        self.type_name = type_name
+        self.var_name = var_name
+        self.comment = None
+        self.value = value
+        self.label = label
+        self.min = None
+        self.max = None
+        self.step = None
+        self.unit = None
+        self.options = None
+
+    def toString(self, is_meta=False, indent_level=0):
+        """ Generate a string based on current variable.
+        Parameters
+        ----------
+        is_meta : bool
+            Treat this variable as a meta variable and include an assignment operator if not meta. (default False)
+        indent_level : int
+            The level of indentation for this variable.
+        """
+
+        # built the resulting string
+        s = ""
+        if self.var_name is not None:
+            s += self.var_name
+            if self.value is not None:
+                if not is_meta:
+                    s += " ="
+                s += " " + self.value
+                if self.comment is not None:
+                    s += " // " + self.comment
+                    if self.type_name is not None:
+                        s += " (" + self.type_name + ")"
+            else:
+                print("Empty value in " + self.var_name)
+
+        # build indentation
+        indent = ""
+        if s != "":
+            for i in range(indent_level):
+                indent += "    "
+
+        return indent + s + "\n"
+
+    def default(self):
+        """ Gets the default value of this variable as a JSON value (bool for checkboxes, numbers for
+        ranges and numbers, the unquoted option value for selects and str otherwise). """
+
+        if self.type_name == "checkbox":
+            return self.value.strip() not in ("0", "")
+        if self.type_name in RANGE_TYPES:
+            return parseNumber(self.value[:len(self.value) - len(self.unit or "")])
+        if self.type_name == "select":
+            return unquote(self.value)
+        return self.value
+
+    def toDict(self) -> dict:
+        """ Gets the JSON representation of this variable. """
+
+        d = {"name": self.var_name, "type": self.type_name, "label": self.label, "default": self.default()}
+        for key in ("min", "max", "step", "unit"):
+            if getattr(self, key) is not None:
+                d[key] = getattr(self, key)
+        if self.options is not None:
+            d["options"] = [{"label": label, "value": value} for label, value in self.options]
+        return d
+
+    def checkValue(self, value):
+        """ Checks whether a given stylus value is valid for this variable.
+
+        Returns:
+        -----------
+        Returns None if the value is valid or a message saying why it is not."""
+
+        if self.type_name == "select":
+            if self.options and unquote(value) not in [v for _, v in self.options]:
+                return "'" + value + "' is not one of " + ", ".join(v for _, v in self.options)
+        elif self.type_name == "checkbox":
+            if value.strip() not in ("0", "1"):
+                return "'" + value + "' is not 0 or 1"
+        elif self.type_name in RANGE_TYPES:
+            if self.unit and value.endswith(self.unit):
+                value = value[:-len(self.unit)]
+            number = parseNumber(value.strip())
+            if number is None:
+                return "'" + value + "' is not a number"
+            if self.min is not None and number < self.min:
+                return str(number) + " is below the minimum of " + str(self.min)
+            if self.max is not None and number > self.max:
+                return str(number) + " is above the maximum of " + str(self.max)
+        return None
+
+
+class UserStyle:
+    """
+    Used to represent the parsed metadata of a user style.
+
+    Parameters
+    ----------
+    header : str
+        The line opening the UserStyle comment.
+    footer : str
+        The line closing the UserStyle comment.
+    meta : list of Var
+        The meta variables (@name, @version...), names include the '@'.
+    vars : list of Var
+        The @var variables. Holds None for each blank line when blank lines are kept.
+    root : list of Var
+        The variables of the :root block after the UserStyle comment, names without the '--'.
+    """
+
+    __slots__ = ("header", "footer", "meta", "vars", "root")
+
+    def __init__(self):
+        self.header = None
+        self.footer = None
+        self.meta = []
+        self.vars = []
+        self.root = []
+
+    def toDict(self) -> dict:
+        """ Gets the JSON representation of this user style. """
+
+        return {
+            "meta": {m.var_name[1:]: m.value for m in self.meta},
+            "vars": [v.toDict() for v in self.vars if v is not None],
+        }
+
+    def toJson(self, indent=4) -> str:
+        """ Gets this user style as JSON text. """
+
+        return json.dumps(self.toDict(), indent=indent, ensure_ascii=False)
+
+
+def parseNumber(text):
+    """ Parses a given number literal to int or float, None if it is not a number. """
+
+    text = text.strip()
+    if number_re.fullmatch(text) is None:
+        return None
+    if "." in text:
+        return float(text)
+    return int(text)
+
+
+def unquote(text) -> str:
+    """ Removes the quotes around a given str if it has any. """
+
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    return text
+
+
+def parseRange(v, text):
+    """ Sets the value and bounds of a given range or number variable from its [default, min, max, step, unit] text. """
+
+    items = [a or b or c for a, b, c in list_item_re.findall(text.strip().lstrip("[").split("]", 1)[0])]
+    numbers = items[:4]
+    v.unit = items[4] if len(items) > 4 else None
+
+    # the unit may follow the numbers directly when there is no step
+    if numbers and parseNumber(numbers[-1]) is None:
+        v.unit = numbers.pop()
+    if not numbers:
+        v.value = text.strip()
+        return
+
+    v.value = numbers[0] + (v.unit or "")
+    bounds = [parseNumber(n) for n in numbers[1:]] + [None, None, None]
+    v.min, v.max, v.step = bounds[:3]
+
+
+def parseSelect(v, text):
+    """ Sets the options and default value of a given select variable from the text of its options.
+
+    The options are either a {'label': value} map or a ['value'] list, the default one is marked by a '*'."""
+
+    options = []
+    default = None
+    if text.lstrip().startswith("["):
+        items = [(a or b or c, "'" if a else '"' if b else "") for a, b, c in list_item_re.findall(text.strip()[1:])]
+        for item, quote in items:
+            label = item.rstrip()
+            is_default = label.endswith("*")
+            label = label.rstrip("*").rstrip()
+            options.append((label, label, quote + label + quote))
+            if is_default and default is None:
+                default = options[-1]
+    else:
+        for m in option_re.finditer(text):
+            label = (m.group(1) if m.group(1) is not None else m.group(2)).strip()
+            is_default = label.endswith("*")
+            label = label.rstrip("*").rstrip()
+            options.append((label, unquote(m.group(3)), m.group(3)))
+            if is_default and default is None:
+                default = options[-1]
+
+    v.options = [(label, value) for label, value, _ in options]
+    if default is None and options:
+        default = options[0]
+    v.value = default[2] if default is not None else ""
+
+
+def parseUserStyle(lines, keep_blank_lines=False) -> UserStyle:
+    """ Parses the UserStyle comment and the following :root block of the given lines in a single pass.
+
+    Stops consuming lines right after the :root block.
+
+    Parameters:
+    -----------
+    lines : iterable of str
+        The lines of the user style. Can be a generator.
+    keep_blank_lines : bool
+        Whether to add None to the variables for each blank line of the UserStyle comment. default is False.
+
+    Returns:
+    -----------
+    Returns the UserStyle."""
+
+    style = UserStyle()
+    within_user_style = False
+    within_root = False
+    select = None       # the select variable being read
+    select_text = []    # the lines of its options
+
+    for line in lines:
+        if within_user_style:
+            if "*/" in line and "/UserStyle" in line:
+                style.footer = line.strip()
+                within_user_style = False
+            elif select is not None:
+                select_text.append(line)
+                if "}" in line:
+                    parseSelect(select, "".join(select_text))
+                    style.vars.append(select)
+                    select = None
+            else:
+                stripped = line.strip()
+                if stripped.startswith("@var"):
+                    m = var_re.match(stripped)
+                    if m is None:
+                        continue
+                    type_name, name, label, value = m.group(1), m.group(2), m.group(3), m.group(5)
+                    v = Var(type_name, name, value.strip(), label if label is not None else m.group(4))
+                    if type_name in RANGE_TYPES:
+                        parseRange(v, value)
+                    elif type_name == "select":
+                        # the options are either in a {} block, which may span several lines, or a [] list
+                        if value.lstrip().startswith("{") and "}" not in value:
+                            select = v
+                            select_text = [value]
+                            continue
+                        parseSelect(v, value)
+                    style.vars.append(v)
+                elif stripped.startswith("@"):
+                    m = meta_re.match(stripped)
+                    style.meta.append(Var(None, m.group(1), m.group(2).strip()))
+                elif not stripped and keep_blank_lines:
+                    style.vars.append(None)
+
+        elif within_root:
+            stripped = line.strip()
+            if "}" in stripped:
+                # this is the last block we need so we do not read the rest of the lines
+                break
+            if stripped and not stripped.startswith(("/*", "//", "*")):
+                m = root_var_re.match(stripped)
+                if m is not None:
+                    style.root.append(Var(None, m.group(1), m.group(2)))
+
+        elif "/*" in line and "UserStyle" in line:
+            style.header = line.strip()
+            within_user_style = True
+
+        elif ":root" in line and "{" in line:
+            within_root = True
+
+    return style
+
+
+def parseFile(in_file, keep_blank_lines=False) -> UserStyle:
+    """ Parses the UserStyle metadata of a given file, see parseUserStyle. """
+
+    with open(in_file, 'r') as read_obj:
+        return parseUserStyle(read_obj, keep_blank_lines)
+
+
+if __name__ == "__main__":
+    in_file = sys.argv[1] if len(sys.argv) > 1 else "Dark-Telegram.user.styl"
+    out_json = parseFile(in_file).toJson()
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as write_obj:
+            write_obj.write(out_json + "\n")
+    else:
+        print(out_json)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+author      Roy Barina
+credits     Idan Haim Shalom
+license     MIT
+version     1.0.0
+maintainer  Roy Barina
+contact     https://github.com/Barina
+"""
+
+""" File watcher for compile.py
+
+Watches files and directories for changes using inotify on Linux
+and falls back to polling modification times everywhere else. """
+
+
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+
+
+# inotify event masks, taken from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def watchedFiles(paths) -> dict:
+    """ Maps each watched file name to its directory.
+
+    Parameters:
+    -----------
+    paths : list of str
+        Files and directories to watch. A directory watches the files directly within it.
+
+    Returns:
+    -----------
+    Returns a dict of directory -> set of file names (None when the whole directory is watched)."""
+
+    dirs = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            dirs[path] = None
+        else:
+            d, name = os.path.split(path)
+            if d not in dirs:
+                dirs[d] = set()
+            if dirs[d] is not None:
+                dirs[d].add(name)
+    return dirs
+
+
+class PollingWatcher:
+    """
+    Used to watch files by polling their modification time and size.
+
+    Parameters
+    ----------
+    paths : list of str
+        Files and directories to watch.
+    interval : float
+        Seconds between polls. (default 0.25)
+    """
+
+    def __init__(self, paths, interval=0.25):
+        self.dirs = watchedFiles(paths)
+        self.interval = interval
+        self.state = self.snapshot()
+
+    def snapshot(self) -> dict:
+        """ Gets the modification time and size of every watched file. """
+
+        state = {}
+        for d, names in self.dirs.items():
+            if names is None:
+                try:
+                    names = [e.name for e in os.scandir(d) if e.is_file()]
+                except OSError:
+                    names = []
+            for name in names:
+                path = os.path.join(d, name)
+                try:
+                    st = os.stat(path)
+                    state[path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    state[path] = None
+        return state
+
+    def wait(self, timeout=None) -> list:
+        """ Blocks until a watched file changes or timeout seconds pass.
+
+        Returns:
+        -----------
+        Returns a sorted list of the changed paths. Empty on timeout."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.snapshot()
+            changed = sorted(p for p in set(state) | set(self.state) if state.get(p) != self.state.get(p))
+            self.state = state
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Used to watch files using Linux inotify.
+
+    The directories of the watched files are watched rather than the files themselves
+    so files replaced by editors (write to temp and rename) keep being watched.
+
+    Parameters
+    ----------
+    paths : list of str
+        Files and directories to watch.
+    debounce : float
+        Seconds to wait for more events after the first one so a burst of writes is reported once. (default 0.05)
+    """
+
+    def __init__(self, paths, debounce=0.05):
+        self.libc = loadLibc()
+        if self.libc is None:
+            raise OSError("inotify is not available")
+        self.debounce = debounce
+        self.dirs = watchedFiles(paths)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds = {}
+        for d in self.dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), WATCH_MASK)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), "cannot watch '" + d + "'")
+            self.wds[wd] = d
+
+    def readEvents(self) -> set:
+        """ Reads the pending events and gets the watched paths they refer to. """
+
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        i = 0
+        while i + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, i)
+            i += EVENT_HEADER.size
+            name = os.fsdecode(data[i:i + length].rstrip(b"\0"))
+            i += length
+            d = self.wds.get(wd)
+            if d is None or not name:
+                continue
+            names = self.dirs[d]
+            if names is None or name in names:
+                changed.add(os.path.join(d, name))
+        return changed
+
+    def wait(self, timeout=None) -> list:
+        """ Blocks until a watched file changes or timeout seconds pass.
+
+        Returns:
+        -----------
+        Returns a sorted list of the changed paths. Empty on timeout."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not select.select([self.fd], [], [], remaining)[0]:
+                return []
+            changed |= self.readEvents()
+
+        # collecting the rest of the burst
+        while select.select([self.fd], [], [], self.debounce)[0]:
+            changed |= self.readEvents()
+        return sorted(changed)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def loadLibc():
+    """ Loads libc if it provides inotify, returns None otherwise. """
+
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def createWatcher(paths, polling=False):
+    """ Creates the best available watcher for the given paths.
+
+    Parameters:
+    -----------
+    paths : list of str
+        Files and directories to watch.
+    polling : bool
+        Whether to use polling even when inotify is available. default is False.
+
+    Returns:
+    -----------
+    Returns an InotifyWatcher when possible, PollingWatcher otherwise."""
+
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except OSError:
+            pass
+    return PollingWatcher(paths)